@@ -1,21 +1,26 @@
 from rest_framework import serializers
 from Core.models import User, SellerProfile,Category
 from django.db import transaction
+from Core.authentication import forget_user_state
+from Core.fieldsets import SparseFieldsetMixin
 
-class SellerProfileSerializer(serializers.ModelSerializer):
+# Most users one bulk update may change
+BULK_UPDATE_LIMIT = 1000
+
+class SellerProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = SellerProfile
         fields = ['shop_name', 'contact_number', 'address']
         read_only_fields = ['created_at', 'updated_at']
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     shop_name = serializers.CharField(source='seller_profile.shop_name', read_only=True, allow_null=True)
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'role', 'shop_name']
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     seller_profile = SellerProfileSerializer(read_only=True)
 
     class Meta:
@@ -81,7 +86,44 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class UserBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=BULK_UPDATE_LIMIT)
+    is_active = serializers.BooleanField(required=False)
+    # Sellers need a profile each, so making someone a seller goes through the single-user update
+    role = serializers.ChoiceField(choices=['customer', 'admin'], required=False)
+
+    def validate_ids(self, value):
+        ids = sorted(set(value))
+        missing = set(ids) - set(User.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(f"Users not found: {', '.join(map(str, sorted(missing)))}.")
+        return ids
+
+    def validate(self, attrs):
+        if 'is_active' not in attrs and 'role' not in attrs:
+            raise serializers.ValidationError("Send is_active or role to change.")
+        if self.context['request'].user.pk in attrs['ids'] and (attrs.get('is_active') is False or 'role' in attrs):
+            raise serializers.ValidationError("You cannot deactivate or demote yourself.")
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        ids = validated_data['ids']
+        fields = {}
+        if 'is_active' in validated_data:
+            fields['is_active'] = validated_data['is_active']
+        if 'role' in validated_data:
+            # update() skips User.save(), which keeps is_staff in step with the role
+            fields['role'] = validated_data['role']
+            fields['is_staff'] = validated_data['role'] == 'admin'
+            SellerProfile.objects.filter(user_id__in=ids).delete()
+        updated = User.objects.filter(pk__in=ids).update(**fields)
+        # update() sends no post_save either, so clear the cached auth state the signal would have
+        transaction.on_commit(lambda: forget_user_state(*ids))
+        return updated
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'created_at', 'updated_at']
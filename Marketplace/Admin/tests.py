@@ -1,3 +1,61 @@
-from django.test import TestCase
+from Core.authentication import user_state
+from Core.models import SellerProfile, User
+from Core.testing import QueryBudgetTestCase
 
-# Create your tests here.
+
+class AdminEndpointBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.admin = self.data['admin']
+        self.seller = self.data['sellers'][0]
+        self.customer = self.data['customers'][0]
+
+    def test_user_list(self):
+        self.assertQueryBudget(1, '/api/admin/users/?page_size=2', '/api/admin/users/?page_size=100', user=self.admin)
+
+    def test_user_list_filters(self):
+        self.assertQueryBudget(1, '/api/admin/users/?role=seller&page_size=2', '/api/admin/users/?email__startswith=seed',
+                               f'/api/admin/users/?email={self.seller.email}', user=self.admin)
+        response = self.request('get', '/api/admin/users/?role=seller', self.admin)
+        self.assertEqual({row['role'] for row in response.json()['results']}, {'seller'})
+        self.assertTrue(all(row['shop_name'] for row in response.json()['results']))
+
+    def test_user_detail(self):
+        self.assertQueryBudget(1, f'/api/admin/users/{self.seller.pk}/', f'/api/admin/users/{self.customer.pk}/',
+                               user=self.admin)
+
+    def test_user_update(self):
+        self.assertRequestBudget(10, 'patch', [
+            (f'/api/admin/users/{self.seller.pk}/update/',
+             {'email': 'renamed_seller@example.com', 'seller_profile': {'shop_name': 'Renamed shop'}}),
+        ], user=self.admin)
+
+    def test_user_bulk_update_whatever_the_number_of_users(self):
+        customers = list(self.data['customers'].values_list('pk', flat=True))
+        self.assertRequestBudget(4, 'patch', [
+            ('/api/admin/users/bulk-update/', {'ids': customers[:2], 'is_active': False}),
+            ('/api/admin/users/bulk-update/', {'ids': customers, 'is_active': False}),
+        ], user=self.admin)
+
+    def test_user_bulk_update(self):
+        sellers = list(self.data['sellers'][:2])
+        response = self.request('patch', '/api/admin/users/bulk-update/', self.admin,
+                                {'ids': [seller.pk for seller in sellers], 'role': 'admin'})
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(set(User.objects.filter(pk__in=[seller.pk for seller in sellers]).values_list('role', 'is_staff')),
+                         {('admin', True)})
+        self.assertFalse(SellerProfile.objects.filter(user__in=sellers).exists())
+        # Deactivation reaches the cached state tokens are checked against
+        self.assertTrue(user_state(self.customer.pk)['is_active'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.request('patch', '/api/admin/users/bulk-update/', self.admin, {'ids': [self.customer.pk], 'is_active': False})
+        self.assertFalse(user_state(self.customer.pk)['is_active'])
+        for data in ({'ids': [self.customer.pk]}, {'ids': [self.customer.pk, 0], 'is_active': False},
+                     {'ids': [self.admin.pk], 'is_active': False}, {'ids': [self.customer.pk], 'role': 'seller'}):
+            self.assertEqual(self.request('patch', '/api/admin/users/bulk-update/', self.admin, data).status_code, 400)
+
+    def test_category_list(self):
+        self.assertQueryBudget(1, '/api/admin/categories/?page_size=2', '/api/admin/categories/?page_size=100')
+
+    def test_category_create(self):
+        self.assertRequestBudget(3, 'post', [('/api/admin/categories/', {'name': 'Budget category'})],
+                                 user=self.admin, status=201)
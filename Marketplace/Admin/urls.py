@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import UserListView, UserDetailView, UserUpdateView,CategoryListCreateView
+from .views import UserListView, UserDetailView, UserUpdateView, UserBulkUpdateView, CategoryListCreateView
 
 app_name = 'Admin'
 
@@ -7,6 +7,7 @@ urlpatterns = [
     path('users/', UserListView.as_view(), name='user_list'),
     path('users/<int:pk>/', UserDetailView.as_view(), name='user_detail'),
     path('users/<int:pk>/update/', UserUpdateView.as_view(), name='user_update'),
+    path('users/bulk-update/', UserBulkUpdateView.as_view(), name='user_bulk_update'),
 
      path('categories/', CategoryListCreateView.as_view(), name='category-list-create'),
 ]
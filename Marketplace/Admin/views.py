@@ -2,22 +2,23 @@ from rest_framework import generics
 from rest_framework.permissions import AllowAny ,IsAuthenticated
 from Core.permissions import IsAdmin
 from Core.models import User, Category
-from .serializers import UserListSerializer, UserDetailSerializer, UserUpdateSerializer, CategorySerializer
-from rest_framework.pagination import PageNumberPagination
-
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-class UserListView(generics.ListAPIView):
-    queryset = User.objects.all().order_by('id')
+from rest_framework.response import Response
+from .serializers import (
+    UserListSerializer, UserDetailSerializer, UserUpdateSerializer, UserBulkUpdateSerializer, CategorySerializer,
+)
+from Core.pagination import KeysetPagination
+from Core.fieldsets import SparseFieldsetViewMixin
+
+class UserListView(SparseFieldsetViewMixin, generics.ListAPIView):
+    queryset = User.objects.select_related('seller_profile').order_by('id')
     serializer_class = UserListSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
+    # Only lookups the role and email indexes can serve: exact matches and email prefixes
+    filterset_fields = {'role': ['exact'], 'email': ['exact', 'startswith']}
 
-class UserDetailView(generics.RetrieveAPIView):
-    queryset = User.objects.all()
+class UserDetailView(SparseFieldsetViewMixin, generics.RetrieveAPIView):
+    queryset = User.objects.select_related('seller_profile')
     serializer_class = UserDetailSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
 
@@ -26,13 +27,22 @@ class UserUpdateView(generics.UpdateAPIView):
     serializer_class = UserUpdateSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
 
+class UserBulkUpdateView(generics.GenericAPIView):
+    serializer_class = UserBulkUpdateSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def patch(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'updated': serializer.save()})
+
 
 
 
-class CategoryListCreateView(generics.ListCreateAPIView):
+class CategoryListCreateView(SparseFieldsetViewMixin, generics.ListCreateAPIView):
     queryset = Category.objects.all().order_by('name')
     serializer_class = CategorySerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
 
     def get_permissions(self):
         if self.request.method == 'POST':
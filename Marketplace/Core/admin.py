@@ -1,16 +1,50 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.utils import timezone
+from django.utils.functional import cached_property
 from .models import User, SellerProfile, Category, Product, Order, OrderItem, InventoryLog, Review
+from .pagination import estimate_count
+from .search import search_products
+
+
+class EstimatedCountPaginator(Paginator):
+    # Exact on small result sets; on big ones the planner's estimate instead of a COUNT(*) over every row
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables that grow with traffic: estimated counts,
+    no second count of the unfiltered table, and newest rows first by primary
+    key. Search fields are ^ prefixes so they can use an index.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-pk']
+
+
+class ProductFieldAdmin(LargeTableAdmin):
+    # Rows of deleted products are kept until the purge, and must still save with their product
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product':
+            kwargs['queryset'] = Product.all_objects.all()
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     list_display = ['username', 'email', 'role', 'is_staff']
     list_filter = ['role', 'is_staff']
-    search_fields = ['username', 'email']
+    search_fields = ['^username', '^email']
 
 @admin.register(SellerProfile)
-class SellerProfileAdmin(admin.ModelAdmin):
+class SellerProfileAdmin(LargeTableAdmin):
     list_display = ['shop_name', 'user', 'contact_number']
-    search_fields = ['shop_name', 'user__username']
+    list_select_related = ['user']
+    search_fields = ['^shop_name', '^user__username']
+    autocomplete_fields = ['user']
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -19,32 +53,76 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ['name']
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'seller', 'price', 'stock_quantity']
-    list_filter = ['category', 'seller']
-    search_fields = ['name', 'description']
+class ProductAdmin(LargeTableAdmin):
+    list_display = ['name', 'category', 'seller', 'price', 'stock_quantity', 'is_deleted']
+    list_select_related = ['category', 'seller']
+    # A seller filter would list every seller in the sidebar; filter by seller with ?seller__id__exact= instead
+    list_filter = ['category', 'is_deleted']
+    search_fields = ['^name']
+    autocomplete_fields = ['category', 'seller']
+    readonly_fields = ['deleted_at']
+    actions = ['restore']
+
+    def get_queryset(self, request):
+        # Deleted products too, so they can be found and restored until purge_deleted_products removes them
+        queryset = Product.all_objects.all()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def save_model(self, request, obj, form, change):
+        # Keep deleted_at in step with the checkbox, as Product.soft_delete does
+        if 'is_deleted' in form.changed_data:
+            obj.deleted_at = timezone.now() if obj.is_deleted else None
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description="Restore selected deleted products")
+    def restore(self, request, queryset):
+        # One save each, so the catalog cache, facets and search index hear of it
+        for product in queryset.filter(is_deleted=True):
+            product.is_deleted, product.deleted_at = False, None
+            product.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+
+    def get_search_results(self, request, queryset, search_term):
+        # Words of the name and description through the search index, as the catalog search does
+        matches = search_products(search_term, queryset)
+        if matches is None:
+            return queryset, False
+        return matches, False
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(ProductFieldAdmin):
     list_display = ['product', 'customer', 'rating', 'created_at']
+    list_select_related = ['product__category', 'customer']
     list_filter = ['rating']
-    search_fields = ['product__name', 'customer__username']
+    search_fields = ['^product__name', '^customer__username']
+    autocomplete_fields = ['product', 'customer']
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['customer', 'order_date', 'status', 'is_paid']
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'customer', 'order_date', 'status', 'is_paid']
+    list_select_related = ['customer']
     list_filter = ['status', 'is_paid']
-    search_fields = ['customer__username']
+    search_fields = ['^customer__username']
+    autocomplete_fields = ['customer']
+    date_hierarchy = 'order_date'
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ['order', 'product', 'quantity', 'price']
-    search_fields = ['order__customer__username', 'product__name']
+class OrderItemAdmin(ProductFieldAdmin):
+    list_display = ['order', 'product', 'quantity', 'price', 'status']
+    list_select_related = ['order', 'product__category']
+    search_fields = ['^order__customer__username', '^product__name']
+    raw_id_fields = ['order']
+    autocomplete_fields = ['product']
 
 @admin.register(InventoryLog)
-class InventoryLogAdmin(admin.ModelAdmin):
+class InventoryLogAdmin(ProductFieldAdmin):
     list_display = ['product', 'quantity_change', 'reason', 'created_at']
+    list_select_related = ['product__category']
     list_filter = ['reason']
-    search_fields = ['product__name']
\ No newline at end of file
+    search_fields = ['^product__name']
+    autocomplete_fields = ['product']
+    date_hierarchy = 'created_at'
@@ -0,0 +1,186 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import Category, Order, OrderEvent, OrderItem, Product, SalesRollup
+
+INTERVALS = {'day': F('day'), 'week': TruncWeek('day'), 'month': TruncMonth('day')}
+DIMENSIONS = [dimension for dimension, _ in SalesRollup.DIMENSION_CHOICES]
+# Rollup rows locked per query; keeps the OR of their keys within SQLite's expression depth limit
+LOCK_CHUNK = 200
+
+
+def counts_as_sale(order, item):
+    return order.status != 'cancelled' and item.status != 'cancelled'
+
+
+def _rollup_keys(item):
+    order, product = item.order, item.product
+    day = timezone.localdate(order.order_date)
+    for dimension, key in (('total', 0), ('category', product.category_id), ('product', product.pk)):
+        yield product.seller_id, dimension, key, day
+
+
+def _deltas(items, sign, kept=()):
+    # {(seller_id, dimension, key, day): [revenue, units, order ids]}
+    deltas = defaultdict(lambda: [Decimal(0), 0, set()])
+    for item in items:
+        for rollup in _rollup_keys(item):
+            delta = deltas[rollup]
+            delta[0] += sign * item.price * item.quantity
+            delta[1] += sign * item.quantity
+            delta[2].add(item.order_id)
+    # An order still has a sale in the rows its kept items fall in
+    for item in kept:
+        for rollup in _rollup_keys(item):
+            if rollup in deltas:
+                deltas[rollup][2].discard(item.order_id)
+    return deltas
+
+
+# No savepoint: callers inside a transaction roll back as a whole anyway
+@transaction.atomic(savepoint=False)
+def record_sales(items, sign=1, kept=()):
+    """
+    Add ``items`` (order items with their order and product loaded) to the
+    sales rollups, or take them away again with ``sign=-1``. An order's
+    items must all be recorded in the same call, except that ``kept`` may
+    list the items of the same orders that stay recorded, so the orders
+    keep counting where those items do. Runs in three queries for up to
+    LOCK_CHUNK rollup rows, however many items there are.
+    """
+    deltas = _deltas(items, sign, kept)
+    if not deltas:
+        return
+    keys = sorted(deltas)
+    # Create the missing rows empty so every row can then be locked and updated in one pass
+    SalesRollup.objects.bulk_create(
+        [SalesRollup(seller_id=seller_id, dimension=dimension, key=key, day=day) for seller_id, dimension, key, day in keys],
+        ignore_conflicts=True,
+    )
+    rows = []
+    for start in range(0, len(keys), LOCK_CHUNK):
+        rows += SalesRollup.objects.select_for_update().filter(reduce(or_, (
+            Q(seller_id=seller_id, dimension=dimension, key=key, day=day)
+            for seller_id, dimension, key, day in keys[start:start + LOCK_CHUNK]
+        ))).order_by('pk')
+    for row in rows:
+        revenue, units, orders = deltas[row.seller_id, row.dimension, row.key, row.day]
+        row.revenue += revenue
+        row.units += units
+        row.orders += sign * len(orders)
+    SalesRollup.objects.bulk_update(rows, ['revenue', 'units', 'orders'])
+
+
+def order_status_changed(order, previous_status):
+    """Take a newly cancelled order out of the rollups, or put a reinstated one back."""
+    was_counted, is_counted = previous_status != 'cancelled', order.status != 'cancelled'
+    if was_counted == is_counted:
+        return
+    items = [item for item in order.items.select_related('product') if item.status != 'cancelled']
+    record_sales(items, 1 if is_counted else -1)
+
+
+def items_cancelled(items):
+    """
+    Take newly cancelled ``items`` (with their order and product loaded) out
+    of the rollups. Items of cancelled orders were taken out with their
+    order already.
+    """
+    items = [item for item in items if item.order.status != 'cancelled']
+    if not items:
+        return
+    kept = (
+        OrderItem.objects.filter(order_id__in={item.order_id for item in items})
+        .exclude(status='cancelled').exclude(pk__in=[item.pk for item in items])
+        .select_related('order', 'product')
+    )
+    record_sales(items, -1, kept)
+
+
+def sales_summary(seller=None, dimension='total', interval=None, start_date=None, end_date=None):
+    """
+    Revenue, units and orders of ``seller`` (every seller when None) grouped
+    by ``interval`` (day, week, month or None for the whole range) and by
+    category or product. Read from the rollups, so the cost depends on the
+    days and products reported rather than on the number of sales. Across
+    sellers, an order with several sellers' items counts once for each.
+    """
+    rows = SalesRollup.objects.filter(dimension=dimension)
+    if seller is not None:
+        rows = rows.filter(seller=seller)
+    if start_date:
+        rows = rows.filter(day__gte=start_date)
+    if end_date:
+        rows = rows.filter(day__lte=end_date)
+    groups = ['key']
+    if interval:
+        rows = rows.annotate(period=INTERVALS[interval])
+        groups.insert(0, 'period')
+    rows = list(
+        rows.values(*groups)
+        .annotate(total_revenue=Sum('revenue'), total_units=Sum('units'), total_orders=Sum('orders'))
+        .filter(total_units__gt=0)
+        .order_by(*groups[:-1], '-total_revenue', 'key')
+    )
+
+    names = {}
+    keys = {row['key'] for row in rows}
+    if dimension == 'category':
+        names = dict(Category.objects.filter(pk__in=keys).values_list('pk', 'name'))
+    elif dimension == 'product':
+        # Soft-deleted products keep their names until purged
+        names = dict(Product.all_objects.filter(pk__in=keys).values_list('pk', 'name'))
+    return [
+        {
+            'period': row.get('period'),
+            'id': row['key'] if dimension != 'total' else None,
+            'name': names.get(row['key']),
+            'revenue': row['total_revenue'],
+            'units': row['total_units'],
+            'orders': row['total_orders'],
+        }
+        for row in rows
+    ]
+
+
+@transaction.atomic
+def rebuild_sales(batch_size=1000, progress=None):
+    """
+    Recount the rollups from every order item, e.g. after orders were edited
+    outside the API. Orders whose placed event the order worker has not
+    handled yet are left for it to add, less what it should not count.
+    """
+    SalesRollup.objects.all().delete()
+    last_pk = 0
+    counted = 0
+    while True:
+        order_ids = list(Order.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not order_ids:
+            break
+        # Locked so a worker running meanwhile waits for the rebuild rather than adding the sales under it
+        pending = set(
+            OrderEvent.objects.select_for_update()
+            .filter(order_id__in=order_ids, kind='placed', processed_at__isnull=True)
+            .values_list('order_id', flat=True)
+        )
+        sales, cancelled = [], []
+        for item in OrderItem.objects.filter(order_id__in=order_ids).select_related('order', 'product'):
+            (sales if counts_as_sale(item.order, item) else cancelled).append(item)
+        record_sales([item for item in sales if item.order_id not in pending])
+        # The worker adds every item as it was placed, so take the cancelled ones out ahead of it, as the
+        # cancellations themselves did
+        record_sales(
+            [item for item in cancelled if item.order_id in pending], -1,
+            kept=[item for item in sales if item.order_id in pending],
+        )
+        last_pk = order_ids[-1]
+        counted += len(order_ids)
+        if progress:
+            progress(counted)
+    return counted
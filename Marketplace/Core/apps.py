@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'Core'  
\ No newline at end of file
+    name = 'Core'  
+
+    def ready(self):
+        from . import signals  # noqa: F401
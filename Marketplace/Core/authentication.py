@@ -0,0 +1,100 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .models import User
+
+# Seconds a user's active flag, role and password fingerprint are trusted from this process's memory, and from the
+# shared cache; saving the user clears the shared copy at once
+USER_STATE_LOCAL_TTL = getattr(settings, 'USER_STATE_LOCAL_TTL', 5)
+USER_STATE_CACHE_TTL = getattr(settings, 'USER_STATE_CACHE_TTL', 60)
+# Entries kept in memory before the local cache is emptied and starts over
+USER_STATE_LOCAL_MAX = 10000
+# Claims CustomTokenObtainPairSerializer embeds; older tokens without them are resolved from the database
+USER_CLAIMS = ('username', 'role', 'is_staff')
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _state_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _load_state(user_id):
+    # From the primary: it is cached anyway, and a replica may not have caught up with a signup or password change
+    row = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list('is_active', 'role', 'is_staff', 'password').first()
+    if row is None:
+        return None
+    is_active, role, is_staff, password = row
+    return {'is_active': is_active, 'role': role, 'is_staff': is_staff, 'password': get_md5_hash_password(password)}
+
+
+def user_state(user_id):
+    """
+    What authentication needs to know about a user beyond their token: active
+    flag, role, staff flag and password fingerprint, or None once deleted.
+    Read from process memory, then the shared cache, then the database.
+    """
+    now = time.monotonic()
+    entry = _local.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    key = _state_key(user_id)
+    cached = cache.get(key)
+    if cached is None:
+        # Deleted users are cached too, as an empty dict, so their old tokens stay cheap to reject
+        cached = _load_state(user_id) or {}
+        cache.set(key, cached, USER_STATE_CACHE_TTL)
+    with _local_lock:
+        if len(_local) >= USER_STATE_LOCAL_MAX:
+            _local.clear()
+        _local[user_id] = (now + USER_STATE_LOCAL_TTL, cached)
+    return cached or None
+
+
+def forget_user_state(*user_ids):
+    cache.delete_many([_state_key(user_id) for user_id in user_ids])
+    with _local_lock:
+        for user_id in user_ids:
+            _local.pop(user_id, None)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that builds request.user from the token's claims and
+    the cached user state instead of loading the user row on every request.
+    The user is a User with only id, username, role, is_staff and is_active
+    loaded; other fields load on first access, and save() writes only the
+    loaded ones.
+    """
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        state = user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not state['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != state['password']:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # Role and staff flag come from the state, so a demotion applies before the token expires
+        loaded = {'id': user_id, 'username': validated_token['username'], 'role': state['role'],
+                  'is_staff': state['is_staff'], 'is_active': state['is_active']}
+        # from_db takes the loaded values in field order
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+        return User.from_db(DEFAULT_DB_ALIAS, names, [loaded[name] for name in names])
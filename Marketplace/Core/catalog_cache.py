@@ -0,0 +1,116 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from .routers import reading_from_primary
+
+# Entries are rebuilt after CATALOG_CACHE_TIMEOUT seconds but may be served stale for as long again while one
+# request refreshes them
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+# How long a rebuild may hold the lock, and how long other requests wait for it before building themselves
+REBUILD_LOCK_TIMEOUT = 10
+REBUILD_WAIT = 2
+
+
+def _version_key(scope):
+    return f'catalog:version:{scope}'
+
+
+def get_versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Versions are timestamps, so an evicted counter never comes back at a value an old entry was keyed on
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(scopes):
+    now = time.time_ns()
+    cache.set_many({_version_key(scope): now for scope in scopes}, None)
+
+
+def invalidate_products(products):
+    """Retire every cached page and detail payload that can show these products."""
+    scopes = {'all'}
+    for product in products:
+        scopes.update([f'product:{product.pk}', f'category:{product.category_id}', f'seller:{product.seller_id}'])
+    bump_versions(scopes)
+
+
+def invalidate_categories():
+    # Category names are embedded in every product payload
+    bump_versions(['categories'])
+
+
+def scoped_key(scopes, suffix):
+    """A cache key that changes whenever any of ``scopes`` is invalidated."""
+    versions = ':'.join(str(version) for version in get_versions(scopes))
+    return f'catalog:{"|".join(scopes)}:{versions}:{suffix}'
+
+
+def get_or_build(key, build, timeout=CATALOG_CACHE_TIMEOUT):
+    """
+    Return the cached value for ``key``, calling ``build`` on a miss.
+
+    Only one request rebuilds an entry at a time: when it expires the others
+    keep serving the stale copy, and when it is missing they wait briefly for
+    the rebuild instead of all going to the database at once. The rebuild
+    reads from the primary, since a replica that has not caught up would
+    store old rows under the new version for everyone.
+    """
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    if entry is not None:
+        value, refresh_at = entry
+        if time.time() < refresh_at or not cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+        deadline = time.time() + REBUILD_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # The rebuild is taking too long; build it ourselves rather than fail the request
+        return build()
+
+    try:
+        with reading_from_primary():
+            value = build()
+        cache.set(key, (value, time.time() + timeout), timeout * 2)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+class CatalogCacheMixin:
+    """
+    Serves GET list/detail responses from the cache under keys versioned by
+    the catalog scopes the view returns from get_cache_scopes().
+    """
+
+    def get_cache_scopes(self):
+        return ['all']
+
+    def get_cache_key(self, request):
+        url = hashlib.sha256(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        return scoped_key(['categories', *self.get_cache_scopes()], url)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        def build():
+            response = handler(request, *args, **kwargs)
+            return response.status_code, response.data
+
+        status_code, data = get_or_build(self.get_cache_key(request), build)
+        return Response(data, status=status_code)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
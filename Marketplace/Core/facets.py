@@ -0,0 +1,127 @@
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from .models import Product, ProductFacetCell, ProductFacetMembership
+
+# Lower bounds of the storefront price bands; changing them needs manage.py rebuild_facets
+PRICE_BAND_BOUNDS = [Decimal(bound) for bound in getattr(settings, 'PRICE_BAND_BOUNDS', [0, 25, 50, 100, 250, 500, 1000])]
+
+
+def price_band(price):
+    return max(bisect_right(PRICE_BAND_BOUNDS, Decimal(price)) - 1, 0)
+
+
+def price_band_range(band):
+    # (min, max) with max None for the open-ended top band
+    upper = PRICE_BAND_BOUNDS[band + 1] if band + 1 < len(PRICE_BAND_BOUNDS) else None
+    return PRICE_BAND_BOUNDS[band], upper
+
+
+def _cells(product_ids):
+    rows = Product.objects.with_stock().filter(pk__in=product_ids).values_list('pk', 'category_id', 'price', 'total_stock')
+    return {pk: (category_id, price_band(price), total_stock > 0) for pk, category_id, price, total_stock in rows}
+
+
+def _apply(deltas):
+    for (category_id, band, in_stock), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        cell = ProductFacetCell.objects.filter(category_id=category_id, price_band=band, in_stock=in_stock)
+        if cell.update(product_count=F('product_count') + delta) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                ProductFacetCell.objects.create(category_id=category_id, price_band=band, in_stock=in_stock,
+                                                product_count=delta)
+        except IntegrityError:
+            # Another writer created the cell first
+            cell.update(product_count=F('product_count') + delta)
+
+
+@transaction.atomic
+def refresh_products(product_ids):
+    """
+    Recount ``product_ids`` (including deleted ones) in the facet cells they
+    now belong to. Only the cells they leave or join are touched, so the
+    cost depends on the products changed, not on the catalog size.
+
+    Every product's membership row is created (empty) if missing and locked,
+    in pk order, before anything is read, so concurrent recounts of one
+    product queue on its row and the second sees what the first counted.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    ProductFacetMembership.objects.bulk_create(
+        [ProductFacetMembership(product_id=pk) for pk in product_ids], ignore_conflicts=True,
+    )
+    previous = {
+        membership.product_id: (membership.category_id, membership.price_band, membership.in_stock)
+        for membership in ProductFacetMembership.objects.select_for_update().filter(product_id__in=product_ids)
+        .order_by('product_id')
+        if membership.category_id is not None
+    }
+    current = _cells(product_ids)
+
+    deltas = Counter()
+    for pk in product_ids:
+        if previous.get(pk) == current.get(pk):
+            continue
+        if pk in previous:
+            deltas[previous[pk]] -= 1
+        if pk in current:
+            deltas[current[pk]] += 1
+    _apply(deltas)
+
+    # Products gone from the catalog drop their row, whether it was counted or only just created empty
+    gone = [pk for pk in product_ids if pk not in current]
+    if gone:
+        ProductFacetMembership.objects.filter(product_id__in=gone).delete()
+    changed = [
+        ProductFacetMembership(product_id=pk, category_id=category_id, price_band=band, in_stock=in_stock)
+        for pk, (category_id, band, in_stock) in current.items() if previous.get(pk) != current[pk]
+    ]
+    if changed:
+        ProductFacetMembership.objects.bulk_update(changed, ['category_id', 'price_band', 'in_stock'])
+
+
+def facet_counts(category=None, category_name=None, band=None, in_stock=None):
+    """
+    Category, price band and stock facet counts for a listing. Each facet is
+    counted with the other facets' filters applied but not its own, so
+    shoppers see what every alternative choice would return.
+    """
+    filters = {'category': {}, 'price_band': {}, 'in_stock': {}}
+    if category:
+        filters['category'] = {'category_id': category}
+    elif category_name:
+        filters['category'] = {'category__name__iexact': category_name}
+    if band is not None:
+        filters['price_band'] = {'price_band': band}
+    if in_stock is not None:
+        filters['in_stock'] = {'in_stock': in_stock}
+
+    def counted(facet, *fields):
+        cells = ProductFacetCell.objects.filter(product_count__gt=0)
+        for name, lookup in filters.items():
+            if name != facet:
+                cells = cells.filter(**lookup)
+        return cells.values(*fields).annotate(count=Sum('product_count')).order_by(*reversed(fields))
+
+    price_bands = []
+    for row in counted('price_band', 'price_band'):
+        lower, upper = price_band_range(row['price_band'])
+        price_bands.append({'band': row['price_band'], 'min': str(lower), 'max': str(upper) if upper else None,
+                            'count': row['count']})
+    return {
+        'category': [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+            for row in counted('category', 'category_id', 'category__name')
+        ],
+        'price_band': price_bands,
+        'in_stock': [{'value': row['in_stock'], 'count': row['count']} for row in counted('in_stock', 'in_stock')],
+    }
@@ -0,0 +1,167 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.relations import PrimaryKeyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from .metrics import TimedRepresentationMixin
+
+# (fields, expand, sparse): the field tree to render (None for every field), the nested serializers to render
+# in full, and whether the client picked fields at all
+FULL_FIELDSET = (None, {}, False)
+
+
+def parse_fieldset(value):
+    """'id,items.product.name' -> {'id': {}, 'items': {'product': {'name': {}}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def request_fieldset(request):
+    # Writes always take and return every field
+    if request is None or request.method != 'GET':
+        return FULL_FIELDSET
+    fields = request.query_params.get('fields')
+    if not fields:
+        return FULL_FIELDSET
+    return parse_fieldset(fields), parse_fieldset(request.query_params.get('expand')), True
+
+
+def child_fieldset(fieldset, name):
+    fields, expand, sparse = fieldset
+    return (fields.get(name) or None) if fields is not None else None, expand.get(name, {}), sparse
+
+
+class SparseFieldsetMixin(TimedRepresentationMixin):
+    """
+    Lets clients trim a serializer with ?fields=id,name,category.name. Once
+    fields are picked, nested serializers render as primary keys unless they
+    are named in ?expand= or have their own fields picked, so the nested
+    serializer and its join are skipped entirely.
+
+    Fields computed from more than the model field of the same name list the
+    columns they read in Meta.sparse_columns, so views can load only those.
+    Its to_representation time counts towards the request's metrics.
+    """
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        self._fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    def get_fieldset(self):
+        # Walk up to the serializer the fieldset was given to (or the root, which reads the request)
+        path, node = [], self
+        while getattr(node, '_fieldset', None) is None and node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        fieldset = getattr(node, '_fieldset', None) or request_fieldset(self.context.get('request'))
+        for name in reversed(path):
+            fieldset = child_fieldset(fieldset, name)
+        return fieldset
+
+    def child_fieldset(self, name):
+        return child_fieldset(self.get_fieldset(), name)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand, sparse = self.get_fieldset()
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only}
+        if sparse:
+            for name, field in fields.items():
+                if isinstance(field, BaseSerializer) and name not in expand and not (only or {}).get(name):
+                    fields[name] = PrimaryKeyRelatedField(
+                        read_only=True, source=field.source, many=isinstance(field, ListSerializer)
+                    )
+        return fields
+
+    def expands(self, name):
+        """Whether the nested ``name`` renders in full rather than as primary keys."""
+        return isinstance(self.fields.get(name), BaseSerializer)
+
+
+def sparse_columns(serializer, annotations=(), prefix=''):
+    """
+    The (columns, joins) ``serializer`` reads, as only() and select_related()
+    paths, or None when a field reads something that cannot be told from its
+    source.
+    """
+    model = serializer.Meta.model
+    extra = getattr(serializer.Meta, 'sparse_columns', {})
+    columns, joins = set(), set()
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in extra:
+            columns.update(f'{prefix}{column}' for column in extra[name])
+            continue
+        if not field.source_attrs:
+            return None
+        attr = field.source_attrs[0]
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # Annotations are selected regardless of only(); anything else may read deferred columns
+            if attr in annotations:
+                continue
+            return None
+        if not model_field.is_relation:
+            columns.add(f'{prefix}{attr}')
+        elif model_field.many_to_many or model_field.one_to_many:
+            # Reverse and many-to-many relations are fetched by the view's prefetches
+            continue
+        elif isinstance(field, PrimaryKeyRelatedField) and model_field.concrete:
+            columns.add(f'{prefix}{attr}')
+        elif isinstance(field, SparseFieldsetMixin):
+            nested = sparse_columns(field, prefix=f'{prefix}{attr}__')
+            joins.add(f'{prefix}{attr}')
+            if nested is None:
+                columns.add(f'{prefix}{attr}')
+            else:
+                columns.update(nested[0])
+                joins.update(nested[1])
+        elif len(field.source_attrs) == 2 and not isinstance(field, (BaseSerializer, RelatedField)):
+            joins.add(f'{prefix}{attr}')
+            columns.add(f'{prefix}{attr}__{field.source_attrs[1]}')
+        else:
+            # e.g. StringRelatedField, which needs the whole related row
+            joins.add(f'{prefix}{attr}')
+            columns.add(f'{prefix}{attr}')
+    return columns, joins
+
+
+def sparse_queryset(queryset, serializer):
+    """Load only the columns and joins ``serializer`` renders, plus what the ordering needs."""
+    if not serializer.get_fieldset()[2]:
+        return queryset
+    needs = sparse_columns(serializer, queryset.query.annotations)
+    if needs is None:
+        return queryset
+    columns, joins = needs
+    # Keyset pagination reads the ordering values off the last row of each page
+    for field in queryset.query.order_by:
+        name = field.lstrip('-') if isinstance(field, str) else None
+        if name and name not in ('pk', 'id') and name not in queryset.query.annotations:
+            columns.add(name)
+            if '__' in name:
+                joins.add(name.rsplit('__', 1)[0])
+    columns.add(queryset.model._meta.pk.name)
+    queryset = queryset.select_related(None)
+    if joins:
+        # select_related() with no arguments would follow every foreign key instead
+        queryset = queryset.select_related(*joins)
+    return queryset.only(*columns)
+
+
+class SparseFieldsetViewMixin:
+    """Trims the queryset of GET requests to the fields picked with ?fields=."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method != 'GET':
+            return queryset
+        return sparse_queryset(queryset, self.get_serializer())
@@ -0,0 +1,142 @@
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .metrics import REGISTRY
+from .models import User
+
+# Threads hashing passwords at once per process. hashlib releases the GIL, so other request threads keep serving
+HASHING_WORKERS = getattr(settings, 'HASHING_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+# Hashes allowed to wait behind the running ones, and how long a request waits for a place before getting a 503
+HASHING_QUEUE_SIZE = getattr(settings, 'HASHING_QUEUE_SIZE', 4 * HASHING_WORKERS)
+HASHING_QUEUE_WAIT = getattr(settings, 'HASHING_QUEUE_WAIT', 0.5)
+HASHING_RETRY_AFTER = getattr(settings, 'HASHING_RETRY_AFTER', 1)
+# Hashes running or waiting at once across every process sharing the cache. Each one holds a request thread (a
+# whole worker under sync workers), so this caps how many of them a login storm can take; None for no shared cap
+HASHING_SHARED_SLOTS = getattr(settings, 'HASHING_SHARED_SLOTS', HASHING_WORKERS + HASHING_QUEUE_SIZE)
+# Seconds a shared slot is held at most; a process killed mid-hash leaks its slot until then
+HASHING_SHARED_SLOT_TTL = getattr(settings, 'HASHING_SHARED_SLOT_TTL', 60)
+SHARED_SLOTS_KEY = 'hashing:slots'
+
+_executor = ThreadPoolExecutor(max_workers=HASHING_WORKERS, thread_name_prefix='password-hashing')
+_slots = threading.BoundedSemaphore(HASHING_WORKERS + HASHING_QUEUE_SIZE)
+_lock = threading.Lock()
+_in_flight = 0
+
+
+class HashingSaturated(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many sign-ins at once, try again shortly."
+    default_code = 'hashing_saturated'
+    # DRF turns this into the Retry-After header
+    wait = HASHING_RETRY_AFTER
+
+
+def _track(change):
+    global _in_flight
+    with _lock:
+        _in_flight += change
+        depth = max(0, _in_flight - HASHING_WORKERS)
+    REGISTRY.set('password_hashing_in_flight', "Password hashes running or queued.", 'gauge', _in_flight)
+    REGISTRY.set('password_hashing_queue_depth', "Password hashes waiting for a worker.", 'gauge', depth)
+
+
+def shared_slot_keys():
+    return [f'{SHARED_SLOTS_KEY}:{number}' for number in range(HASHING_SHARED_SLOTS)]
+
+
+def _release_shared_slot(key, holder):
+    # Only if still ours: once a slot outlives its TTL another hash may hold it
+    if cache.get(key) == holder:
+        cache.delete(key)
+
+
+def _acquire_shared_slot(deadline):
+    """
+    Take one of the HASHING_SHARED_SLOTS keys in the shared cache, polling
+    until one is free or the deadline passes. Returns (key, holder) for
+    _release_shared_slot, or None. Each slot is its own key, so a slot that
+    expires is simply free again and the others are unaffected.
+    """
+    holder = uuid.uuid4().hex
+    while True:
+        keys = shared_slot_keys()
+        taken = cache.get_many(keys)
+        free = [key for key in keys if key not in taken]
+        # Shuffled so processes polling at once do not all race for the first free slot
+        random.shuffle(free)
+        for key in free:
+            if cache.add(key, holder, HASHING_SHARED_SLOT_TTL):
+                return key, holder
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(min(0.01, max(0, deadline - time.monotonic())))
+
+
+def run_hashing(function, *args):
+    """
+    Run ``function`` (a password hash or check) on the bounded hashing pool
+    and return its result. Raises HashingSaturated when HASHING_QUEUE_SIZE
+    hashes are already waiting in this process, or HASHING_SHARED_SLOTS
+    across processes, so a login storm is turned away with a 503 instead of
+    occupying every request thread.
+    """
+    deadline = time.monotonic() + HASHING_QUEUE_WAIT
+    if not _slots.acquire(timeout=HASHING_QUEUE_WAIT):
+        REGISTRY.increment('password_hashing_rejected_total', "Password hashes turned away with a 503.")
+        raise HashingSaturated()
+    shared_slot = None
+    if HASHING_SHARED_SLOTS is not None:
+        shared_slot = _acquire_shared_slot(deadline)
+        if shared_slot is None:
+            _slots.release()
+            REGISTRY.increment('password_hashing_rejected_total', "Password hashes turned away with a 503.")
+            raise HashingSaturated()
+    _track(1)
+    start = time.perf_counter()
+    try:
+        return _executor.submit(function, *args).result()
+    finally:
+        _track(-1)
+        if shared_slot is not None:
+            _release_shared_slot(*shared_slot)
+        _slots.release()
+        REGISTRY.increment('password_hashes_total', "Password hashes run on the pool.")
+        REGISTRY.increment('password_hashing_seconds_total', "Time requests spent waiting on password hashes.",
+                           time.perf_counter() - start)
+
+
+def hash_password(password):
+    return run_hashing(make_password, password)
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend that checks passwords on the hashing pool; the user is still loaded on the request thread."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as wrong passwords
+            hash_password(password)
+            return None
+        if not run_hashing(check_password, password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if identify_hasher(user.password).must_update(user.password):
+            # Upgrade the stored hash after a hasher or iteration count change, as User.check_password would
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user
@@ -0,0 +1,90 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+# Seconds a stored response is replayed for; purge_idempotency_keys deletes older ones
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600)
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotencyKeyBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed, try again shortly."
+    default_code = 'idempotency_key_busy'
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete expired idempotency keys ``batch_size`` rows per statement and return how many went."""
+    purged = 0
+    while True:
+        batch = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
+
+
+class IdempotentCreateMixin:
+    """
+    Makes create() safe to retry: when the request carries an Idempotency-Key
+    header, the key is claimed in the same transaction as the write and the
+    response is stored with it, so a repeat gets the first response back
+    (with Idempotent-Replayed: true) instead of a second write. A duplicate
+    sent while the first is still running blocks on the key's unique index
+    until that transaction ends, then replays its response, or goes ahead
+    if it rolled back. Error responses roll the key back with everything
+    else, so they are not stored and a retry runs again.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ValidationError({IDEMPOTENCY_KEY_HEADER: ["Send between 1 and 255 characters."]})
+        fingerprint = request_fingerprint(request)
+
+        # Twice at most: the second attempt follows an expired key being cleared
+        for _ in range(2):
+            claimed = False
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, fingerprint=fingerprint,
+                        expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+                    )
+                    claimed = True
+                    response = super().create(request, *args, **kwargs)
+                    record.status_code, record.response = response.status_code, response.data
+                    record.save(update_fields=['status_code', 'response'])
+                    return response
+            except IntegrityError:
+                if claimed:
+                    raise
+                record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None or record.expires_at <= timezone.now():
+                IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=timezone.now()).delete()
+                continue
+            if record.fingerprint != fingerprint:
+                raise IdempotencyKeyReused()
+            return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+        raise IdempotencyKeyBusy()
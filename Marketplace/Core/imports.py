@@ -0,0 +1,199 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.parsers import BaseParser
+from . import catalog_cache, facets, search
+from .models import Category, InventoryLog, Product
+from .stock import set_stock
+
+# Rows validated and written per transaction by the bulk product import
+IMPORT_BATCH_SIZE = getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+IMPORT_FORMATS = ['csv', 'ndjson']
+# Columns written on products that already exist; the name keeps the casing it was created with
+UPDATE_FIELDS = ['description', 'price', 'stock_quantity', 'is_deleted', 'deleted_at', 'updated_at']
+
+
+def read_rows(lines, format):
+    """
+    Yield a dict for each CSV record (header row first; empty cells are left
+    out) or NDJSON line of ``lines``, an iterable of text lines. A line that
+    is not JSON is yielded as it is, to be reported as an invalid row.
+    """
+    if format == 'csv':
+        for row in csv.DictReader(lines):
+            yield {column: value for column, value in row.items() if column and value not in ('', None)}
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line.strip()
+
+
+class ImportRowsParser(BaseParser):
+    """Hands the view a lazy iterator over the rows of the body, so a large catalog is never held in memory."""
+    format = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return read_rows(codecs.iterdecode(stream, encoding), self.format)
+
+
+class CSVRowsParser(ImportRowsParser):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRowsParser(ImportRowsParser):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    # Checks one row without touching the database; categories are resolved for a whole batch at once
+    name = serializers.CharField(max_length=Product._meta.get_field('name').max_length)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock_quantity = serializers.IntegerField(min_value=0)
+    category_id = serializers.IntegerField(required=False)
+    category = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if 'category_id' not in attrs and 'category' not in attrs:
+            raise serializers.ValidationError("Give a category_id or a category name.")
+        return attrs
+
+
+def import_products(rows, seller, batch_size=None):
+    """
+    Create or update ``seller``'s products from ``rows`` and yield a result
+    for each: {'row', 'status': 'created'|'updated', 'id'} or {'row',
+    'status': 'error', 'errors'}. A row matches an existing product by name
+    (ignoring case), category and seller, as the product create endpoint
+    does, and sets its description, price and stock, restoring it if it was
+    deleted. Rows are handled ``batch_size`` at a time, each batch in one
+    transaction with a fixed number of queries.
+    """
+    rows = enumerate(rows, 1)
+    while True:
+        batch = list(islice(rows, batch_size or IMPORT_BATCH_SIZE))
+        if not batch:
+            return
+        yield from _import_batch(batch, seller)
+
+
+def _resolve_categories(valid):
+    ids = {data['category_id'] for _, data in valid if 'category_id' in data}
+    names = {data['category'].lower() for _, data in valid if 'category_id' not in data}
+    categories = Category.objects.annotate(lower_name=Lower('name')).filter(Q(pk__in=ids) | Q(lower_name__in=names))
+    by_id, by_name = {}, {}
+    for category in categories:
+        by_id[category.pk] = by_name[category.lower_name] = category
+    return by_id, by_name
+
+
+@transaction.atomic
+def _import_batch(batch, seller):
+    results, valid = {}, []
+    for number, row in batch:
+        serializer = ProductImportRowSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            results[number] = {'row': number, 'status': 'error', 'errors': serializer.errors}
+
+    by_id, by_name = _resolve_categories(valid)
+    placed = []
+    for number, data in valid:
+        if 'category_id' in data:
+            category = by_id.get(data['category_id'])
+        else:
+            category = by_name.get(data['category'].lower())
+        if category is None:
+            field = 'category_id' if 'category_id' in data else 'category'
+            results[number] = {'row': number, 'status': 'error', 'errors': {field: ["Category does not exist."]}}
+        else:
+            placed.append((number, data, category))
+
+    # Locked so a checkout cannot move their stock between this read and the write below
+    existing = {
+        (product.lower_name, product.category_id): product
+        for product in Product.all_objects.select_for_update().with_stock().annotate(lower_name=Lower('name')).filter(
+            seller=seller,
+            category_id__in={category.pk for _, _, category in placed},
+            lower_name__in={data['name'].lower() for _, data, _ in placed},
+        )
+    }
+    created, updated, logs, stock, rows = {}, {}, [], {}, {}
+    now = timezone.now()
+    for number, data, category in placed:
+        key = (data['name'].lower(), category.pk)
+        product, status = created.get(key) or existing.get(key), 'updated'
+        if product is None:
+            product, status = Product(name=data['name'], category=category, seller=seller, stock_quantity=0), 'created'
+            created[key], stock[key] = product, 0
+        elif key not in created:
+            updated[key] = product
+            stock.setdefault(key, product.available_stock)
+        product.description, product.price = data['description'], data['price']
+        product.is_deleted, product.deleted_at, product.updated_at = False, None, now
+        change = data['stock_quantity'] - stock[key]
+        if change:
+            # New products log their opening stock as a restock, as the create endpoint does
+            logs.append(InventoryLog(product=product, quantity_change=change,
+                                     reason='restock' if status == 'created' else 'manual'))
+        stock[key] = data['stock_quantity']
+        if not product.stock_shards:
+            product.stock_quantity = data['stock_quantity']
+        rows[number] = (product, status)
+
+    if created:
+        upsert = {}
+        if connection.features.supports_update_conflicts_with_target:
+            upsert['unique_fields'] = ['name', 'category', 'seller']
+        # A product created by another request since the lookup above is updated instead of failing the batch
+        Product.all_objects.bulk_create(created.values(), update_conflicts=True, update_fields=UPDATE_FIELDS, **upsert)
+        if any(product.pk is None for product in created.values()):
+            # Backends such as MySQL do not return the ids of bulk inserts
+            ids = {
+                (name.lower(), category_id): pk
+                for pk, name, category_id in Product.all_objects.filter(
+                    seller=seller, name__in=[product.name for product in created.values()],
+                ).values_list('pk', 'name', 'category_id')
+            }
+            for key, product in created.items():
+                product.pk = ids[key]
+    if updated:
+        Product.all_objects.bulk_update(updated.values(), UPDATE_FIELDS)
+        for key, product in updated.items():
+            if product.stock_shards:
+                set_stock(product, stock[key])
+    InventoryLog.objects.bulk_create(logs)
+
+    # bulk_create and bulk_update send no signals, so do what the Product signal handlers would
+    products = [*created.values(), *updated.values()]
+    search.index_products(products)
+    product_ids = [product.pk for product in products]
+
+    def refresh():
+        # Recount first, so a page cached while the counts are stale is retired by the invalidation
+        try:
+            facets.refresh_products(product_ids)
+        finally:
+            catalog_cache.invalidate_products(products)
+    # The batch is committed by then, so a failed recount is logged like the Product signal's, not raised
+    transaction.on_commit(refresh, robust=True)
+
+    for number, (product, status) in rows.items():
+        results[number] = {'row': number, 'status': status, 'id': product.pk}
+    return [results[number] for number in sorted(results)]
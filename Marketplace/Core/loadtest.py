@@ -0,0 +1,178 @@
+import json
+import math
+import random
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from .facets import PRICE_BAND_BOUNDS
+from .seed import WORDS
+
+# Relative weight of each scenario in the default traffic mix
+DEFAULT_MIX = {'browse': 50, 'login': 10, 'checkout': 15, 'dashboard': 25}
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, endpoint, status, latency):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def report(self, elapsed):
+        """Rows of endpoint, requests, errors, throttled, req/s and p50/p95/p99/max in ms, busiest first."""
+        rows = []
+        with self.lock:
+            for endpoint, latencies in self.latencies.items():
+                ordered = sorted(latencies)
+                statuses = self.statuses[endpoint]
+                errors = sum(count for status, count in statuses.items() if status == 0 or status >= 400)
+                rows.append({
+                    'endpoint': endpoint,
+                    'requests': len(ordered),
+                    'errors': errors,
+                    'throttled': statuses.get(429, 0),
+                    'rps': len(ordered) / elapsed,
+                    'p50': percentile(ordered, 0.50) * 1000,
+                    'p95': percentile(ordered, 0.95) * 1000,
+                    'p99': percentile(ordered, 0.99) * 1000,
+                    'max': ordered[-1] * 1000,
+                })
+        return sorted(rows, key=lambda row: -row['requests'])
+
+
+class VirtualUser:
+    """
+    One simulated client: logs in as a random seeded customer and seller and
+    replays scenarios picked from the mix until the deadline.
+    """
+
+    def __init__(self, harness, rng, mix=None):
+        self.harness = harness
+        self.rng = rng
+        self.mix = mix or harness.mix
+        self.tokens = {}
+
+    def call(self, endpoint, method, path, data=None, role=None):
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        token = self.token(role) if role is not None else None
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        request = Request(self.harness.url + path, body, headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=self.harness.timeout) as response:
+                status, payload = response.status, response.read()
+        except HTTPError as error:
+            status, payload = error.code, error.read()
+        except (URLError, OSError):
+            status, payload = 0, b''
+        self.harness.stats.record(f'{method} {endpoint}', status, time.perf_counter() - start)
+        if 200 <= status < 300 and payload:
+            return json.loads(payload)
+        return None
+
+    def login(self, role):
+        username = f'{self.harness.prefix}_{role}_{self.rng.randrange(self.harness.users[role])}'
+        data = self.call('/api/auth/login/', 'POST', '/api/auth/login/',
+                         {'username': username, 'password': self.harness.password})
+        self.tokens[role] = data['access'] if data else ''
+        return self.tokens[role]
+
+    def token(self, role):
+        return self.tokens.get(role) or self.login(role)
+
+    def browse(self):
+        band = self.rng.randrange(len(PRICE_BAND_BOUNDS))
+        page = self.call('/api/customer/products/', 'GET', f'/api/customer/products/?page_size=20&price_band={band}',
+                         role='customer')
+        self.call('/api/customer/products/search/', 'GET',
+                  f'/api/customer/products/search/?q={self.rng.choice(WORDS)}', role='customer')
+        if page and page.get('results'):
+            product = self.rng.choice(page['results'])
+            self.call('/api/seller/products/<pk>/', 'GET', f"/api/seller/products/{product['id']}/")
+
+    def checkout(self):
+        page = self.call('/api/customer/products/', 'GET', '/api/customer/products/?page_size=50&fields=id,stock_quantity',
+                         role='customer')
+        in_stock = [product['id'] for product in (page or {}).get('results', []) if product['stock_quantity'] >= 3]
+        if len(in_stock) >= 2:
+            cart = self.rng.sample(in_stock, self.rng.randint(2, min(4, len(in_stock))))
+            self.call('/api/customer/orders/create/', 'POST', '/api/customer/orders/create/',
+                      {'items': [{'product_id': pk, 'quantity': self.rng.randint(1, 3)} for pk in cart]}, role='customer')
+        self.call('/api/customer/orders/', 'GET', '/api/customer/orders/', role='customer')
+
+    def dashboard(self):
+        self.call('/api/seller/inventory/', 'GET', '/api/seller/inventory/?page_size=50', role='seller')
+        orders = self.call('/api/seller/orders/', 'GET', '/api/seller/orders/?page_size=20', role='seller')
+        if orders and orders.get('results'):
+            order = self.rng.choice(orders['results'])
+            self.call('/api/seller/orders/<pk>/', 'GET', f"/api/seller/orders/{order['id']}/", role='seller')
+        self.call('/api/seller/sales-history/', 'GET', '/api/seller/sales-history/?page_size=50', role='seller')
+
+    def run(self, deadline):
+        scenarios, weights = zip(*self.mix.items())
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(scenarios, weights)[0]
+            if scenario == 'login':
+                self.login(self.rng.choice(['customer', 'seller']))
+            else:
+                getattr(self, scenario)()
+
+
+class LoadTest:
+    """
+    Replays a weighted mix of login, browse, checkout and seller dashboard
+    traffic from ``concurrency`` threads against a running server whose
+    database was filled by seed_marketplace with the same ``prefix`` and
+    ``password``. ``users`` maps 'customer' and 'seller' to how many of each
+    were seeded. ``login_storm`` more threads do nothing but log in, to see
+    how the rest of the traffic holds up meanwhile.
+    """
+
+    def __init__(self, url, users, mix=None, concurrency=10, prefix='seed', password='password123', timeout=30, seed=None,
+                 login_storm=0):
+        unknown = set(mix or {}) - set(DEFAULT_MIX)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        self.url = url.rstrip('/')
+        self.users = users
+        self.mix = mix or DEFAULT_MIX
+        self.concurrency = concurrency
+        self.prefix = prefix
+        self.password = password
+        self.timeout = timeout
+        self.seed = seed
+        self.login_storm = login_storm
+        self.stats = Stats()
+
+    def run(self, duration):
+        """Run for ``duration`` seconds and return the elapsed time."""
+        rng = random.Random(self.seed)
+        deadline = time.monotonic() + duration
+        start = time.perf_counter()
+        users = [VirtualUser(self, random.Random(rng.random())) for _ in range(self.concurrency)]
+        users += [VirtualUser(self, random.Random(rng.random()), {'login': 1}) for _ in range(self.login_storm)]
+        threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
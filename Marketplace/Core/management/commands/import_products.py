@@ -0,0 +1,38 @@
+import codecs
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from Core.imports import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_products, read_rows
+from Core.models import User
+
+
+class Command(BaseCommand):
+    help = ("Create or update a seller's products from a CSV (with a header row) or NDJSON file, "
+            "as POST /api/seller/products/import/ does.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for standard input.")
+        parser.add_argument('--seller', required=True, help="Username of the seller the products belong to.")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file's extension.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options['seller'], role__in=['seller', 'admin'])
+        except User.DoesNotExist:
+            raise CommandError(f"No seller or admin named {options['seller']!r}.")
+        path = options['path']
+        format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if format not in IMPORT_FORMATS:
+            raise CommandError(f"Pass --format, one of: {', '.join(IMPORT_FORMATS)}.")
+
+        counts = dict.fromkeys(['created', 'updated', 'error'], 0)
+        source = codecs.getreader('utf-8')(sys.stdin.buffer) if path == '-' else open(path, encoding='utf-8', newline='')
+        with source:
+            for result in import_products(read_rows(source, format), seller, options['batch_size']):
+                counts[result['status']] += 1
+                if result['status'] == 'error':
+                    self.stderr.write(f"Row {result['row']}: {result['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['created']}, updated {counts['updated']}, failed {counts['error']} products."
+        ))
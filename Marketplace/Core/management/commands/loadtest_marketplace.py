@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from Core.loadtest import DEFAULT_MIX, LoadTest
+from Core.models import User
+
+
+def parse_mix(value):
+    try:
+        return {name.strip(): int(weight) for name, weight in (part.split('=') for part in value.split(','))}
+    except ValueError:
+        raise CommandError(f"--mix expects scenario=weight pairs, e.g. {format_mix(DEFAULT_MIX)}")
+
+
+def format_mix(mix):
+    return ','.join(f'{name}={weight}' for name, weight in mix.items())
+
+
+class Command(BaseCommand):
+    help = ("Replay login, browse, checkout and seller dashboard traffic against a running server filled by "
+            "seed_marketplace, then report throughput and p50/p95/p99 latency per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to run for.")
+        parser.add_argument('--concurrency', type=int, default=10, help="Simultaneous virtual users.")
+        parser.add_argument('--mix', default=format_mix(DEFAULT_MIX), help="Weights of the scenarios.")
+        parser.add_argument('--login-storm', type=int, default=0,
+                            help="Extra virtual users that only log in, e.g. to compare catalog latency with and without.")
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--password', default='password123')
+        parser.add_argument('--customers', type=int, help="Seeded customers to log in as; counted locally by default.")
+        parser.add_argument('--sellers', type=int, help="Seeded sellers to log in as; counted locally by default.")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        users = {}
+        for role in ('customer', 'seller'):
+            users[role] = options[f'{role}s']
+            if users[role] is None:
+                users[role] = User.objects.filter(role=role, username__startswith=f'{prefix}_{role}_').count()
+            if not users[role]:
+                raise CommandError(f"No {role}s prefixed '{prefix}_'; run seed_marketplace first.")
+        try:
+            harness = LoadTest(options['url'], users, parse_mix(options['mix']), options['concurrency'], prefix,
+                               options['password'], options['timeout'], options['seed'], options['login_storm'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(f"Running {options['concurrency']} virtual users for {options['duration']:g}s "
+                          f"against {harness.url}...")
+        elapsed = harness.run(options['duration'])
+        rows = harness.stats.report(elapsed)
+        if not rows:
+            raise CommandError("No requests were made.")
+
+        self.stdout.write(f"{'endpoint':<40} {'requests':>8} {'errors':>7} {'req/s':>8} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<40} {row['requests']:>8} {row['errors']:>7} {row['rps']:>8.1f} "
+                f"{row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} {row['max']:>8.1f}"
+            )
+        total = sum(row['requests'] for row in rows)
+        errors = sum(row['errors'] for row in rows)
+        self.stdout.write(self.style.SUCCESS(f"{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s, "
+                                             f"{errors} errors."))
+        throttled = sum(row['throttled'] for row in rows)
+        if throttled:
+            self.stdout.write(self.style.WARNING(
+                f"{throttled} requests were throttled; raise DEFAULT_THROTTLE_RATES on the server under test."
+            ))
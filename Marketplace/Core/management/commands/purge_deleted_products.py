@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from Core.purge import purge_deleted_products
+
+
+class Command(BaseCommand):
+    help = ("Physically delete products sellers have deleted, with their order items, inventory logs and reviews, "
+            "in small batches; run it from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Dependent rows deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        def progress(product_id, deleted):
+            self.stdout.write(f"Purged product {product_id} and {deleted} dependent rows")
+
+        purged = purge_deleted_products(options['batch_size'], options['pause'], progress)
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} deleted products."))
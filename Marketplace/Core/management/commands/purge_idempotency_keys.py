@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Core.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL; run it from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        purged = purge_expired_keys(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired idempotency keys."))
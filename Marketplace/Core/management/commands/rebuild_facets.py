@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from Core.facets import refresh_products
+from Core.models import Product, ProductFacetCell, ProductFacetMembership
+
+
+class Command(BaseCommand):
+    help = "Recount the product facet tables from scratch, e.g. after changing PRICE_BAND_BOUNDS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ProductFacetMembership.objects.all().delete()
+        ProductFacetCell.objects.all().delete()
+        last_pk = 0
+        counted = 0
+        while True:
+            batch = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            refresh_products(batch)
+            last_pk = batch[-1]
+            counted += len(batch)
+            self.stdout.write(f"Counted {counted} products")
+        self.stdout.write(self.style.SUCCESS(f"Facet counts rebuilt for {counted} products."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Core.analytics import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = "Recount the seller sales rollups from scratch, e.g. after editing orders outside the API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counted = rebuild_sales(options['batch_size'], lambda counted: self.stdout.write(f"Counted {counted} orders"))
+        self.stdout.write(self.style.SUCCESS(f"Sales rollups rebuilt for {counted} orders."))
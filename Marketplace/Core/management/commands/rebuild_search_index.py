@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from Core.models import Product
+from Core.search import index_products
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        indexed = 0
+        while True:
+            batch = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'name', 'description')[:batch_size])
+            if not batch:
+                break
+            index_products(batch)
+            last_pk = batch[-1].pk
+            indexed += len(batch)
+            self.stdout.write(f"Indexed {indexed} products")
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt for {indexed} products."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Core.outbox import ORDER_EVENT_BATCH_SIZE, process_order_events
+
+
+class Command(BaseCommand):
+    help = ("Handle the order events written at checkout: inventory logs, sales rollups and facet counts. "
+            "Runs until interrupted; several workers may run at once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ORDER_EVENT_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1, help="Seconds to sleep when no events are pending.")
+        parser.add_argument('--once', action='store_true', help="Exit once no events are pending.")
+
+    def handle(self, *args, **options):
+        handled = 0
+        try:
+            while True:
+                taken = process_order_events(options['batch_size'])
+                handled += taken
+                if taken < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Handled {handled} order events."))
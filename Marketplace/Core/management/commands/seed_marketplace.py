@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from Core.models import User
+from Core.seed import seed_marketplace
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate a synthetic marketplace with production-like skew, for local load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sellers', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=200000)
+        parser.add_argument('--orders', type=int, default=500000)
+        parser.add_argument('--max-items', type=int, default=8, help="Most items in one order.")
+        parser.add_argument('--review-rate', type=float, default=0.2, help="Fraction of ordered items reviewed.")
+        parser.add_argument('--history-days', type=int, default=365)
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent of popularity; 0 is uniform.")
+        parser.add_argument('--prefix', default='seed', help="Prefix of the generated usernames and names.")
+        parser.add_argument('--password', default='password123')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Users prefixed '{prefix}_' already exist; pick another --prefix.")
+        data = seed_marketplace(
+            sellers=options['sellers'],
+            customers=options['customers'],
+            categories=options['categories'],
+            products=options['products'],
+            orders=options['orders'],
+            items_per_order=(1, options['max_items']),
+            review_rate=options['review_rate'],
+            history_days=options['history_days'],
+            skew=options['skew'],
+            password=options['password'],
+            prefix=prefix,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=lambda message: self.stdout.write(f"Created {message}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {data['sellers'].count()} sellers, {data['customers'].count()} customers, "
+            f"{data['products'].count()} products and {data['orders'].count()} orders. "
+            f"Log in as {data['admin'].username}, {prefix}_seller_0 or {prefix}_customer_0."
+        ))
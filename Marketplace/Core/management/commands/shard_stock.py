@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from Core.models import Product
+from Core.stock import set_sharding
+
+
+class Command(BaseCommand):
+    help = "Split a hot product's stock across several counter rows (or merge it back with --shards 0)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='+', type=int)
+        parser.add_argument('--shards', type=int, default=8, help="Number of stock counters; 0 disables sharding.")
+
+    def handle(self, *args, **options):
+        shards = options['shards']
+        if shards < 0:
+            raise CommandError("--shards cannot be negative.")
+
+        for product_id in options['product_ids']:
+            try:
+                product = set_sharding(product_id, shards)
+            except Product.DoesNotExist:
+                raise CommandError(f"Product {product_id} does not exist.")
+            if shards:
+                self.stdout.write(f"{product.name}: {product.available_stock} units across {shards} counters")
+            else:
+                self.stdout.write(f"{product.name}: {product.available_stock} units on the product row")
@@ -0,0 +1,136 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from rest_framework.serializers import ListSerializer
+
+# Fraction of requests that are measured; 0 turns the middleware into a pass-through
+METRICS_SAMPLE_RATE = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+# Sampled requests slower than this (seconds) are logged with their slowest statements
+SLOW_REQUEST_THRESHOLD = getattr(settings, 'SLOW_REQUEST_THRESHOLD', 0.5)
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+
+# Core.middleware.RequestMetrics of the sampled request being handled; None outside sampled requests
+current_metrics = ContextVar('current_metrics', default=None)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf overflow; cumulated only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Per-process request histograms, labelled by route and method. Each worker
+    process keeps its own, so scrape every worker (or run one per container).
+    """
+    metrics = {
+        'request_duration_seconds': ("Total request latency.", SECONDS_BUCKETS),
+        'db_queries': ("SQL statements executed per request.", QUERY_BUCKETS),
+        'db_duration_seconds': ("Time spent in SQL per request.", SECONDS_BUCKETS),
+        'serialization_seconds': (
+            "Time spent in serializers' to_representation and encoding the response body per request.", SECONDS_BUCKETS,
+        ),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.requests = {}
+            self.values = {}
+
+    def set(self, name, description, kind, value):
+        # Unlabelled process-wide gauge or counter, e.g. the password hashing queue
+        with self.lock:
+            self.values[name] = (description, kind, value)
+
+    def increment(self, name, description, amount=1):
+        with self.lock:
+            previous = self.values.get(name, (None, None, 0))[2]
+            self.values[name] = (description, 'counter', previous + amount)
+
+    def record(self, route, method, status, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, route, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(self.metrics[name][1])
+                self.histograms[key].observe(value)
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def render(self):
+        lines = [
+            '# HELP marketplace_requests_total Requests served.',
+            '# TYPE marketplace_requests_total counter',
+        ]
+        with self.lock:
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'marketplace_requests_total{{{_labels(route, method)},status="{status}"}} {count}')
+            for name, (description, buckets) in self.metrics.items():
+                lines += [f'# HELP marketplace_{name} {description}', f'# TYPE marketplace_{name} histogram']
+                for (metric, route, method), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = _labels(route, method)
+                    total = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        total += count
+                        lines.append(f'marketplace_{name}_bucket{{{labels},le="{bound}"}} {total}')
+                    lines.append(f'marketplace_{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'marketplace_{name}_count{{{labels}}} {total}')
+            for name, (description, kind, value) in sorted(self.values.items()):
+                lines += [f'# HELP marketplace_{name} {description}', f'# TYPE marketplace_{name} {kind}',
+                          f'marketplace_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+class TimedRepresentationMixin:
+    """
+    Adds a top-level serializer's to_representation time (each item's, for
+    many=True) to the sampled request's serialization_seconds; nested
+    serializers run inside it and are not counted again.
+    """
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        parent = self.parent
+        if metrics is None or (parent is not None and not (isinstance(parent, ListSerializer) and parent.parent is None)):
+            return super().to_representation(instance)
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serialization_time += time.perf_counter() - start
+
+
+def _labels(route, method):
+    route = route.replace('\\', '\\\\').replace('"', '\\"')
+    return f'route="{route}",method="{method}"'
+
+
+REGISTRY = Registry()
+
+
+def metrics_view(request):
+    """Prometheus text exposition of REGISTRY, for scrapers on METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
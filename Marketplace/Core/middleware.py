@@ -0,0 +1,97 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from .metrics import METRICS_SAMPLE_RATE, REGISTRY, SLOW_REQUEST_THRESHOLD, current_metrics
+from .routers import end_request, start_request
+
+logger = logging.getLogger('marketplace.slow_requests')
+
+# Statements kept per request for the slow-request log
+MAX_LOGGED_QUERIES = 5
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.serialization_time = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            self.statements.append((elapsed, sql))
+            if len(self.statements) > MAX_LOGGED_QUERIES * 4:
+                self.statements = sorted(self.statements, reverse=True)[:MAX_LOGGED_QUERIES]
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL count, SQL time and serialization time (serializers
+    plus JSON encoding) of a sample of requests per route into Core.metrics.REGISTRY, and logs sampled requests
+    slower than SLOW_REQUEST_THRESHOLD with their slowest statements.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not METRICS_SAMPLE_RATE or random.random() >= METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = request._metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        latency = time.perf_counter() - start
+
+        match = request.resolver_match
+        route = f'/{match.route}' if match else '<unmatched>'
+        REGISTRY.record(route, request.method, response.status_code, {
+            'request_duration_seconds': latency,
+            'db_queries': metrics.queries,
+            'db_duration_seconds': metrics.db_time,
+            'serialization_seconds': metrics.serialization_time,
+        })
+        if latency >= SLOW_REQUEST_THRESHOLD:
+            slowest = sorted(metrics.statements, reverse=True)[:MAX_LOGGED_QUERIES]
+            logger.warning(
+                "Slow request %s %s: %.0f ms, %d queries in %.0f ms\n%s",
+                request.method, request.get_full_path(), latency * 1000, metrics.queries, metrics.db_time * 1000,
+                '\n'.join(f'  {elapsed * 1000:.1f} ms: {sql}' for elapsed, sql in slowest),
+            )
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Lets Core.routers.ReplicaRouter send safe requests' reads to a replica,
+    and pins a user or session to the primary for REPLICA_PIN_SECONDS after
+    any write so they read their own changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request(request)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            end_request(request, token, response)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0003_product_stock_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('weight', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='Core.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'product'), name='unique_search_term_product')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0004_productsearchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetMembership',
+            fields=[
+                ('product_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('category_id', models.BigIntegerField()),
+                ('price_band', models.PositiveSmallIntegerField()),
+                ('in_stock', models.BooleanField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductFacetCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_band', models.PositiveSmallIntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_cells', to='Core.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_band', 'in_stock'), name='unique_facet_cell')],
+            },
+        ),
+    ]
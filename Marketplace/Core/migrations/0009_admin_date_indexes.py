@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0008_order_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['created_at'], name='Core_invent_created_72bad4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='Core_order_order_d_9cc4e7_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0009_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_deleted',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0010_product_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productfacetmembership',
+            name='category_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='productfacetmembership',
+            name='in_stock',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='productfacetmembership',
+            name='price_band',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+    ]
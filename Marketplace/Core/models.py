@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 
 class User(AbstractUser):
@@ -63,6 +67,25 @@ class Category(models.Model):
         ]
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_stock(self):
+        # Annotates total_stock: the product row's stock, or the sum of its counters when stock is sharded
+        shard_total = StockShard.objects.filter(product=OuterRef('pk')).values('product').annotate(
+            total=Sum('quantity')
+        ).values('total')
+        return self.annotate(total_stock=Case(
+            When(stock_shards=0, then=F('stock_quantity')),
+            default=Coalesce(Subquery(shard_total), 0),
+            output_field=models.PositiveIntegerField(),
+        ))
+
+
+class LiveProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    # Hides soft-deleted products from every listing, lookup and related manager; see Product.soft_delete
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -70,8 +93,16 @@ class Product(models.Model):
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products', limit_choices_to={'role': 'seller'})
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     stock_quantity = models.PositiveIntegerField(default=0)
+    # Number of StockShard counter rows holding this product's stock; 0 keeps it in stock_quantity
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set by soft_delete; purge_deleted_products removes the row and its dependents later. Indexed for the purge
+    is_deleted = models.BooleanField(default=False, db_index=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveProductManager()
+    all_objects = ProductQuerySet.as_manager()
 
     class Meta:
         indexes = [
@@ -88,6 +119,72 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} ({self.category.name})"
 
+    def soft_delete(self):
+        """
+        Take the product out of the catalog at once, leaving its order items,
+        inventory logs and reviews for purge_deleted_products to delete in
+        small batches instead of one long cascade.
+        """
+        self.is_deleted = True
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+
+    @property
+    def available_stock(self):
+        if not self.stock_shards:
+            return self.stock_quantity
+        if hasattr(self, 'total_stock'):
+            return self.total_stock
+        return self.stock_counters.aggregate(total=Sum('quantity'))['total'] or 0
+
+
+class StockShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_counters')
+    index = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'index'], name='unique_stock_shard')
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.index}: {self.quantity}"
+
+
+class ProductSearchTerm(models.Model):
+    # Inverted index over product names and descriptions, maintained by Core.search
+    term = models.CharField(max_length=40)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'product'], name='unique_search_term_product')
+        ]
+
+
+class ProductFacetCell(models.Model):
+    # Number of products per (category, price band, in stock) combination, maintained by Core.facets
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_cells')
+    price_band = models.PositiveSmallIntegerField()
+    in_stock = models.BooleanField()
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_band', 'in_stock'], name='unique_facet_cell')
+        ]
+
+
+class ProductFacetMembership(models.Model):
+    # The cell each product is currently counted in; a plain id so the row outlives a deleted product. The cell is
+    # null only while a recount holds the row of a product not counted anywhere yet
+    product_id = models.BigIntegerField(primary_key=True)
+    category_id = models.BigIntegerField(null=True)
+    price_band = models.PositiveSmallIntegerField(null=True)
+    in_stock = models.BooleanField(null=True)
+
 
 class InventoryLog(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_logs')
@@ -95,6 +192,12 @@ class InventoryLog(models.Model):
     reason = models.CharField(max_length=50, choices=[('restock', 'Restock'), ('order', 'Order'), ('manual', 'Manual')])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # For the admin's date hierarchy
+            models.Index(fields=['created_at']),
+        ]
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -115,6 +218,8 @@ class Order(models.Model):
         indexes = [
             models.Index(fields=['customer', 'order_date']),
             models.Index(fields=['status']),
+            # For the admin's date hierarchy, which does not filter by customer
+            models.Index(fields=['order_date']),
         ]
 
 
@@ -144,6 +249,65 @@ class OrderItem(models.Model):
         return f"{self.product.name} x {self.quantity} [{self.status}]"
 
 
+class SalesRollup(models.Model):
+    # A seller's revenue, units and orders per day, in total and per category and product, maintained by Core.analytics
+    DIMENSION_CHOICES = [
+        ('total', 'Total'),
+        ('category', 'Category'),
+        ('product', 'Product'),
+    ]
+
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales_rollups')
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    # Category or product id, 0 for the total; a plain id so sales outlive a deleted product
+    key = models.BigIntegerField(default=0)
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'dimension', 'key', 'day'], name='unique_sales_rollup')
+        ]
+
+
+class IdempotencyKey(models.Model):
+    # The response to a request sent with an Idempotency-Key header, replayed when a client retries it; see Core.idempotency
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and body, so a key reused for a different request is refused
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key')
+        ]
+
+
+class OrderEvent(models.Model):
+    # Transactional outbox: written in the checkout transaction, handled afterwards by run_order_worker; see Core.outbox
+    KIND_CHOICES = [
+        ('placed', 'Placed'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id']),
+        ]
+
+
         
 
 class Review(models.Model):
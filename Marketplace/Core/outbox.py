@@ -0,0 +1,94 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .analytics import record_sales
+from .catalog_cache import invalidate_products
+from .facets import refresh_products
+from .models import InventoryLog, OrderEvent, OrderItem
+
+logger = logging.getLogger('marketplace.order_worker')
+
+# Events handled per transaction by run_order_worker
+ORDER_EVENT_BATCH_SIZE = getattr(settings, 'ORDER_EVENT_BATCH_SIZE', 500)
+# Failed handlings before an event is left alone with its last_error for someone to look at
+ORDER_EVENT_MAX_ATTEMPTS = getattr(settings, 'ORDER_EVENT_MAX_ATTEMPTS', 5)
+
+HANDLERS = {}
+
+
+def handles(kind):
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+@handles('placed')
+def order_placed(events):
+    items = list(OrderItem.objects.filter(order_id__in=[event.order_id for event in events]).select_related('order', 'product'))
+    InventoryLog.objects.bulk_create([
+        InventoryLog(product_id=item.product_id, quantity_change=-item.quantity, reason='order') for item in items
+    ])
+    # Every item as it was placed, even if cancelled since: the cancellation took its own copy out of the rollups
+    record_sales(items)
+    # Stock moved without Product.save(), so the facets are not told by the model signals. Checkout invalidated the
+    # catalog cache already, but pages read since then hold the old counts: invalidate again once they are recounted
+    products = list({item.product_id: item.product for item in items}.values())
+    product_ids = sorted(product.pk for product in products)
+
+    def refresh():
+        try:
+            refresh_products(product_ids)
+        finally:
+            invalidate_products(products)
+    # Logged rather than raised, so it cannot fail the events this worker transaction already marked handled
+    transaction.on_commit(refresh, robust=True)
+
+
+def _handle(kind, events, now):
+    # Handle ``events`` together in a savepoint; returns whether that worked
+    try:
+        with transaction.atomic():
+            HANDLERS[kind](events)
+    except Exception as error:
+        logger.exception("Handling %d %r order events failed", len(events), kind)
+        for event in events:
+            event.last_error = f'{type(error).__name__}: {error}'
+        return False
+    for event in events:
+        event.processed_at, event.last_error = now, ''
+    return True
+
+
+def process_order_events(batch_size=None):
+    """
+    Handle up to ``batch_size`` pending order events, oldest first, and
+    return how many were taken. Each kind's events are handled together in
+    a savepoint; if that fails they are handled one at a time, so only the
+    events that fail on their own stay pending with attempts and last_error
+    updated, to be retried until ORDER_EVENT_MAX_ATTEMPTS.
+    Workers running at once skip each other's locked events where the
+    database supports it.
+    """
+    with transaction.atomic():
+        events = list(
+            OrderEvent.objects
+            .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .filter(processed_at__isnull=True, attempts__lt=ORDER_EVENT_MAX_ATTEMPTS)
+            .order_by('pk')[:batch_size or ORDER_EVENT_BATCH_SIZE]
+        )
+        by_kind = defaultdict(list)
+        for event in events:
+            by_kind[event.kind].append(event)
+        now = timezone.now()
+        for kind, group in by_kind.items():
+            if not _handle(kind, group, now) and len(group) > 1:
+                for event in group:
+                    _handle(kind, [event], now)
+            for event in group:
+                event.attempts += 1
+        OrderEvent.objects.bulk_update(events, ['processed_at', 'attempts', 'last_error'])
+    return len(events)
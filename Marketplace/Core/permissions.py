@@ -68,7 +68,6 @@ class IsAdminCustomerOrSellerForOrder(BasePermission):
 
 class IsAdminOrSellerForOrderStatus(BasePermission):
     def has_object_permission(self, request, view, obj):
-        print(f"User Role: {request.user.role}, Order ID: {obj.id}")
         if request.user.role == 'admin':
             return True
         if request.user.role == 'seller':
@@ -0,0 +1,43 @@
+import time
+
+from django.db import models, transaction
+from .models import Product
+
+
+def _dependents():
+    # Every model that cascades from Product: order items, inventory logs, reviews, stock shards, search terms, facets
+    return [
+        relation.related_model for relation in Product._meta.related_objects
+        if relation.on_delete is models.CASCADE and relation.field.name == 'product'
+    ]
+
+
+def purge_deleted_products(batch_size=500, pause=0.1, progress=None):
+    """
+    Physically delete soft-deleted products. Their dependent rows go first,
+    ``batch_size`` per transaction with ``pause`` seconds between batches so
+    checkout never waits long on the locks, then the product row itself.
+    A product restored meanwhile is left alone. Returns the number of
+    products purged; ``progress`` is called with each product's id and the
+    dependent rows deleted for it.
+    """
+    purged = 0
+    for product_id in list(Product.all_objects.filter(is_deleted=True).order_by('pk').values_list('pk', flat=True)):
+        deleted = 0
+        for model in _dependents():
+            # Re-checks the flag every batch, so a restored product stops losing rows
+            rows = model.objects.filter(product_id=product_id, product__is_deleted=True)
+            while True:
+                with transaction.atomic():
+                    batch = list(rows.values_list('pk', flat=True)[:batch_size])
+                    if batch:
+                        deleted += model.objects.filter(pk__in=batch).delete()[0]
+                if len(batch) < batch_size:
+                    break
+                time.sleep(pause)
+        with transaction.atomic():
+            _, counts = Product.all_objects.filter(pk=product_id, is_deleted=True).delete()
+        purged += counts.get(Product._meta.label, 0)
+        if progress:
+            progress(product_id, deleted)
+    return purged
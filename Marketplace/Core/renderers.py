@@ -0,0 +1,22 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that adds its encoding time to the request's metrics when the
+    request is sampled; the serializers' own time is added by
+    Core.metrics.TimedRepresentationMixin.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        request = (renderer_context or {}).get('request')
+        metrics = getattr(getattr(request, '_request', None), '_metrics', None)
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.serialization_time += time.perf_counter() - start
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.settings import api_settings
+
+# Aliases in DATABASES that serve the reads of safe requests; empty sends everything to the primary
+DATABASE_REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+# Seconds a user's requests keep reading from the primary after they write, to cover replication lag
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+# Alias the current request reads from; unset outside requests (commands, the order worker), which use the primary
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def _pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def _session_pin_key(session_key):
+    return f'db:pin:session:{session_key}'
+
+
+def token_user_id(request):
+    """
+    The user id claimed by the request's bearer token, without verifying it:
+    it only picks a database, and authentication checks the token later.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        payload = header[1].split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return claims.get(api_settings.USER_ID_CLAIM)
+    except (IndexError, ValueError, TypeError, AttributeError, binascii.Error):
+        return None
+
+
+def session_key(request, response=None):
+    """
+    The key of the request's session cookie (the Django admin's login), or
+    of the one ``response`` sets when the session was just created or cycled.
+    """
+    if response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+        return response.cookies[settings.SESSION_COOKIE_NAME].value or None
+    return request.COOKIES.get(settings.SESSION_COOKIE_NAME) or None
+
+
+def _pin_keys(request, response=None):
+    keys = []
+    user_id = token_user_id(request)
+    if user_id is not None:
+        keys.append(_pin_key(user_id))
+    key = session_key(request, response)
+    if key is not None:
+        keys.append(_session_pin_key(key))
+    return keys
+
+
+def start_request(request):
+    """
+    Pick the database the request reads from: a random replica for GET, HEAD
+    and OPTIONS unless the user, or session, wrote within
+    REPLICA_PIN_SECONDS, else the primary. Returns a token for end_request.
+    """
+    alias = DEFAULT_DB_ALIAS
+    if DATABASE_REPLICAS and request.method in ('GET', 'HEAD', 'OPTIONS'):
+        keys = _pin_keys(request)
+        if not keys or not cache.get_many(keys):
+            alias = random.choice(DATABASE_REPLICAS)
+    return _read_alias.set(alias)
+
+
+@contextmanager
+def reading_from_primary():
+    """
+    Send the reads inside to the primary, for values that are cached and
+    served to other requests, which a lagging replica must not build.
+    """
+    token = _read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _read_while_streaming(alias, content):
+    # Each chunk is made as the server sends it, after the middleware has returned, so set the alias around each one
+    content = iter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(content)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+def end_request(request, token, response=None):
+    """
+    Undo start_request, keeping its alias for the content of a streaming
+    ``response`` until it is sent, and pin the user and session of an unsafe
+    request to the primary. The session is the one the response leaves the
+    client with, so a login's next request reads the session it created.
+    """
+    if response is not None and response.streaming and not response.is_async:
+        response.streaming_content = _read_while_streaming(_read_alias.get(), response.streaming_content)
+    _read_alias.reset(token)
+    if DATABASE_REPLICAS and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        keys = _pin_keys(request, response)
+        if keys:
+            cache.set_many(dict.fromkeys(keys, True), REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of safe requests to the replica ReplicaMiddleware picked
+    for them, and everything else to the primary. A request reads from one
+    replica throughout, so its queries see one consistent state.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
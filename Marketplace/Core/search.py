@@ -0,0 +1,63 @@
+import re
+from collections import Counter
+
+from django.db.models import Q, Sum
+from .models import Product, ProductSearchTerm
+
+NAME_WEIGHT = 5
+DESCRIPTION_WEIGHT = 1
+# Repeating a word more often than this does not push a product further up
+MAX_TERM_FREQUENCY = 3
+MAX_TERM_LENGTH = ProductSearchTerm._meta.get_field('term').max_length
+STOP_WORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or',
+              'the', 'to', 'with'}
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def term_weights(product):
+    weights = Counter()
+    for field, weight in ((product.name, NAME_WEIGHT), (product.description, DESCRIPTION_WEIGHT)):
+        for term, frequency in Counter(tokenize(field)).items():
+            weights[term] += weight * min(frequency, MAX_TERM_FREQUENCY)
+    return weights
+
+
+def index_products(products):
+    """(Re)build the index rows of ``products`` with one delete and one bulk insert."""
+    products = list(products)
+    if not products:
+        return
+    ProductSearchTerm.objects.filter(product__in=products).delete()
+    ProductSearchTerm.objects.bulk_create([
+        ProductSearchTerm(term=term, product=product, weight=weight)
+        for product in products
+        for term, weight in term_weights(product).items()
+    ], batch_size=1000)
+
+
+def search_products(query, queryset=None):
+    """
+    Products matching any word of ``query`` annotated with a relevance
+    ``rank``: the summed weight of the matched terms, where name matches
+    outweigh description matches. The last word also matches as a prefix so
+    results follow the shopper as they type. Returns None for a query with no
+    searchable words.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return None
+    *whole, last = terms
+    matches = Q(search_terms__term__startswith=last)
+    if whole:
+        matches |= Q(search_terms__term__in=whole)
+    queryset = Product.objects.all() if queryset is None else queryset
+    # Filtering before annotating makes the sum run over the matched index rows only
+    return queryset.filter(matches).annotate(rank=Sum('search_terms__weight'))
@@ -0,0 +1,243 @@
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .analytics import counts_as_sale, record_sales
+from .facets import refresh_products
+from .models import Category, InventoryLog, Order, OrderItem, Product, Review, SellerProfile, User
+from .search import index_products
+
+WORDS = ['red', 'blue', 'green', 'black', 'running', 'leather', 'cotton', 'wool', 'classic', 'sport', 'slim',
+         'travel', 'winter', 'summer', 'shoe', 'shirt', 'jacket', 'bag', 'hat', 'watch', 'lamp', 'mug', 'chair']
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+# Most orders are old enough to have been delivered
+ORDER_STATUS_WEIGHTS = [10, 10, 15, 55, 10]
+ITEM_STATUSES = {'shipped': 'shipped', 'delivered': 'delivered', 'cancelled': 'cancelled'}
+REVIEW_COMMENTS = ['', 'Great value.', 'Arrived late.', 'Exactly as described.', 'Would buy again.', 'Poor quality.']
+RATING_WEIGHTS = [5, 5, 10, 30, 50]
+
+
+def _bulk_create(model, objects, batch_size=1000):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=batch_size)
+    # Backends such as MySQL leave bulk-created objects without primary keys; read the new rows back in insert order
+    last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    return list(model.objects.filter(pk__gt=last_pk).order_by('pk'))
+
+
+def _batches(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+@contextmanager
+def _explicit_timestamps(*fields):
+    # auto_now and auto_now_add would overwrite the back-dated timestamps
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Skewed:
+    """
+    Picks from ``population`` (integers, or a range) with Zipf weights of
+    exponent ``skew``, so a few members take most of the picks. Ranks are
+    shuffled so popularity does not follow the primary key. Members and
+    weights are kept in arrays, 16 bytes per member.
+    """
+
+    def __init__(self, rng, population, skew):
+        self.rng = rng
+        self.members = population if isinstance(population, (range, array)) else array('q', population)
+        self.ranked = array('q', self.members)
+        rng.shuffle(self.ranked)
+        self.cum_weights = array('d', accumulate(1 / rank ** skew for rank in range(1, len(self.ranked) + 1)))
+
+    def draw(self, k, start=None):
+        picks = self.rng.choices(self.ranked, cum_weights=self.cum_weights, k=k)
+        if start is not None:
+            # The first picks of a run go to every member in turn, so none is left without rows
+            for offset in range(max(0, min(k, len(self.members) - start))):
+                picks[offset] = self.members[start + offset]
+        return picks
+
+    def sample(self, k):
+        k = min(k, len(self.ranked))
+        picked = set()
+        while len(picked) < k:
+            picked.update(self.draw(k - len(picked)))
+        return list(picked)
+
+
+def seed_marketplace(sellers=5, products=250, customers=20, orders=100, items_per_order=(1, 8), categories=8,
+                     review_rate=0.2, history_days=365, skew=1.1, password='password123', prefix='seed', seed=0,
+                     batch_size=5000, progress=None):
+    """
+    Bulk-create a marketplace of the given size: one admin, sellers with
+    profiles, categories, products with restock logs, customers, and
+    ``orders`` orders spread over ``history_days`` with their items, stock
+    logs, sales rollups and reviews of ``review_rate`` of the items. Products
+    per seller and category, orders per customer and sales per product follow
+    Zipf-like ``skew``. Rows are written in transactions of ``batch_size`` so
+    millions can be generated; ``progress`` is called with a message after
+    each one. Every user gets ``password``.
+
+    Returns querysets of the created users, categories, products and orders.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    # One hash for every user; hashing per user would dominate the run time
+    hashed = make_password(password)
+
+    def report(message):
+        if progress:
+            progress(message)
+
+    def users(role, count):
+        for start, size in _batches(count, batch_size):
+            with transaction.atomic():
+                created = _bulk_create(User, [
+                    User(username=f'{prefix}_{role}_{i}', email=f'{prefix}_{role}_{i}@example.com', role=role,
+                         password=hashed, is_staff=role == 'admin',
+                         date_joined=now - timedelta(days=rng.uniform(0, history_days)))
+                    for i in range(start, start + size)
+                ], batch_size)
+                if role == 'seller':
+                    _bulk_create(SellerProfile, [
+                        SellerProfile(user=user, shop_name=f'{prefix} shop {user.username}',
+                                      contact_number=f'+1555{rng.randint(0, 9999999):07d}')
+                        for user in created
+                    ], batch_size)
+            report(f"{start + size} {role}s")
+        return User.objects.filter(role=role, username__startswith=f'{prefix}_{role}_').order_by('pk')
+
+    admin = users('admin', 1).get()
+    seller_users = users('seller', sellers)
+    customer_users = users('customer', customers)
+    with transaction.atomic():
+        _bulk_create(Category, [Category(name=f'{prefix} category {i}') for i in range(categories)])
+    category_objects = Category.objects.filter(name__startswith=f'{prefix} category ').order_by('pk')
+
+    product_timestamps = [Product._meta.get_field('created_at'), Product._meta.get_field('updated_at')]
+    seller_picks = Skewed(rng, seller_users.values_list('pk', flat=True), skew)
+    category_picks = Skewed(rng, category_objects.values_list('pk', flat=True), skew)
+    with _explicit_timestamps(*product_timestamps):
+        for start, size in _batches(products, batch_size):
+            listed = [now - timedelta(days=rng.uniform(0, history_days)) for _ in range(size)]
+            with transaction.atomic():
+                created = _bulk_create(Product, [
+                    Product(
+                        name=f"{' '.join(rng.sample(WORDS, 3)).capitalize()} {start + i}",
+                        description=' '.join(rng.choices(WORDS, k=12)),
+                        category_id=category_id,
+                        seller_id=seller_id,
+                        # Mostly cheap, with a long tail of expensive products
+                        price=Decimal(max(1.0, min(rng.lognormvariate(3.5, 1.0), 99999.0))).quantize(Decimal('0.01')),
+                        stock_quantity=rng.choice([0, rng.randint(1, 20), rng.randint(1, 500)]),
+                        created_at=listed[i],
+                        updated_at=listed[i],
+                    )
+                    for i, (seller_id, category_id) in enumerate(zip(
+                        seller_picks.draw(size, start), category_picks.draw(size, start)
+                    ))
+                ], batch_size)
+                _bulk_create(InventoryLog, [
+                    InventoryLog(product=product, quantity_change=product.stock_quantity, reason='restock')
+                    for product in created if product.stock_quantity
+                ], batch_size)
+                # bulk_create skips the model signals that normally keep these up to date
+                index_products(created)
+                refresh_products([product.pk for product in created])
+            report(f"{start + size} products")
+
+    product_objects = Product.objects.filter(seller__in=seller_users).order_by('pk')
+    # Just the columns order items and the sales rollups read, by position: a few dozen bytes per product
+    product_ids, prices, product_sellers, product_categories = array('q'), array('q'), array('q'), array('q')
+    for pk, price, seller_id, category_id in product_objects.values_list(
+        'pk', 'price', 'seller_id', 'category_id'
+    ).iterator(chunk_size=batch_size):
+        product_ids.append(pk)
+        prices.append(int(price * 100))
+        product_sellers.append(seller_id)
+        product_categories.append(category_id)
+
+    def price_of(position):
+        return Decimal(prices[position]).scaleb(-2)
+
+    product_picks = Skewed(rng, range(len(product_ids)), skew)
+    customer_picks = Skewed(rng, customer_users.values_list('pk', flat=True), skew)
+    first_order = (Order.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    order_timestamps = [Order._meta.get_field('order_date'), Order._meta.get_field('updated_at'),
+                        Review._meta.get_field('created_at')]
+    with _explicit_timestamps(*order_timestamps):
+        for start, size in _batches(orders, batch_size):
+            carts = []
+            for customer_id in customer_picks.draw(size, start):
+                # Weighted towards recent days, like a growing shop
+                placed = now - timedelta(days=history_days * rng.random() ** 2)
+                cart = [(position, rng.randint(1, 3)) for position in product_picks.sample(rng.randint(*items_per_order))]
+                carts.append((customer_id, placed, cart))
+            with transaction.atomic():
+                created = _bulk_create(Order, [
+                    Order(customer_id=customer_id, order_date=placed, updated_at=placed,
+                          status=rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0], is_paid=rng.random() < 0.7,
+                          total_amount=sum(price_of(position) * quantity for position, quantity in cart))
+                    for customer_id, placed, cart in carts
+                ], batch_size)
+                items = [
+                    OrderItem(order=order, product_id=product_ids[position], quantity=quantity,
+                              price=price_of(position), status=ITEM_STATUSES.get(order.status, 'pending'))
+                    for order, (_, _, cart) in zip(created, carts)
+                    for position, quantity in cart
+                ]
+                _bulk_create(OrderItem, items, batch_size)
+                sold = [item for item in items if counts_as_sale(item.order, item)]
+                # The sales rollups read each item's product: unsaved stand-ins for just this batch's
+                stand_ins = {
+                    product_ids[position]: Product(pk=product_ids[position], seller_id=product_sellers[position],
+                                                   category_id=product_categories[position])
+                    for _, _, cart in carts for position, _ in cart
+                }
+                for item in sold:
+                    item.product = stand_ins[item.product_id]
+                record_sales(sold)
+                _bulk_create(InventoryLog, [
+                    InventoryLog(product_id=product_ids[position], quantity_change=-quantity, reason='order')
+                    for _, _, cart in carts
+                    for position, quantity in cart
+                ], batch_size)
+                reviews = {}
+                for customer_id, placed, cart in carts:
+                    for position, _ in cart:
+                        if rng.random() < review_rate:
+                            reviews[product_ids[position], customer_id] = Review(
+                                product_id=product_ids[position], customer_id=customer_id,
+                                rating=rng.choices(range(1, 6), RATING_WEIGHTS)[0],
+                                comment=rng.choice(REVIEW_COMMENTS),
+                                created_at=placed + timedelta(days=rng.uniform(1, 30)),
+                            )
+                # A customer reviews a product once however often they bought it
+                Review.objects.bulk_create(reviews.values(), batch_size=batch_size, ignore_conflicts=True)
+            report(f"{start + size} orders")
+
+    return {
+        'admin': admin,
+        'sellers': seller_users,
+        'customers': customer_users,
+        'categories': category_objects,
+        'products': product_objects,
+        'orders': Order.objects.filter(pk__gte=first_order, customer__in=customer_users).order_by('pk'),
+    }
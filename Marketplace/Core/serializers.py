@@ -1,6 +1,17 @@
 from rest_framework import serializers
 from .models import User, SellerProfile
 from django.db import transaction
+from .hashing import hash_password
+
+
+def create_user(validated_data):
+    # As User.objects.create_user, with the password hashed on the hashing pool
+    return User.objects.create(
+        username=User.normalize_username(validated_data['username']),
+        email=User.objects.normalize_email(validated_data['email']),
+        password=hash_password(validated_data['password']),
+        role=validated_data['role'],
+    )
 
 class CustomerSignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
@@ -15,13 +26,7 @@ class CustomerSignupSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
-            role=validated_data['role']
-        )
-        return user
+        return create_user(validated_data)
 
 class SellerSignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
@@ -47,12 +52,7 @@ class SellerSignupSerializer(serializers.ModelSerializer):
         contact_number = validated_data.pop('contact_number', '')
         address = validated_data.pop('address', '')
         
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
-            role=validated_data['role']
-        )
+        user = create_user(validated_data)
         
         SellerProfile.objects.create(
             user=user,
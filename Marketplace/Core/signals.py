@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from . import authentication, catalog_cache, facets, search
+from .models import Category, Product, User
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_placement(sender, instance, **kwargs):
+    # A product moved to another category or seller must also leave the old one's cached pages
+    instance._previous_placement = None
+    if instance.pk:
+        instance._previous_placement = Product.objects.filter(pk=instance.pk).values('category_id', 'seller_id').first()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_product(sender, instance, **kwargs):
+    # Copies, as Django clears instance.pk after a delete, before the callback of an outer transaction runs
+    pk = instance.pk
+    products = [Product(pk=pk, category_id=instance.category_id, seller_id=instance.seller_id)]
+    previous = getattr(instance, '_previous_placement', None)
+    if previous:
+        products.append(Product(pk=pk, **previous))
+
+    # Wait for the commit so a concurrent read cannot cache the old row under the new version. Facets are
+    # recounted first (after the commit, so their rows are only locked for as long as that takes) and the cache
+    # invalidated last, or a request in between would cache the old counts under the new version
+    def refresh():
+        try:
+            facets.refresh_products([pk])
+        finally:
+            catalog_cache.invalidate_products(products)
+    # Robust: the write has committed, so a failed recount is logged (rebuild_facets repairs it), not raised
+    transaction.on_commit(refresh, robust=True)
+
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'description'} & set(update_fields):
+        search.index_products([instance])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    transaction.on_commit(catalog_cache.invalidate_categories)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    pk = instance.pk
+    # Tokens are checked against the cached state, so a deactivation or role change must reach it
+    transaction.on_commit(lambda: authentication.forget_user_state(pk))
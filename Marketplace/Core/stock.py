@@ -0,0 +1,144 @@
+import random
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from .models import Product, StockShard
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available):
+        # Maps each product id that could not be reserved to the quantity still available
+        self.available = available
+        super().__init__(f"Insufficient stock for products: {sorted(available)}")
+
+
+def reserve_stock(quantities):
+    """
+    Take ``quantities`` ({product_id: quantity}) out of stock atomically.
+
+    The cart's product rows are locked in primary key order, so overlapping
+    carts always queue in the same order and cannot deadlock, and the stock is
+    then decremented by one conditional UPDATE that only matches rows which
+    still hold enough units. Products with sharded stock skip the product row
+    lock and take their units from one of their counter rows instead. Either
+    every product is reserved or nothing changes and InsufficientStock is
+    raised.
+    """
+    if not quantities:
+        return
+    product_ids = sorted(quantities)
+
+    with transaction.atomic():
+        available = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in=product_ids, stock_shards=0)
+            .order_by('pk')
+            .values_list('pk', 'stock_quantity')
+        )
+        short = {pk: stock for pk, stock in available.items() if stock < quantities[pk]}
+        if short:
+            raise InsufficientStock(short)
+
+        conflict = False
+        if available:
+            amount = Case(
+                *[When(pk=pk, then=Value(quantities[pk])) for pk in available],
+                output_field=IntegerField(),
+            )
+            updated = Product.objects.filter(pk__in=list(available), stock_quantity__gte=amount).update(
+                stock_quantity=F('stock_quantity') - amount,
+                updated_at=timezone.now(),
+            )
+            # Only short on backends without row locks
+            conflict = updated != len(available)
+
+        # Anything the lock did not return is either sharded or missing; the counters tell the two apart
+        for pk in product_ids:
+            if conflict:
+                break
+            if pk not in available:
+                conflict = not _reserve_from_shards(pk, quantities[pk])
+
+        if conflict:
+            transaction.set_rollback(True)
+
+    if conflict:
+        stock = dict(Product.objects.with_stock().filter(pk__in=product_ids).values_list('pk', 'total_stock'))
+        raise InsufficientStock({
+            pk: stock.get(pk, 0) for pk in product_ids if stock.get(pk, 0) < quantities[pk]
+        })
+
+
+def _reserve_from_shards(product_id, quantity):
+    candidates = list(
+        StockShard.objects.filter(product_id=product_id, quantity__gte=quantity).values_list('index', flat=True)
+    )
+    random.shuffle(candidates)
+    for index in candidates:
+        # Spreading orders over random counters keeps parallel checkouts off the same row
+        if StockShard.objects.filter(product_id=product_id, index=index, quantity__gte=quantity).update(
+            quantity=F('quantity') - quantity
+        ):
+            return True
+
+    # No single counter can cover the order: lock them all and drain across them
+    shards = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('index'))
+    total = sum(shard.quantity for shard in shards)
+    if total < quantity:
+        return False
+    for shard in shards:
+        taken = min(shard.quantity, quantity)
+        shard.quantity -= taken
+        quantity -= taken
+    StockShard.objects.bulk_update(shards, ['quantity'])
+    return True
+
+
+def _split(total, shards):
+    base, extra = divmod(total, shards)
+    return [base + (1 if index < extra else 0) for index in range(shards)]
+
+
+@transaction.atomic
+def set_sharding(product_id, shards):
+    """
+    Move a product's stock onto ``shards`` counter rows, or back onto the
+    product row when ``shards`` is 0, keeping the total unchanged.
+    """
+    product = Product.objects.select_for_update().get(pk=product_id)
+    counters = StockShard.objects.select_for_update().filter(product=product).order_by('index')
+    total = sum(counter.quantity for counter in counters) if product.stock_shards else product.stock_quantity
+
+    StockShard.objects.filter(product=product).delete()
+    if shards:
+        StockShard.objects.bulk_create([
+            StockShard(product=product, index=index, quantity=quantity)
+            for index, quantity in enumerate(_split(total, shards))
+        ])
+    product.stock_shards = shards
+    product.stock_quantity = 0 if shards else total
+    product.save(update_fields=['stock_shards', 'stock_quantity', 'updated_at'])
+    return product
+
+
+def add_stock(product, quantity):
+    """Restock a product; sharded products take the units on one random counter."""
+    if not product.stock_shards:
+        Product.objects.filter(pk=product.pk).update(stock_quantity=F('stock_quantity') + quantity)
+        return
+    index = random.randrange(product.stock_shards)
+    StockShard.objects.filter(product=product, index=index).update(quantity=F('quantity') + quantity)
+
+
+@transaction.atomic
+def set_stock(product, quantity):
+    """Overwrite a product's total stock, spreading it evenly over its counters when sharded."""
+    if not product.stock_shards:
+        Product.objects.filter(pk=product.pk).update(stock_quantity=quantity)
+        return
+    shards = list(StockShard.objects.select_for_update().filter(product=product).order_by('index'))
+    for shard, share in zip(shards, _split(quantity, len(shards))):
+        shard.quantity = share
+    StockShard.objects.bulk_update(shards, ['quantity'])
+
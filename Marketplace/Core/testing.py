@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .seed import seed_marketplace
+
+PERF_BASELINE_PATH = getattr(settings, 'PERF_BASELINE_PATH', settings.BASE_DIR / 'perf_baseline.json')
+# A timing fails once it exceeds baseline * PERF_TOLERANCE + PERF_SLACK seconds
+PERF_TOLERANCE = getattr(settings, 'PERF_TOLERANCE', 3)
+PERF_SLACK = getattr(settings, 'PERF_SLACK', 0.05)
+TIMING_RUNS = 5
+
+
+def timings_enabled():
+    # Wall-clock limits depend on the machine, so they are only checked (or recorded) when asked for
+    return bool(os.environ.get('CHECK_PERF_BASELINE') or os.environ.get('UPDATE_PERF_BASELINE'))
+
+
+def load_baseline():
+    try:
+        with open(PERF_BASELINE_PATH) as baseline:
+            return json.load(baseline)
+    except FileNotFoundError:
+        return {}
+
+
+class MarketplaceTestRunner(DiscoverRunner):
+    """
+    Runs the suite with the marketplace.* loggers (slow requests, the order
+    worker, throttling) muted; tests that expect a log check it with
+    assertLogs, which still sees every record.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        logger = logging.getLogger('marketplace')
+        self.saved_logging = logger.handlers, logger.propagate
+        logger.handlers, logger.propagate = [logging.NullHandler()], False
+
+    def teardown_test_environment(self, **kwargs):
+        logger = logging.getLogger('marketplace')
+        logger.handlers, logger.propagate = self.saved_logging
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Seeds a realistically sized marketplace once per class and checks that
+    each endpoint runs in a fixed number of queries however large the page or
+    the orders on it are. Query budgets always apply; with
+    CHECK_PERF_BASELINE=1 the median time of every checked request is also
+    compared with PERF_BASELINE_PATH, and UPDATE_PERF_BASELINE=1 rewrites
+    the baseline from the current timings.
+    """
+    seed_options = {'sellers': 4, 'products': 160, 'customers': 8, 'orders': 64, 'items_per_order': (1, 8)}
+    timings = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(**cls.seed_options)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.timings = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.environ.get('UPDATE_PERF_BASELINE') and cls.timings:
+            baseline = load_baseline()
+            baseline.update(cls.timings)
+            with open(PERF_BASELINE_PATH, 'w') as output:
+                json.dump(dict(sorted(baseline.items())), output, indent=2)
+                output.write('\n')
+        super().tearDownClass()
+
+    def request(self, method, url, user=None, data=None):
+        # Every request starts cold so cached endpoints are measured on the database path
+        cache.clear()
+        api = APIClient()
+        if user is not None:
+            api.force_authenticate(user)
+        return getattr(api, method)(url, data, format='json')
+
+    def count_queries(self, method, url, user=None, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request(method, url, user, data)
+        return response, len(queries)
+
+    def assertQueryBudget(self, budget, *urls, user=None, status=200):
+        """GET each of ``urls``, which must all run in the same number of queries, at most ``budget``."""
+        self.assertRequestBudget(budget, 'get', [(url, None) for url in urls], user=user, status=status)
+
+    def assertRequestBudget(self, budget, method, requests, user=None, status=200):
+        """
+        Send each (url, data) of ``requests``, rolling back any writes; they
+        must all run in the same number of queries, at most ``budget``.
+        """
+        counts = []
+        for url, data in requests:
+            with transaction.atomic():
+                response, count = self.count_queries(method, url, user, data)
+                transaction.set_rollback(True)
+            self.assertEqual(response.status_code, status, f'{method} {url}: {response.content[:300]}')
+            counts.append(count)
+        self.assertEqual(len(set(counts)), 1, f"Query count depends on the data: {counts}")
+        self.assertLessEqual(counts[0], budget)
+        url, data = requests[-1]
+        self.assertWithinBaseline(lambda: self.request(method, url, user, data))
+
+    def assertWithinBaseline(self, run, name=None):
+        """Time ``run`` against the baseline stored under ``name`` (the test id by default)."""
+        if not timings_enabled():
+            return
+        if name is None:
+            # Numbered when a test checks several requests
+            calls = sum(1 for key in self.timings if key.split('#')[0] == self.id())
+            name = f'{self.id()}#{calls + 1}' if calls else self.id()
+        durations = []
+        for _ in range(TIMING_RUNS):
+            # Rolled back so writes are timed against the same data every run
+            with transaction.atomic():
+                start = time.perf_counter()
+                run()
+                durations.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+        median = statistics.median(durations)
+        self.timings[name] = round(median, 5)
+        expected = load_baseline().get(name)
+        if expected is not None and not os.environ.get('UPDATE_PERF_BASELINE'):
+            limit = expected * PERF_TOLERANCE + PERF_SLACK
+            self.assertLessEqual(median, limit, f"{name} took {median:.3f}s, baseline {expected:.3f}s")
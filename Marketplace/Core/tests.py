@@ -1,3 +1,1169 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, F, Sum
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication, catalog_cache, facets, hashing, routers
+from .analytics import sales_summary
+from .imports import import_products
+from .loadtest import LoadTest, percentile
+from .metrics import REGISTRY
+from .outbox import ORDER_EVENT_MAX_ATTEMPTS, order_placed, process_order_events
+from .purge import purge_deleted_products
+from .models import (
+    Category, IdempotencyKey, InventoryLog, Order, OrderEvent, OrderItem, Product, ProductFacetCell,
+    ProductFacetMembership, Review, SalesRollup, SellerProfile, User,
+)
+from .search import NAME_WEIGHT, search_products
+from .seed import seed_marketplace
+from .testing import QueryBudgetTestCase
+from .stock import InsufficientStock, reserve_stock, set_sharding
+from .throttling import CacheStore, SQLiteStore, SlidingWindowThrottle
+
+
+def create_products(count, stock_quantity):
+    seller = User.objects.create_user('stock_seller', 'stock_seller@example.com', 'password123', role='seller')
+    category = Category.objects.create(name='Stock')
+    return [
+        Product.objects.create(name=f'Product {i}', category=category, seller=seller, price=10, stock_quantity=stock_quantity)
+        for i in range(count)
+    ]
+
+
+class ReserveStockTests(TestCase):
+    def setUp(self):
+        self.first, self.second = create_products(2, stock_quantity=5)
+
+    def test_reserves_every_product(self):
+        reserve_stock({self.first.pk: 2, self.second.pk: 5})
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.stock_quantity, 3)
+        self.assertEqual(self.second.stock_quantity, 0)
+
+    def test_shortage_reserves_nothing(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            reserve_stock({self.first.pk: 2, self.second.pk: 6})
+        self.assertEqual(ctx.exception.available, {self.second.pk: 5})
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock_quantity, 5)
+
+    def test_unknown_product_is_unavailable(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            reserve_stock({self.first.pk: 1, 0: 1})
+        self.assertEqual(ctx.exception.available, {0: 0})
+
+
+class ConcurrentReservationStressTests(TransactionTestCase):
+    """Hammers reserve_stock from several threads and checks no unit is ever sold twice."""
+
+    threads = 8
+    carts_per_thread = 25
+    initial_stock = 40
+
+    def test_concurrent_checkouts_never_oversell(self):
+        products = create_products(4, stock_quantity=self.initial_stock)
+        product_ids = [product.pk for product in products]
+        reserved = Counter()
+        failures = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def checkout(seed):
+            rng = random.Random(seed)
+            try:
+                barrier.wait()
+                for _ in range(self.carts_per_thread):
+                    # Random subsets in random order so overlapping carts would deadlock without lock ordering
+                    cart = {pk: rng.randint(1, 3) for pk in rng.sample(product_ids, rng.randint(1, len(product_ids)))}
+                    try:
+                        with transaction.atomic():
+                            reserve_stock(cart)
+                    except InsufficientStock:
+                        continue
+                    with lock:
+                        reserved.update(cart)
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=checkout, args=(seed,)) for seed in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(failures, [])
+        stock = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock_quantity'))
+        for pk in product_ids:
+            self.assertGreaterEqual(stock[pk], 0)
+            self.assertEqual(self.initial_stock - stock[pk], reserved[pk])
+        # Demand far exceeds supply, so the products must have sold out rather than the test passing trivially
+        self.assertLess(sum(stock.values()), len(product_ids) * 3)
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        self.plain, self.hot = create_products(2, stock_quantity=10)
+        set_sharding(self.hot.pk, 4)
+
+    def test_sharding_keeps_the_total(self):
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock_quantity, 0)
+        self.assertEqual(self.hot.available_stock, 10)
+        self.assertEqual(Product.objects.with_stock().get(pk=self.hot.pk).total_stock, 10)
+
+    def test_reservation_spans_plain_and_sharded_products(self):
+        # 6 units is more than any single counter holds, forcing the drain-across path
+        reserve_stock({self.plain.pk: 1, self.hot.pk: 6})
+        self.assertEqual(Product.objects.with_stock().get(pk=self.hot.pk).total_stock, 4)
+        with self.assertRaises(InsufficientStock) as ctx:
+            reserve_stock({self.plain.pk: 1, self.hot.pk: 5})
+        self.assertEqual(ctx.exception.available, {self.hot.pk: 4})
+        self.plain.refresh_from_db()
+        self.assertEqual(self.plain.stock_quantity, 9)
+
+    def test_unsharding_merges_counters(self):
+        reserve_stock({self.hot.pk: 3})
+        set_sharding(self.hot.pk, 0)
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock_quantity, 7)
+        self.assertFalse(self.hot.stock_counters.exists())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user('page_seller', 'page_seller@example.com', 'password123', role='seller')
+        category = Category.objects.create(name='Paging')
+        # Repeated prices so the id tiebreaker decides positions within a price
+        Product.objects.bulk_create([
+            Product(name=f'Product {i:02d}', category=category, seller=seller, price=i % 3, stock_quantity=1)
+            for i in range(23)
+        ])
+        self.api = APIClient()
+        self.api.force_authenticate(seller)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.api.get(url).json()
+            pages.append([product['id'] for product in data['results']])
+            url = data[link]
+        return pages
+
+    def test_pages_cover_every_row_once_in_both_directions(self):
+        forward = self.walk('/api/seller/inventory/?sort_by=-price&page_size=5', 'next')
+        ids = [pk for page in forward for pk in page]
+        expected = list(Product.objects.order_by('-price', '-pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual([len(page) for page in forward], [5, 5, 5, 5, 3])
+
+        last_page_url = self.api.get('/api/seller/inventory/', {'sort_by': '-price', 'page_size': 5}).json()['next']
+        for _ in range(3):
+            last_page_url = self.api.get(last_page_url).json()['next']
+        backward = self.walk(last_page_url, 'previous')
+        self.assertEqual(backward[::-1], forward)
+
+    def test_counts_are_opt_in(self):
+        self.assertIsNone(self.api.get('/api/seller/inventory/').json()['count'])
+        self.assertEqual(self.api.get('/api/seller/inventory/?count=exact').json()['count'], 23)
+        self.assertEqual(self.api.get('/api/seller/inventory/?count=estimate').json()['count'], 23)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.api.get('/api/seller/inventory/?cursor=bogus').status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product, = create_products(1, stock_quantity=5)
+        self.api = APIClient()
+
+    def test_detail_is_served_from_cache_until_the_product_changes(self):
+        url = f'/api/seller/products/{self.product.pk}/'
+        self.assertEqual(self.api.get(url).json()['price'], '10.00')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get(url).json()['price'], '10.00')
+
+        self.product.price = 12
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.api.get(url).json()['price'], '12.00')
+
+    def test_order_stock_changes_invalidate_listings(self):
+        self.assertEqual(self.api.get('/api/customer/products/').json()['results'][0]['stock_quantity'], 5)
+        reserve_stock({self.product.pk: 2})
+        catalog_cache.invalidate_products([self.product])
+        self.assertEqual(self.api.get('/api/customer/products/').json()['results'][0]['stock_quantity'], 3)
+
+    def test_only_one_caller_rebuilds_a_missing_entry(self):
+        cache.add('catalog:test:lock', 1)
+        builds = []
+        threading.Timer(0.1, lambda: cache.set('catalog:test', ('fresh', float('inf')))).start()
+        self.assertEqual(catalog_cache.get_or_build('catalog:test', lambda: builds.append(1)), 'fresh')
+        self.assertEqual(builds, [])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user('search_seller', 'search_seller@example.com', 'password123', role='seller')
+        category = Category.objects.create(name='Search')
+        self.shoe = Product.objects.create(name='Red running shoe', description='Light shoe', category=category,
+                                           seller=seller, price=50, stock_quantity=3)
+        self.shirt = Product.objects.create(name='Blue shirt', description='Red buttons', category=category,
+                                            seller=seller, price=20, stock_quantity=3)
+        self.api = APIClient()
+
+    def search(self, query):
+        response = self.api.get('/api/customer/products/search/', {'q': query})
+        return [product['id'] for product in response.json()['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('red'), [self.shoe.pk, self.shirt.pk])
+
+    def test_last_word_matches_as_a_prefix(self):
+        self.assertEqual(self.search('runn'), [self.shoe.pk])
+
+    def test_index_follows_product_edits(self):
+        self.shirt.name = 'Blue running top'
+        self.shirt.save()
+        self.assertEqual(search_products('running').get(pk=self.shirt.pk).rank, NAME_WEIGHT)
+
+    def test_query_without_searchable_words_is_rejected(self):
+        self.assertEqual(self.api.get('/api/customer/products/search/', {'q': 'a the'}).status_code, 400)
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user('facet_seller', 'facet_seller@example.com', 'password123', role='seller')
+        self.shoes = Category.objects.create(name='Shoes')
+        self.hats = Category.objects.create(name='Hats')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boot = Product.objects.create(name='Boot', category=self.shoes, seller=seller, price=60, stock_quantity=2)
+            Product.objects.create(name='Sandal', category=self.shoes, seller=seller, price=20, stock_quantity=0)
+            Product.objects.create(name='Cap', category=self.hats, seller=seller, price=15, stock_quantity=4)
+        self.api = APIClient()
+
+    def facets(self, **params):
+        return self.api.get('/api/customer/products/', params).json()['facets']
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets(category=self.shoes.pk)
+        # In-stock only by default, so the sandal is left out of the other facets
+        self.assertEqual([(row['name'], row['count']) for row in facets['category']], [('Hats', 1), ('Shoes', 1)])
+        self.assertEqual([(row['band'], row['count']) for row in facets['price_band']], [(2, 1)])
+        self.assertEqual([(row['value'], row['count']) for row in facets['in_stock']], [(False, 1), (True, 1)])
+
+    def test_counts_follow_product_changes(self):
+        self.boot.price = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boot.save()
+        facets = self.facets(price_band=0)
+        self.assertEqual([(row['name'], row['count']) for row in facets['category']], [('Hats', 1), ('Shoes', 1)])
+        self.assertEqual(
+            [product['name'] for product in self.api.get('/api/customer/products/', {'price_band': 0}).json()['results']],
+            ['Boot', 'Cap'],
+        )
+
+    def test_a_read_during_the_recount_does_not_cache_old_counts(self):
+        self.facets()
+        recount = facets.refresh_products
+
+        def racing_recount(product_ids):
+            # A request landing after the commit but before the facets are recounted
+            self.facets()
+            recount(product_ids)
+
+        self.boot.stock_quantity = 0
+        with mock.patch('Core.facets.refresh_products', side_effect=racing_recount):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.boot.save()
+        self.assertEqual([(row['value'], row['count']) for row in self.facets()['in_stock']], [(False, 2), (True, 1)])
+
+    def test_deleting_in_a_transaction_retires_the_product(self):
+        scopes = [f'product:{self.boot.pk}', f'category:{self.shoes.pk}', f'seller:{self.boot.seller_id}']
+        versions = catalog_cache.get_versions(scopes)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.boot.delete()
+        self.assertTrue(all(new != old for new, old in zip(catalog_cache.get_versions(scopes), versions)))
+        self.assertEqual([(row['value'], row['count']) for row in self.facets()['in_stock']], [(False, 1), (True, 1)])
+
+    def test_an_import_recounts_before_retiring_cached_counts(self):
+        self.facets()
+        recount = facets.refresh_products
+
+        def racing_recount(product_ids):
+            self.facets()
+            recount(product_ids)
+
+        rows = [{'name': 'Boot', 'price': '60', 'stock_quantity': '0', 'category_id': str(self.shoes.pk)}]
+        with mock.patch('Core.facets.refresh_products', side_effect=racing_recount):
+            with self.captureOnCommitCallbacks(execute=True):
+                list(import_products(rows, self.boot.seller))
+        self.assertEqual([(row['value'], row['count']) for row in self.facets()['in_stock']], [(False, 2), (True, 1)])
+
+    def test_unknown_price_band_is_rejected(self):
+        self.assertEqual(self.api.get('/api/customer/products/', {'price_band': 99}).status_code, 400)
+
+    def test_a_failed_recount_still_retires_the_cached_pages(self):
+        scopes = [f'product:{self.boot.pk}']
+        versions = catalog_cache.get_versions(scopes)
+        self.boot.price = 10
+        # The save has committed when the recount runs, so its failure is logged rather than raised to the caller
+        with mock.patch('Core.facets.refresh_products', side_effect=OperationalError('lock wait timeout')), \
+                self.assertLogs(level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.boot.save()
+        self.assertNotEqual(catalog_cache.get_versions(scopes), versions)
+
+
+class ConcurrentFacetRefreshTests(TransactionTestCase):
+    threads = 4
+
+    def test_a_new_product_is_counted_once(self):
+        product, = create_products(1, stock_quantity=3)
+        ProductFacetMembership.objects.all().delete()
+        ProductFacetCell.objects.all().delete()
+        failures = []
+        barrier = threading.Barrier(self.threads)
+
+        def recount():
+            try:
+                barrier.wait()
+                facets.refresh_products([product.pk])
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=recount) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(failures, [])
+        self.assertEqual(list(ProductFacetCell.objects.values_list('product_count', flat=True)), [1])
+        membership = ProductFacetMembership.objects.get()
+        self.assertEqual((membership.product_id, membership.in_stock), (product.pk, True))
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product, = create_products(1, stock_quantity=5)
+        self.api = APIClient()
+
+    def test_picked_fields_only(self):
+        data = self.api.get(f'/api/seller/products/{self.product.pk}/', {'fields': 'id,name,category'}).json()
+        # Nested serializers collapse to their primary key unless expanded
+        self.assertEqual(data, {'id': self.product.pk, 'name': 'Product 0', 'category': self.product.category_id})
+
+    def test_expand_and_dotted_fields_keep_nested_serializers(self):
+        url = f'/api/seller/products/{self.product.pk}/'
+        data = self.api.get(url, {'fields': 'id,category', 'expand': 'category'}).json()
+        self.assertEqual(data['category'], {'id': self.product.category_id, 'name': 'Stock'})
+        data = self.api.get(url, {'fields': 'category.name'}).json()
+        self.assertEqual(data, {'category': {'name': 'Stock'}})
+
+    def test_sparse_listing_selects_fewer_columns(self):
+        with self.assertNumQueries(1) as ctx:
+            self.api.get('/api/seller/products/', {'fields': 'id,price'})
+        sql = ctx.captured_queries[0]['sql']
+        self.assertNotIn('description', sql)
+        self.assertNotIn('JOIN', sql)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        REGISTRY.reset()
+        self.product, = create_products(1, stock_quantity=5)
+        self.api = APIClient()
+
+    def test_requests_are_recorded_per_route(self):
+        self.api.get(f'/api/seller/products/{self.product.pk}/')
+        body = self.api.get('/metrics').content.decode()
+        labels = 'route="/api/seller/products/<int:pk>/",method="GET"'
+        self.assertIn(f'marketplace_requests_total{{{labels},status="200"}} 1', body)
+        self.assertIn(f'marketplace_db_queries_count{{{labels}}} 1', body)
+        self.assertIn(f'marketplace_serialization_seconds_bucket{{{labels},le="+Inf"}} 1', body)
+
+    def test_serialization_includes_the_serializers(self):
+        represent = serializers.Serializer.to_representation
+
+        def slow_representation(serializer, instance):
+            time.sleep(0.02)
+            return represent(serializer, instance)
+
+        with mock.patch.object(serializers.Serializer, 'to_representation', slow_representation):
+            self.api.get('/api/seller/products/')
+        body = self.api.get('/metrics').content.decode()
+        labels = 'route="/api/seller/products/",method="GET"'
+        total, = [line.split()[-1] for line in body.splitlines()
+                  if line.startswith(f'marketplace_serialization_seconds_sum{{{labels}}}')]
+        # The product and its nested category
+        self.assertGreaterEqual(float(total), 0.04)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with mock.patch('Core.middleware.SLOW_REQUEST_THRESHOLD', 0), self.assertLogs('marketplace.slow_requests') as logs:
+            self.api.get(f'/api/seller/products/{self.product.pk}/')
+        self.assertIn('Core_product', logs.output[0])
+
+    def test_metrics_are_not_served_to_other_hosts(self):
+        self.assertEqual(self.api.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 404)
+
+
+class SeedMarketplaceTests(TestCase):
+    def seed(self, **options):
+        options = {'sellers': 3, 'customers': 10, 'categories': 4, 'products': 90, 'orders': 60, 'batch_size': 25,
+                   'stdout': StringIO(), **options}
+        call_command('seed_marketplace', **options)
+
+    def test_generates_every_table_in_batches(self):
+        self.seed()
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 14)
+        self.assertEqual(Product.objects.count(), 90)
+        self.assertEqual(Order.objects.count(), 60)
+        self.assertTrue(Review.objects.exists())
+        self.assertTrue(Order.objects.filter(order_date__lt=timezone.now() - timedelta(days=1)).exists())
+        # Every order's total matches its items
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total_amount, sum(item.price * item.quantity for item in order.items.all()))
+
+    def test_popularity_is_skewed_but_nobody_is_left_out(self):
+        self.seed(sellers=10, products=500)
+        counts = sorted(User.objects.filter(role='seller').annotate(count=Count('products')).values_list('count', flat=True))
+        self.assertGreaterEqual(counts[0], 1)
+        self.assertGreater(counts[-1], 3 * counts[len(counts) // 2])
+
+    def test_refuses_to_reuse_a_prefix(self):
+        self.seed(products=10, orders=5)
+        with self.assertRaises(CommandError):
+            self.seed(products=10, orders=5)
+
+
+class LoadTestTests(LiveServerTestCase):
+    def test_replays_every_scenario_against_a_live_server(self):
+        cache.clear()
+        seed_marketplace(sellers=2, customers=4, products=40, orders=10)
+        harness = LoadTest(self.live_server_url, {'customer': 4, 'seller': 2}, concurrency=1, seed=0)
+        rows = harness.stats.report(harness.run(1))
+        endpoints = {row['endpoint'] for row in rows}
+        self.assertTrue({'POST /api/auth/login/', 'GET /api/customer/products/', 'GET /api/seller/inventory/'} <= endpoints)
+        for row in rows:
+            self.assertEqual(row['errors'], row['throttled'], row['endpoint'])
+            self.assertLessEqual(row['p50'], row['p95'])
+
+    def test_percentile_is_nearest_rank(self):
+        ordered = list(range(1, 101))
+        self.assertEqual([percentile(ordered, fraction) for fraction in (0.5, 0.95, 0.99, 1)], [50, 95, 99, 100])
+        self.assertEqual(percentile([7], 0.99), 7)
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(sellers=3, customers=6, products=30, orders=40)
+
+    def expected(self, seller, **filters):
+        items = OrderItem.objects.filter(product__seller=seller, **filters).exclude(order__status='cancelled')
+        items = items.exclude(status='cancelled')
+        return {
+            'revenue': items.aggregate(total=Sum(F('price') * F('quantity')))['total'] or 0,
+            'units': items.aggregate(total=Sum('quantity'))['total'] or 0,
+            'orders': items.values('order').distinct().count(),
+        }
+
+    def summary(self, seller, **options):
+        return [{key: row[key] for key in ('revenue', 'units', 'orders')} for row in sales_summary(seller, **options)]
+
+    def test_rollups_match_the_order_items(self):
+        for seller in self.data['sellers']:
+            self.assertEqual(self.summary(seller), [self.expected(seller)])
+            product = seller.products.filter(order_items__isnull=False).first()
+            by_product = {row['id']: row for row in sales_summary(seller, 'product')}
+            self.assertEqual(by_product[product.pk]['units'], self.expected(seller, product=product)['units'])
+            monthly = sales_summary(seller, 'total', 'month')
+            self.assertEqual(sum(row['revenue'] for row in monthly), self.expected(seller)['revenue'])
+
+    def test_cancelling_an_order_takes_it_out(self):
+        seller = self.data['sellers'][0]
+        order = Order.objects.filter(items__product__seller=seller).exclude(status='cancelled').first()
+        api = APIClient()
+        api.force_authenticate(self.data['admin'])
+        with self.captureOnCommitCallbacks(execute=True):
+            api.patch(f'/api/seller/orders/{order.pk}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.summary(seller), [self.expected(seller)])
+        response = api.patch(f'/api/seller/orders/{order.pk}/status/', {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.summary(seller), [self.expected(seller)])
+
+    def test_status_updates_are_checked_before_the_rollups(self):
+        seller, other = self.data['sellers'][:2]
+        order = (Order.objects.filter(items__product__seller=seller).exclude(items__product__seller=other)
+                 .exclude(status='cancelled').first())
+        before = self.summary(seller)
+        api = APIClient()
+        api.force_authenticate(self.data['admin'])
+        response = api.patch(f'/api/seller/orders/{order.pk}/status/', {'status': 'lost'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        api.force_authenticate(other)
+        response = api.patch(f'/api/seller/orders/{order.pk}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = APIClient().patch(f'/api/seller/orders/{order.pk}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        order.refresh_from_db()
+        self.assertNotEqual(order.status, 'cancelled')
+        self.assertEqual(self.summary(seller), before)
+
+    def test_new_orders_are_added(self):
+        product = Product.objects.filter(stock_quantity__gte=5).first()
+        other = Product.objects.filter(stock_quantity__gte=5).exclude(seller=product.seller).first()
+        before = self.summary(product.seller)[0]
+        api = APIClient()
+        api.force_authenticate(self.data['customers'][0])
+        api.post('/api/customer/orders/create/', {'items': [
+            {'product_id': product.pk, 'quantity': 2}, {'product_id': other.pk, 'quantity': 1},
+        ]}, format='json')
+        process_order_events()
+        after = self.summary(product.seller)[0]
+        self.assertEqual(after['units'] - before['units'], 2)
+        self.assertEqual(after['orders'] - before['orders'], 1)
+        self.assertEqual(after['revenue'] - before['revenue'], product.price * 2)
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        incremental = sorted(SalesRollup.objects.values_list('seller', 'dimension', 'key', 'day', 'revenue', 'units', 'orders'))
+        call_command('rebuild_sales_rollups', batch_size=7, stdout=StringIO())
+        rebuilt = sorted(SalesRollup.objects.values_list('seller', 'dimension', 'key', 'day', 'revenue', 'units', 'orders'))
+        self.assertEqual(rebuilt, incremental)
+
+
+class IdempotentOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(sellers=2, customers=2, products=20, orders=0)
+        cls.customer = cls.data['customers'][0]
+        cls.products = list(Product.objects.filter(stock_quantity__gte=5)[:2])
+
+    def order(self, key, quantity=1):
+        api = APIClient()
+        api.force_authenticate(self.customer)
+        items = [{'product_id': product.pk, 'quantity': quantity} for product in self.products]
+        return api.post('/api/customer/orders/create/', {'items': items}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_a_retry_replays_the_first_response_without_writing_again(self):
+        first = self.order('retry-1')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.order('retry-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        # The failed claim and the stored response; the test's transaction adds savepoints around the claim
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']],
+                         ['INSERT', 'SELECT'])
+        self.assertEqual(Order.objects.count(), 1)
+        process_order_events()
+        self.assertEqual(InventoryLog.objects.filter(reason='order').count(), 2)
+        for product in self.products:
+            self.assertEqual(Product.objects.get(pk=product.pk).stock_quantity, product.stock_quantity - 1)
+
+    def test_a_key_reused_for_another_cart_is_refused(self):
+        self.order('retry-2')
+        self.assertEqual(self.order('retry-2', quantity=2).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.order('retry-3', quantity=10 ** 6).status_code, 400)
+        self.assertEqual(self.order('retry-3').status_code, 201)
+
+    def test_expired_keys_run_again_and_are_purged(self):
+        self.order('retry-4')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.order('retry-4'))
+        self.assertEqual(Order.objects.count(), 2)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class OrderWorkerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_marketplace(sellers=2, customers=2, products=20, orders=0)
+        cls.customer = cls.data['customers'][0]
+        cls.products = list(Product.objects.filter(stock_quantity__gte=5)[:3])
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self):
+        api = APIClient()
+        api.force_authenticate(self.customer)
+        items = [{'product_id': product.pk, 'quantity': 2} for product in self.products]
+        return api.post('/api/customer/orders/create/', {'items': items}, format='json')
+
+    def test_checkout_leaves_side_effects_to_the_worker(self):
+        versions = catalog_cache.get_versions([f'product:{self.products[0].pk}'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order()
+        # The cache is still invalidated at checkout so pages do not show the old stock meanwhile
+        self.assertNotEqual(catalog_cache.get_versions([f'product:{self.products[0].pk}']), versions)
+        self.assertEqual(OrderEvent.objects.get().order, Order.objects.get())
+        self.assertFalse(InventoryLog.objects.filter(reason='order').exists())
+        self.assertEqual(sales_summary(), [])
+
+        stdout = StringIO()
+        with mock.patch('Core.outbox.refresh_products') as refresh_products:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('run_order_worker', '--once', stdout=stdout)
+        self.assertIn('Handled 1 order events', stdout.getvalue())
+        self.assertIsNotNone(OrderEvent.objects.get().processed_at)
+        self.assertEqual(InventoryLog.objects.filter(reason='order').count(), 3)
+        self.assertEqual(sum(row['units'] for row in sales_summary()), 6)
+        refresh_products.assert_called_once_with(sorted(product.pk for product in self.products))
+        self.assertEqual(process_order_events(), 0)
+
+    def test_cancelling_before_the_worker_runs_nets_out(self):
+        self.order()
+        api = APIClient()
+        api.force_authenticate(self.data['admin'])
+        api.patch(f'/api/seller/orders/{Order.objects.get().pk}/status/', {'status': 'cancelled'}, format='json')
+        process_order_events()
+        self.assertEqual(sales_summary(), [])
+
+    def test_rebuilding_before_the_worker_runs_does_not_count_twice(self):
+        for _ in range(3):
+            self.order()
+        first, second, _ = Order.objects.order_by('pk').values_list('pk', flat=True)
+        api = APIClient()
+        api.force_authenticate(self.data['admin'])
+        api.patch(f'/api/seller/orders/{first}/status/', {'status': 'cancelled'}, format='json')
+        item = OrderItem.objects.filter(order_id=second).order_by('pk').first()
+        api.patch('/api/seller/order-items/status/', {'ids': [item.pk], 'status': 'cancelled'}, format='json')
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        process_order_events()
+        handled = sales_summary(dimension='product')
+        # The same as counting everything once the worker is done
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(handled, sales_summary(dimension='product'))
+        self.assertEqual([row['units'] for row in sales_summary()], [10])
+
+    def test_failed_events_are_retried_then_left_alone(self):
+        self.order()
+        with mock.patch.dict('Core.outbox.HANDLERS', {'placed': mock.Mock(side_effect=ValueError('boom'))}), \
+                self.assertLogs('marketplace.order_worker') as logs:
+            for _ in range(ORDER_EVENT_MAX_ATTEMPTS + 1):
+                process_order_events()
+        self.assertEqual(len(logs.records), ORDER_EVENT_MAX_ATTEMPTS)
+        event = OrderEvent.objects.get()
+        self.assertEqual((event.processed_at, event.attempts), (None, ORDER_EVENT_MAX_ATTEMPTS))
+        self.assertEqual(event.last_error, 'ValueError: boom')
+        self.assertFalse(InventoryLog.objects.filter(reason='order').exists())
+
+    def test_one_failing_event_does_not_hold_back_the_others(self):
+        for _ in range(3):
+            self.order()
+        bad = OrderEvent.objects.order_by('pk')[1]
+
+        def placed(events):
+            if bad in events:
+                raise ValueError('boom')
+            order_placed(events)
+
+        with mock.patch.dict('Core.outbox.HANDLERS', {'placed': placed}), \
+                self.assertLogs('marketplace.order_worker') as logs:
+            self.assertEqual(process_order_events(), 3)
+        # The three together, then the bad one alone
+        self.assertEqual(len(logs.records), 2)
+        events = OrderEvent.objects.order_by('pk')
+        self.assertEqual([event.processed_at is None for event in events], [False, True, False])
+        self.assertEqual([event.attempts for event in events], [1, 1, 1])
+        self.assertEqual([event.last_error for event in events], ['', 'ValueError: boom', ''])
+        self.assertEqual(InventoryLog.objects.filter(reason='order').count(), 6)
+
+    def test_the_worker_retires_cached_facets(self):
+        product = self.products[0]
+        product.stock_quantity = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        api = APIClient()
+
+        def in_stock():
+            facets = api.get('/api/customer/products/').json()['facets']
+            return {row['value']: row['count'] for row in facets['in_stock']}
+
+        before = in_stock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order()
+        # Read between checkout and the worker, caching the counts from before the sale
+        self.assertEqual(in_stock(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            process_order_events()
+        after = in_stock()
+        self.assertEqual((after[True], after.get(False, 0)), (before[True] - 1, before.get(False, 0) + 1))
+
+
+@skipUnless('replica' in settings.DATABASES, "Needs the replica database of MARKETPLACE_DB=sqlite")
+class ReplicaRoutingTests(TransactionTestCase):
+    # The replica is a separate empty file, as if replication had not caught up at all
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        authentication._local.clear()
+        patcher = mock.patch('Core.routers.DATABASE_REPLICAS', ['replica'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.seller = User.objects.create_user('replica_seller', 'replica_seller@example.com', 'password123', role='seller')
+        SellerProfile.objects.create(user=self.seller, shop_name='Replica shop')
+        self.category = Category.objects.create(name='Replicated')
+        response = APIClient().post('/api/auth/login/', {'username': 'replica_seller', 'password': 'password123'})
+        self.token = response.json()['access']
+
+    def call(self, method, url, data=None, token=None):
+        api = APIClient()
+        if token:
+            api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(api, method)(url, data, format='json')
+        return response, len(primary), len(replica)
+
+    def test_safe_requests_read_from_the_replica(self):
+        User.objects.create_user('replica_customer', 'replica_customer@example.com', 'password123', role='customer')
+        token = APIClient().post('/api/auth/login/', {'username': 'replica_customer', 'password': 'password123'}).json()['access']
+        # The first request caches the user's state, which is read from the primary
+        self.call('get', '/api/customer/orders/', token=token)
+        response, primary, replica = self.call('get', '/api/customer/orders/', token=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_cached_catalog_pages_are_built_from_the_primary(self):
+        response, _, _ = self.call('post', '/api/seller/products/', {
+            'name': 'Fresh', 'description': '', 'price': '5.00', 'stock_quantity': 3, 'category_id': self.category.pk,
+        }, self.token)
+        self.assertEqual(response.status_code, 201)
+        # An anonymous request goes to the replica, which has not got the product, but the page it caches must not
+        # hide the product from the writer pinned to the primary
+        response, _, replica = self.call('get', '/api/customer/products/')
+        self.assertEqual(([product['name'] for product in response.json()['results']], replica), (['Fresh'], 0))
+        response, primary, replica = self.call('get', '/api/customer/products/', token=self.token)
+        self.assertEqual([product['name'] for product in response.json()['results']], ['Fresh'])
+        self.assertEqual((primary, replica), (0, 0))
+
+    def test_writers_read_their_own_writes_until_the_pin_expires(self):
+        response, _, replica = self.call('post', '/api/seller/products/', {
+            'name': 'Fresh', 'description': '', 'price': '5.00', 'stock_quantity': 3, 'category_id': self.category.pk,
+        }, self.token)
+        self.assertEqual((response.status_code, replica), (201, 0))
+        url = f'/api/seller/products/{Product.objects.get(name="Fresh").pk}/'
+
+        response, primary, replica = self.call('get', url, token=self.token)
+        self.assertEqual((response.status_code, replica), (200, 0))
+        self.assertIn(f'db:pin:{self.seller.pk}', cache)
+        # Letting the pin expire sends the seller's reads back to the replica
+        cache.delete(f'db:pin:{self.seller.pk}')
+        response, primary, replica = self.call('get', '/api/seller/orders/', token=self.token)
+        self.assertEqual((response.status_code, primary, replica > 0), (200, 0, True))
+
+    def test_session_users_read_their_own_writes(self):
+        User.objects.create_user('replica_admin', 'replica_admin@example.com', 'password123', role='admin',
+                                 is_staff=True, is_superuser=True)
+        client = APIClient()
+        response = client.post('/admin/login/', {'username': 'replica_admin', 'password': 'password123'})
+        self.assertEqual(response.status_code, 302)
+        # The replica has not got the new session, so reading it there would send the admin back to the login page
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = client.get('/admin/Core/category/')
+        self.assertEqual((response.status_code, len(replica)), (200, 0))
+
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        cache.delete(f'db:pin:session:{session}')
+        self.assertEqual(client.get('/admin/Core/category/').status_code, 302)
+
+    def test_streamed_exports_read_from_the_replica_until_sent(self):
+        def serialized_rows(view, first, batches):
+            # Run as the response is sent, after the middleware has returned
+            yield [{'alias': Product.objects.all().db}]
+
+        with mock.patch('Core.exports.StreamingExportMixin.serialized_rows', serialized_rows):
+            response, _, _ = self.call('get', '/api/seller/orders/export/?output=ndjson', token=self.token)
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), {'alias': 'replica'})
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(Product))
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertTrue(Category.objects.filter(pk=self.category.pk).exists())
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(Category))
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_marketplace(sellers=3, customers=6, products=30, orders=40)
+        cls.superuser = User.objects.create_superuser(
+            'changelist_admin', 'changelist_admin@example.com', 'password123', role='admin',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def changelist(self, model, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/Core/{model}/{query}')
+        self.assertEqual(response.status_code, 200, model)
+        return response, len(queries)
+
+    def test_rows_are_joined_not_loaded_one_by_one(self):
+        word = Product.objects.first().name.split()[0]
+        searches = {'order': 'seed_customer_1', 'orderitem': 'seed_customer_1', 'review': 'seed_customer_1',
+                    'inventorylog': word, 'product': word, 'sellerprofile': 'seed_seller_1'}
+        for model, term in searches.items():
+            response, many = self.changelist(model)
+            # A full page takes as many queries as a search matching a few rows
+            _, few = self.changelist(model, f'?q={term}')
+            self.assertGreater(len(response.context['cl'].result_list), 1, model)
+            self.assertEqual(many, few, model)
+            self.assertLessEqual(many, 8, model)
+
+    def test_search_date_hierarchy_and_autocomplete(self):
+        response, _ = self.changelist('orderitem', '?q=seed_customer_0')
+        usernames = {item.order.customer.username for item in response.context['cl'].result_list}
+        self.assertEqual(usernames, {'seed_customer_0'} if usernames else set())
+        order = Order.objects.order_by('order_date').first()
+        date = timezone.localtime(order.order_date)
+        response, _ = self.changelist('order', f'?order_date__year={date.year}&order_date__month={date.month}')
+        self.assertIn(order, response.context['cl'].result_list)
+        self.changelist('inventorylog', f'?created_at__year={timezone.now().year}')
+        product = Product.objects.first()
+        response = self.client.get('/admin/autocomplete/', {
+            'term': product.name.split()[0], 'app_label': 'Core', 'model_name': 'orderitem', 'field_name': 'product',
+        })
+        self.assertIn(str(product.pk), [result['id'] for result in response.json()['results']])
+
+    def test_counts_are_estimated(self):
+        with mock.patch('Core.admin.estimate_count', return_value=12345) as estimate:
+            response, _ = self.changelist('orderitem')
+        estimate.assert_called()
+        self.assertEqual(response.context['cl'].result_count, 12345)
+
+
+class ProductPurgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_marketplace(sellers=2, customers=3, products=10, orders=30)
+        cls.product = Product.objects.annotate(items=Count('order_items')).order_by('-items').first()
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.product.seller)
+
+    def delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.delete(f'/api/seller/products/{self.product.pk}/delete/')
+        self.assertEqual(response.json(), {"message": "Product is deleted"})
+
+    def test_deleting_hides_the_product_and_keeps_its_history(self):
+        items = OrderItem.objects.filter(product=self.product).count()
+        self.assertGreater(items, 1)
+        self.delete()
+        self.assertEqual(self.api.get(f'/api/seller/products/{self.product.pk}/').status_code, 404)
+        ids = [product['id'] for product in self.api.get('/api/customer/products/?page_size=100').json()['results']]
+        self.assertNotIn(self.product.pk, ids)
+        self.assertEqual(OrderItem.objects.filter(product=self.product).count(), items)
+        self.assertEqual(OrderItem.objects.filter(product=self.product).first().product, self.product)
+
+    def test_seller_order_history_still_shows_deleted_products(self):
+        order_id = OrderItem.objects.filter(product=self.product).values_list('order_id', flat=True).first()
+        self.delete()
+
+        def names(order):
+            return [item['product'] and item['product']['name'] for item in order['items']]
+
+        detail = self.api.get(f'/api/seller/orders/{order_id}/').json()
+        self.assertIn(self.product.name, names(detail))
+        self.assertNotIn(None, names(detail))
+        orders = self.api.get('/api/seller/orders/?page_size=100').json()['results']
+        self.assertEqual(names(next(order for order in orders if order['id'] == order_id)), names(detail))
+
+    def test_admins_can_find_edit_and_restore_deleted_products(self):
+        self.delete()
+        self.client.force_login(User.objects.create_superuser('purge_admin', 'purge_admin@example.com', 'password123', role='admin'))
+        response = self.client.get('/admin/Core/product/', {'is_deleted__exact': '1'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.product])
+        # Their order items still save, with the deleted product selected
+        item = OrderItem.objects.filter(product=self.product).first()
+        response = self.client.post(f'/admin/Core/orderitem/{item.pk}/change/', {
+            'order': item.order_id, 'product': self.product.pk, 'quantity': item.quantity + 1,
+            'price': item.price, 'status': item.status,
+        })
+        self.assertEqual(response.status_code, 302)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/Core/product/', {'action': 'restore', '_selected_action': [self.product.pk]})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.is_deleted, self.product.deleted_at), (False, None))
+        self.assertEqual(self.api.get(f'/api/seller/products/{self.product.pk}/').status_code, 200)
+
+    def test_purge_deletes_dependents_in_batches_then_the_product(self):
+        items = OrderItem.objects.filter(product=self.product).count()
+        others = OrderItem.objects.exclude(product=self.product).count()
+        self.delete()
+        progress = mock.Mock()
+        with mock.patch('Core.purge.time.sleep') as sleep:
+            self.assertEqual(purge_deleted_products(batch_size=1, progress=progress), 1)
+        # A pause after every full batch: one row per transaction
+        self.assertGreaterEqual(sleep.call_count, items)
+        self.assertFalse(Product.all_objects.filter(pk=self.product.pk).exists())
+        self.assertFalse(OrderItem.objects.filter(product_id=self.product.pk).exists())
+        self.assertEqual(OrderItem.objects.count(), others)
+        self.assertEqual(progress.call_args.args[0], self.product.pk)
+        self.assertGreaterEqual(progress.call_args.args[1], items)
+
+    def test_listing_a_deleted_product_again_restores_it(self):
+        self.delete()
+        response = self.api.post('/api/seller/products/', {
+            'name': self.product.name, 'category_id': self.product.category_id, 'description': 'Back',
+            'price': '5.00', 'stock_quantity': 3,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(Product.objects.filter(pk=self.product.pk).exists())
+        stdout = StringIO()
+        call_command('purge_deleted_products', '--pause', '0', stdout=stdout)
+        self.assertIn('Purged 0 deleted products.', stdout.getvalue())
+        self.assertTrue(OrderItem.objects.filter(product=self.product).exists())
+
+
+class ImportProductsCommandTests(TestCase):
+    def test_imports_a_file_in_batches(self):
+        product = create_products(1, stock_quantity=5)[0]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as source:
+            self.addCleanup(os.remove, source.name)
+            for i in range(3):
+                source.write(json.dumps({'name': f'Imported {i}', 'price': '2.00', 'stock_quantity': i,
+                                         'category': 'stock'}) + '\n')
+            source.write(json.dumps({'name': product.name, 'price': '3.00', 'stock_quantity': 1,
+                                     'category_id': product.category_id}) + '\n')
+            source.write(json.dumps({'name': 'No price', 'stock_quantity': 1, 'category_id': product.category_id}))
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_products', source.name, '--seller', 'stock_seller', '--batch-size', '2',
+                     stdout=stdout, stderr=stderr)
+        self.assertIn('Created 3, updated 1, failed 1 products.', stdout.getvalue())
+        self.assertIn('Row 5:', stderr.getvalue())
+        self.assertEqual(Product.objects.filter(name__startswith='Imported').count(), 3)
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.stock_quantity), (3, 1))
+
+    def test_unknown_seller_or_format(self):
+        with self.assertRaises(CommandError):
+            call_command('import_products', 'catalog.csv', '--seller', 'nobody')
+        create_products(1, stock_quantity=1)
+        with self.assertRaises(CommandError):
+            call_command('import_products', 'catalog.xlsx', '--seller', 'stock_seller')
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._local.clear()
+        self.user = User.objects.create_user('claims_seller', 'claims_seller@example.com', 'password123', role='seller')
+        SellerProfile.objects.create(user=self.user, shop_name='Claims shop')
+        self.token = self.login()
+
+    def login(self):
+        response = APIClient().post('/api/auth/login/', {'username': 'claims_seller', 'password': 'password123'})
+        return response.json()['access']
+
+    def get(self, token=None):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get('/api/seller/sales-history/?page_size=5')
+        return response, len(queries)
+
+    def save(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(**fields)
+            self.user.refresh_from_db()
+            self.user.save()
+
+    def test_no_user_query_once_the_state_is_cached(self):
+        response, cold = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get()[1], cold - 1)
+        # Another process finds it in the shared cache
+        authentication._local.clear()
+        self.assertEqual(self.get()[1], cold - 1)
+
+    def test_deactivation_and_role_changes_apply_at_once(self):
+        self.get()
+        self.save(role='customer')
+        self.assertEqual(self.get()[0].status_code, 403)
+        self.save(role='seller', is_active=False)
+        self.assertEqual(self.get()[0].status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-password')
+            self.user.save()
+        self.assertEqual(self.get()[0].status_code, 401)
+
+    def test_tokens_without_claims_load_the_user(self):
+        token = AccessToken.for_user(self.user)
+        response, _ = self.get(str(token))
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_is_partial_but_complete_on_access(self):
+        user = authentication.ClaimsJWTAuthentication().get_user(AccessToken(self.token))
+        self.assertEqual((user.pk, user.role, user.is_staff), (self.user.pk, 'seller', False))
+        self.assertEqual(user.get_deferred_fields() & {'id', 'username', 'role'}, set())
+        self.assertEqual(user.email, 'claims_seller@example.com')
+
+
+class PasswordHashingPoolTests(TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        cache.clear()
+        User.objects.create_user('pooled_customer', 'pooled_customer@example.com', 'password123')
+
+    def login(self, password='password123'):
+        return APIClient().post('/api/auth/login/', {'username': 'pooled_customer', 'password': password})
+
+    def test_logins_and_signups_hash_on_the_pool(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong-password').status_code, 401)
+        APIClient().post('/api/auth/signup/customer/', {
+            'username': 'pooled_signup', 'email': 'pooled_signup@example.com', 'password': 'password123',
+        })
+        self.assertTrue(User.objects.get(username='pooled_signup').check_password('password123'))
+        self.assertIn('marketplace_password_hashes_total 3', REGISTRY.render())
+
+    def test_saturated_pool_answers_503_with_retry_after(self):
+        with mock.patch('Core.hashing._slots', threading.Semaphore(0)), mock.patch('Core.hashing.HASHING_QUEUE_WAIT', 0):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertIn('marketplace_password_hashing_rejected_total 1', REGISTRY.render())
+
+    def test_slots_are_shared_across_processes(self):
+        # Other workers hold every shared slot, though this process has none in use
+        keys = hashing.shared_slot_keys()
+        cache.set_many(dict.fromkeys(keys, 'other-worker'), 60)
+        with mock.patch('Core.hashing.HASHING_QUEUE_WAIT', 0.05):
+            self.assertEqual(self.login().status_code, 503)
+        # A slot that expires is free again, and the hash that takes it gives it back
+        cache.delete(keys[0])
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(cache.get_many(keys), dict.fromkeys(keys[1:], 'other-worker'))
+
+    def test_an_expired_slot_is_not_freed_twice(self):
+        key, holder = hashing._acquire_shared_slot(time.monotonic())
+        # The slot outlived its TTL and another hash took it
+        cache.set(key, 'other-worker', 60)
+        hashing._release_shared_slot(key, holder)
+        self.assertEqual(cache.get(key), 'other-worker')
+
+
+class SlidingWindowThrottleTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Two stores on one file stand in for two workers sharing the counters
+        stores = [SQLiteStore(f'{directory.name}/throttle.sqlite3') for _ in range(2)]
+        for patcher in (
+            mock.patch('Core.throttling.throttle_store', side_effect=itertools.cycle(stores)),
+            mock.patch.dict(SlidingWindowThrottle.THROTTLE_RATES, {'signup': '10/min'}),
+            mock.patch.object(SlidingWindowThrottle, 'timer', return_value=6000.0),
+        ):
+            self.timer = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def signup(self):
+        # Invalid, so nothing is hashed or saved; the request still counts
+        return APIClient().post('/api/auth/signup/customer/', {})
+
+    def test_budget_is_shared_between_workers_and_kept_per_scope(self):
+        self.assertEqual([self.signup().status_code for _ in range(10)], [400] * 10)
+        response = self.signup()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '66')
+        # Other scopes keep their own budgets
+        self.assertEqual(APIClient().post('/api/auth/login/', {}).status_code, 400)
+        self.assertEqual(APIClient().get('/api/customer/products/').status_code, 200)
+
+    def test_catalog_reads_share_the_browse_budget(self):
+        SlidingWindowThrottle.THROTTLE_RATES['browse'] = '3/min'
+        urls = ['/api/seller/products/', '/api/customer/products/search/?q=shoe', '/api/seller/products/1/']
+        self.assertNotIn(429, [APIClient().get(url).status_code for url in urls])
+        self.assertEqual(APIClient().get('/api/seller/products/').status_code, 429)
+        # Creating products is not browsing
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user('browse_seller', 'browse_seller@example.com', 'password123', role='seller'))
+        self.assertEqual(api.post('/api/seller/products/', {}).status_code, 400)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        for _ in range(10):
+            self.signup()
+        # Halfway through the next window the previous one counts for 5
+        self.timer.return_value = 6090.0
+        self.assertEqual([self.signup().status_code for _ in range(6)], [400] * 5 + [429])
+        self.assertEqual(self.signup()['Retry-After'], '6')
+        self.timer.return_value = 6096.0
+        self.assertEqual(self.signup().status_code, 400)
+
+    def test_per_process_caches_are_reported(self):
+        with self.assertLogs('marketplace.throttling', 'WARNING') as logs:
+            CacheStore('default')
+        self.assertIn('every worker enforces its own budget', logs.output[0])
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir(),
+        }}), self.assertNoLogs('marketplace.throttling'):
+            CacheStore('default')
+
+
+class AuthEndpointBudgetTests(QueryBudgetTestCase):
+    def test_signup(self):
+        self.assertRequestBudget(3, 'post', [('/api/auth/signup/customer/', {
+            'username': 'budget_customer', 'email': 'budget_customer@example.com', 'password': 'password123',
+        })], status=201)
+        self.assertRequestBudget(7, 'post', [('/api/auth/signup/seller/', {
+            'username': 'budget_seller', 'email': 'budget_seller@example.com', 'password': 'password123',
+            'shop_name': 'Budget shop',
+        })], status=201)
+
+    def test_login(self):
+        customer, seller = self.data['customers'][0], self.data['sellers'][0]
+        self.assertRequestBudget(1, 'post', [('/api/auth/login/', {'username': customer.username, 'password': 'password123'})])
+        # Seller tokens carry the shop name
+        self.assertRequestBudget(2, 'post', [('/api/auth/login/', {'username': seller.username, 'password': 'password123'})])
+
+    def test_token_refresh(self):
+        login = self.request('post', '/api/auth/login/', data={
+            'username': self.data['customers'][0].username, 'password': 'password123',
+        })
+        self.assertRequestBudget(1, 'post', [('/api/auth/token/refresh/', {'refresh': login.json()['refresh']})])
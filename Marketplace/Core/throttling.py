@@ -0,0 +1,200 @@
+import logging
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger('marketplace.throttling')
+
+# Where the throttle counters live; see CacheStore and SQLiteStore
+THROTTLE_STORE = getattr(settings, 'THROTTLE_STORE', {'BACKEND': 'Core.throttling.CacheStore'})
+
+# Cache backends whose counters no other process sees, so each worker would enforce its own budget
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class CacheStore:
+    """
+    Counters in a Django cache. They are shared by every worker once the
+    cache is Redis or Memcached, whose add and incr are atomic; on LocMemCache
+    each process counts for itself, which is logged as a warning when the
+    store is made.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+        backend = settings.CACHES[alias]['BACKEND']
+        if backend in PER_PROCESS_CACHES:
+            logger.warning(
+                "Throttle counters are kept in the %r cache (%s), which other processes do not share, so every "
+                "worker enforces its own budget. Point CACHES at Redis or Memcached, or set THROTTLE_STORE to "
+                "Core.throttling.SQLiteStore.", alias, backend,
+            )
+
+    def hit(self, key, previous_key, ttl):
+        """Count a request under ``key``; return its new count and the count under ``previous_key``."""
+        self.cache.add(key, 0, ttl)
+        try:
+            current = self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.add(key, 1, ttl)
+            current = 1
+        return current, self.cache.get(previous_key, 0)
+
+    def release(self, key):
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
+
+
+class SQLiteStore:
+    """
+    Counters in a SQLite file that every process on the host shares; a
+    stand-in for a shared cache in tests and single-machine deployments.
+    """
+    # Fraction of hits that also delete expired counters
+    PRUNE_RATE = 0.01
+
+    def __init__(self, path=None, timeout=5):
+        self.path = str(path or os.path.join(tempfile.gettempdir(), 'marketplace-throttle.sqlite3'))
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS throttle_counter '
+                               '(key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL)')
+            self.local.connection = connection
+        return connection
+
+    def hit(self, key, previous_key, ttl):
+        connection = self.connection()
+        now = time.time()
+        (current,) = connection.execute(
+            'INSERT INTO throttle_counter (key, count, expires) VALUES (?, 1, ?) '
+            'ON CONFLICT (key) DO UPDATE SET count = count + 1 RETURNING count',
+            (key, now + ttl),
+        ).fetchone()
+        row = connection.execute('SELECT count FROM throttle_counter WHERE key = ?', (previous_key,)).fetchone()
+        if random.random() < self.PRUNE_RATE:
+            connection.execute('DELETE FROM throttle_counter WHERE expires < ?', (now,))
+        return current, row[0] if row else 0
+
+    def release(self, key):
+        self.connection().execute('UPDATE throttle_counter SET count = count - 1 WHERE key = ?', (key,))
+
+
+def throttle_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(THROTTLE_STORE['BACKEND'])(**THROTTLE_STORE.get('OPTIONS', {}))
+    return _store
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding-window counter: requests are counted per fixed window, and the
+    previous window's count is weighted by how much of it still overlaps
+    the last ``duration`` seconds. Two integers per client and scope, kept
+    in throttle_store() so every worker enforces one budget. Rejected
+    requests are not counted.
+    """
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def get_cache_key(self, request, view):
+        return f'throttle:{self.scope}:{self.get_ident_key(request)}'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        self.elapsed = now - window * self.duration
+        current_key = f'{key}:{window}'
+        store = throttle_store()
+        # Kept for two windows: the current one, then as the previous one
+        current, self.previous = store.hit(current_key, f'{key}:{window - 1}', 2 * self.duration)
+        weight = 1 - self.elapsed / self.duration
+        if self.previous * weight + current <= self.num_requests:
+            return True
+        store.release(current_key)
+        self.accepted = current - 1
+        return False
+
+    def wait(self):
+        """Seconds until one more request fits, rounded up for Retry-After."""
+        if self.accepted >= self.num_requests:
+            # Wait out this window, then until its own weight has decayed enough
+            wait = self.duration - self.elapsed + self.duration * (1 - (self.num_requests - 1) / max(self.accepted, 1))
+        else:
+            wait = self.duration * (1 - (self.num_requests - 1 - self.accepted) / max(self.previous, 1)) - self.elapsed
+        return max(1, math.ceil(wait))
+
+
+class AnonThrottle(SlidingWindowThrottle):
+    """The 'anon' budget for anonymous requests to views without a throttle_scope."""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'throttle_scope', None) or (request.user and request.user.is_authenticated):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserThrottle(SlidingWindowThrottle):
+    """The 'user' budget for authenticated requests to views without a throttle_scope."""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'throttle_scope', None) or not (request.user and request.user.is_authenticated):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class ScopedThrottle(SlidingWindowThrottle):
+    """
+    Per-endpoint budgets: a view with ``throttle_scope = 'checkout'`` is
+    limited by DEFAULT_THROTTLE_RATES['checkout'] per user (or IP when
+    anonymous), counted apart from every other scope and from anon/user.
+    """
+
+    def __init__(self):
+        # The rate depends on the view, so it is looked up in allow_request
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
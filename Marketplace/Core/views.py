@@ -9,6 +9,7 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class CustomerSignupView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'signup'
 
     def post(self, request):
         serializer = CustomerSignupSerializer(data=request.data)
@@ -29,6 +30,7 @@ class CustomerSignupView(APIView):
 
 class SellerSignupView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'signup'
 
     def post(self, request):
         serializer = SellerSignupSerializer(data=request.data)
@@ -55,6 +57,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token = super().get_token(user)
         token['role'] = user.role
         token['username'] = user.username
+        token['is_staff'] = user.is_staff
         # Include shop_name for Sellers
         if user.role == 'seller' and hasattr(user, 'seller_profile'):
             token['shop_name'] = user.seller_profile.shop_name
@@ -74,3 +77,4 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 class LoginView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_scope = 'login'
@@ -1,26 +1,14 @@
 from rest_framework import serializers
-from Core.models import Order, OrderItem, Product, InventoryLog,Category
+from Core.models import Order, OrderEvent, OrderItem, Product, Category
 from django.db import transaction
+from Core.catalog_cache import invalidate_products
+from Core.fieldsets import SparseFieldsetMixin
+from Core.stock import InsufficientStock, reserve_stock
 
 class OrderItemSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
 
-    def validate_product_id(self, value):
-        try:
-            product = Product.objects.get(id=value)
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Product does not exist.")
-        return value
-
-    def validate(self, attrs):
-        product_id = attrs['product_id']
-        quantity = attrs['quantity']
-        product = Product.objects.get(id=product_id)
-        if product.stock_quantity < quantity:
-            raise serializers.ValidationError(f"Insufficient stock for product {product.name}. Available: {product.stock_quantity}")
-        return attrs
-
 class OrderCreateSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
 
@@ -34,43 +22,59 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         product_ids = [item['product_id'] for item in value]
         if len(product_ids) != len(set(product_ids)):
             raise serializers.ValidationError("Duplicate products are not allowed in an order.")
+
+        # Load every product in the cart with a single query and check stock in memory
+        products = Product.objects.with_stock().in_bulk(product_ids)
+        errors = []
+        for item in value:
+            product = products.get(item['product_id'])
+            if product is None:
+                errors.append({'product_id': ["Product does not exist."]})
+            elif product.available_stock < item['quantity']:
+                errors.append(self._stock_error(product, product.available_stock))
+            else:
+                errors.append({})
+                item['product'] = product
+        if any(errors):
+            raise serializers.ValidationError(errors)
         return value
 
+    def _stock_error(self, product, available):
+        return {'non_field_errors': [f"Insufficient stock for product {product.name}. Available: {available}"]}
+
     @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         customer = self.context['request'].user
-        total_amount = 0
-
-        order = Order.objects.create(customer=customer, total_amount=0, status='pending', is_paid=False)
-
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            quantity = item_data['quantity']
-            price = product.price
-            total_amount += price * quantity
-
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=price
-            )
-
-            product.stock_quantity -= quantity
-            product.save()
-
-            InventoryLog.objects.create(
-                product=product,
-                quantity_change=-quantity,
-                reason='order'
-            )
-
-        order.total_amount = total_amount
-        order.save()
+
+        # The check in validate_items ran outside this transaction, so re-check while reserving
+        try:
+            reserve_stock({item['product'].pk: item['quantity'] for item in items_data})
+        except InsufficientStock as exc:
+            raise serializers.ValidationError({'items': [
+                self._stock_error(item['product'], exc.available[item['product'].pk])
+                if item['product'].pk in exc.available else {}
+                for item in items_data
+            ]})
+
+        total_amount = sum(item['product'].price * item['quantity'] for item in items_data)
+        order = Order.objects.create(customer=customer, total_amount=total_amount, status='pending', is_paid=False)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item['product'], quantity=item['quantity'], price=item['product'].price)
+            for item in items_data
+        ])
+        # Inventory logs, sales rollups and facet counts are updated by run_order_worker
+        OrderEvent.objects.create(order=order, kind='placed')
+
+        # Stock moved without Product.save(), so the catalog cache is not told by the model signals. Only cache
+        # versions are bumped, and pages must not keep showing the old stock until the worker gets to the order
+        products = [item['product'] for item in items_data]
+        transaction.on_commit(lambda: invalidate_products(products))
+
         return order
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     customer = serializers.StringRelatedField(read_only=True)  # Includes customer name
     items = OrderItemSerializer(many=True, read_only=True)
     class Meta:
@@ -83,12 +87,20 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ['id', 'name', 'created_at', 'updated_at']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField(read_only=True)  # Returns category name
     seller = serializers.StringRelatedField(read_only=True)   # Returns seller username
+    stock_quantity = serializers.IntegerField(source='available_stock', read_only=True)
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'category', 'seller', 'price', 'stock_quantity', 'created_at', 'updated_at']
+        sparse_columns = {'stock_quantity': ['stock_quantity', 'stock_shards']}
+
+class ProductSearchSerializer(ProductSerializer):
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['rank']
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product = serializers.StringRelatedField(read_only=True)
@@ -1,3 +1,29 @@
-from django.test import TestCase
+from Core.testing import QueryBudgetTestCase
 
-# Create your tests here.
+
+class CustomerEndpointBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.customer = self.data['customers'][0]
+        self.in_stock = [product for product in self.data['products'] if product.stock_quantity >= 10]
+
+    def test_product_list(self):
+        self.assertQueryBudget(
+            4, '/api/customer/products/?page_size=5', '/api/customer/products/?page_size=100&stock_available=false',
+        )
+
+    def test_product_search(self):
+        self.assertQueryBudget(1, '/api/customer/products/search/?q=red&page_size=5',
+                               '/api/customer/products/search/?q=leather+jack&page_size=100')
+
+    def test_order_list(self):
+        self.assertQueryBudget(2, '/api/customer/orders/?page_size=2', '/api/customer/orders/?page_size=100',
+                               user=self.customer)
+
+    def test_order_create_whatever_the_cart_size(self):
+        def cart(size):
+            return {'items': [{'product_id': product.pk, 'quantity': 1} for product in self.in_stock[:size]]}
+
+        # Includes the order event; inventory logs and sales rollups are left to run_order_worker
+        self.assertRequestBudget(11, 'post', [('/api/customer/orders/create/', cart(2)),
+                                             ('/api/customer/orders/create/', cart(8))],
+                                 user=self.customer, status=201)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import OrderCreateView, CustomerOrderListView, ProductListView
+from .views import OrderCreateView, CustomerOrderListView, ProductListView, ProductSearchView
 
 app_name = 'Customer'
 
@@ -7,4 +7,5 @@ urlpatterns = [
     path('orders/create/', OrderCreateView.as_view(), name='order-create'), 
     path('orders/', CustomerOrderListView.as_view(), name='order-list'),  
     path('products/', ProductListView.as_view(), name='product-list'),  
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
 ]
\ No newline at end of file
@@ -1,28 +1,32 @@
+import hashlib
+
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
+from Core.pagination import KeysetPagination
+from Core.catalog_cache import CatalogCacheMixin, get_or_build, scoped_key
+from Core.fieldsets import SparseFieldsetViewMixin
+from Core.idempotency import IdempotentCreateMixin
+from Core.facets import PRICE_BAND_BOUNDS, facet_counts, price_band_range
+from Core.search import search_products
 from Core.models import Order, Product
-from .serializers import OrderCreateSerializer, OrderDetailSerializer, ProductSerializer
+from .serializers import OrderCreateSerializer, OrderDetailSerializer, ProductSerializer, ProductSearchSerializer
 from Core.permissions import IsCustomer, IsAdminOrCustomer
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-class OrderCreateView(generics.CreateAPIView):
+class OrderCreateView(IdempotentCreateMixin, generics.CreateAPIView):
     queryset = Order.objects.all()
     serializer_class = OrderCreateSerializer
     permission_classes = [IsAuthenticated, IsCustomer,IsAdminOrCustomer]
+    throttle_scope = 'checkout'
 
 
 
-class CustomerOrderListView(generics.ListAPIView):
+class CustomerOrderListView(SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = OrderDetailSerializer
     permission_classes = [IsAuthenticated, IsAdminOrCustomer]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'is_paid']
 
@@ -36,7 +40,10 @@ class CustomerOrderListView(generics.ListAPIView):
             queryset = Order.objects.none()
 
         # Optimize database query with select_related and prefetch_related
-        queryset = queryset.select_related('customer').prefetch_related('items__product__category')
+        queryset = queryset.select_related('customer')
+        # Order items render the product id only, so the products themselves are not fetched
+        if 'items' in self.get_serializer().fields:
+            queryset = queryset.prefetch_related('items')
 
         # Filter by date range if provided
         start_date = self.request.query_params.get('start_date')
@@ -65,29 +72,83 @@ class CustomerOrderListView(generics.ListAPIView):
 
 
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = []  
-    pagination_class = StandardResultsSetPagination
+    throttle_scope = 'browse'
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['category']
     ordering_fields = ['name', 'price', 'created_at', 'updated_at']
     ordering = ['name']
 
     def get_queryset(self):
-        queryset = Product.objects.all().select_related('category', 'seller')
+        queryset = Product.objects.all().select_related('category', 'seller').with_stock()
 
         # Filter by category_name (optional)
         category_name = self.request.query_params.get('category_name')
         if category_name:
             queryset = queryset.filter(category__name__iexact=category_name)
 
-        # Filter by stock availability (exclude out-of-stock products)
-        stock_available = self.request.query_params.get('stock_available', 'true').lower()
-        if stock_available == 'true':
-            queryset = queryset.filter(stock_quantity__gt=0)
-
-        return queryset
-
+        band = self.get_price_band()
+        if band is not None:
+            lower, upper = price_band_range(band)
+            queryset = queryset.filter(price__gte=lower)
+            if upper is not None:
+                queryset = queryset.filter(price__lt=upper)
 
+        # Filter by stock availability (exclude out-of-stock products)
+        if self.only_in_stock():
+            queryset = queryset.filter(total_stock__gt=0)
+
+        return queryset.order_by(*self.ordering)
+
+    def get_price_band(self):
+        band = self.request.query_params.get('price_band')
+        if band in (None, ''):
+            return None
+        if not band.isdigit() or int(band) >= len(PRICE_BAND_BOUNDS):
+            raise ValidationError({'price_band': [f"Choose a band from 0 to {len(PRICE_BAND_BOUNDS) - 1}."]})
+        return int(band)
+
+    def only_in_stock(self):
+        return self.request.query_params.get('stock_available', 'true').lower() == 'true'
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        filters = {
+            'category': request.query_params.get('category') or None,
+            'category_name': request.query_params.get('category_name') or None,
+            'band': self.get_price_band(),
+            'in_stock': True if self.only_in_stock() else None,
+        }
+        # Shared by every page and sort order of the same filters; any product change can move the counts
+        digest = hashlib.sha256(repr(sorted(filters.items())).encode('utf-8')).hexdigest()
+        key = scoped_key(['categories', 'all'], f'facets:{digest}')
+        response.data = {**response.data, 'facets': get_or_build(key, lambda: facet_counts(**filters))}
+        return response
+
+    def get_cache_scopes(self):
+        category = self.request.query_params.get('category')
+        return [f'category:{category}'] if category else ['all']
+
+
+class ProductSearchView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
+    serializer_class = ProductSearchSerializer
+    permission_classes = []
+    throttle_scope = 'browse'
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['category']
 
+    def get_queryset(self):
+        queryset = search_products(
+            self.request.query_params.get('q', ''),
+            Product.objects.select_related('category', 'seller').with_stock(),
+        )
+        if queryset is None:
+            raise ValidationError({'q': ["Enter a search term."]})
+        # Best matches first; the id breaks ties so cursors stay stable
+        return queryset.order_by('-rank', '-id')
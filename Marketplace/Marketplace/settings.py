@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -38,7 +39,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Core.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -46,17 +47,27 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': (
+        'Core.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'Core.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
     'PAGE_SIZE_QUERY_PARAM': 'page_size',
     'MAX_PAGE_SIZE': 100,
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'Core.throttling.AnonThrottle',
+        'Core.throttling.UserThrottle',
+        'Core.throttling.ScopedThrottle',
     ),
+    # anon and user cover views without a throttle_scope; the others are per-endpoint budgets counted separately
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
         'user': '1000/day',
+        'login': '30/min',
+        'signup': '20/hour',
+        'checkout': '30/min',
+        'browse': '600/min',
     },
 }
 
@@ -65,9 +76,13 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Changing a password revokes the tokens issued before it
+    'CHECK_REVOKE_TOKEN': True,
 }
 
 MIDDLEWARE = [
+    'Core.middleware.MetricsMiddleware',
+    'Core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,7 +95,8 @@ AUTH_USER_MODEL = 'Core.User'
 
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    # ModelBackend with password checks on a bounded pool; see the HASHING_ settings below
+    'Core.hashing.PooledModelBackend',
 ]
 
 ROOT_URLCONF = 'Marketplace.urls'
@@ -118,6 +134,80 @@ DATABASES = {
     }
 }
 
+# MARKETPLACE_DB=sqlite runs the project and its test suite against local SQLite files instead of MySQL
+if os.environ.get('MARKETPLACE_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock up front so concurrent checkouts queue instead of failing to upgrade
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            # A file (not in-memory) test database so multi-threaded tests share it
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        },
+        # A second file standing in for a replica that never catches up; only the router tests read from it
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+        },
+    }
+
+DATABASE_ROUTERS = ['Core.routers.ReplicaRouter']
+# Aliases in DATABASES (e.g. MySQL replicas of default) that serve the reads of GET requests; empty reads from default
+DATABASE_REPLICAS = []
+# Seconds a user keeps reading from default after a write, so replication lag never hides their own changes
+REPLICA_PIN_SECONDS = 5
+
+
+# Point this at a shared backend (Redis, Memcached) in production so every worker sees the same catalog cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'marketplace',
+    }
+}
+
+# Throttle counters: Core.throttling.CacheStore keeps them in CACHES (shared by every worker once that is Redis or
+# Memcached; on the LocMemCache above each worker counts alone, and a warning says so when the first request is
+# throttled); Core.throttling.SQLiteStore with OPTIONS {'path': ...} keeps them in a file shared by one host's workers
+THROTTLE_STORE = {'BACKEND': 'Core.throttling.CacheStore'}
+
+# Seconds an order's response is replayed for a retry with the same Idempotency-Key (purge_idempotency_keys clears older)
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+
+# Rows of a bulk product import (POST /api/seller/products/import/, import_products) written per transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Seconds before a cached catalog page or product payload is rebuilt
+CATALOG_CACHE_TIMEOUT = 300
+
+# Seconds a user's active flag, role and password fingerprint are reused per process and from the shared cache by
+# Core.authentication instead of loading the user on every request
+USER_STATE_LOCAL_TTL = 5
+USER_STATE_CACHE_TTL = 60
+
+# Password hashes run at once per process on signup and login, how many may queue behind them, and how long a
+# request waits for a place before a 503 with Retry-After; HASHING_WORKERS defaults to half the CPUs
+HASHING_QUEUE_SIZE = 16
+HASHING_QUEUE_WAIT = 0.5
+# Hashes running or waiting at once across every process sharing CACHES (so point it at Redis or Memcached). A hash
+# holds its request thread, and the whole worker under gunicorn's sync workers, so keep this well below the number of
+# request threads in the deployment; with threaded workers (gunicorn --worker-class gthread --threads N) the others
+# keep serving the catalog during a login storm
+HASHING_SHARED_SLOTS = 8
+
+# Mutes the marketplace.* warnings during tests; CHECK_PERF_BASELINE=1 also holds endpoints to perf_baseline.json
+TEST_RUNNER = 'Core.testing.MarketplaceTestRunner'
+
+# Request metrics served on /metrics; set METRICS_SAMPLE_RATE to 0 to switch them off
+METRICS_SAMPLE_RATE = 1.0
+SLOW_REQUEST_THRESHOLD = 0.5
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -1,28 +1,42 @@
+from collections import defaultdict
+from decimal import Decimal
 from rest_framework import serializers
+from Core.analytics import items_cancelled
 from Core.models import Product, Category, User, InventoryLog, SellerProfile, Order, OrderItem
 from django.db import transaction
-from django.db.models import F
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+from Core.fieldsets import SparseFieldsetMixin
+from Core.metrics import TimedRepresentationMixin
+from Core.stock import add_stock, set_stock
 
-class CategorySerializer(serializers.ModelSerializer):
+# Order items moved to a new status per request to /api/seller/order-items/status/
+BULK_STATUS_LIMIT = 1000
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name']
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     seller = serializers.CharField(source='seller.username', read_only=True)
     category = CategorySerializer(read_only=True)
+    stock_quantity = serializers.IntegerField(source='available_stock', read_only=True)
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'stock_quantity', 'seller', 'category', 'created_at', 'updated_at']
+        sparse_columns = {'stock_quantity': ['stock_quantity', 'stock_shards']}
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     seller = serializers.CharField(source='seller.username', read_only=True)
     category = CategorySerializer(read_only=True)
+    stock_quantity = serializers.IntegerField(source='available_stock', read_only=True)
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'stock_quantity', 'seller', 'category', 'created_at', 'updated_at']
+        sparse_columns = {'stock_quantity': ['stock_quantity', 'stock_shards']}
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
     category_id = serializers.IntegerField(write_only=True)
@@ -67,7 +81,7 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
 
         seller = user if user.role == 'seller' else validated_data.get('seller', user)
 
-        existing_product = Product.objects.filter(
+        existing_product = Product.all_objects.filter(
             name__iexact=validated_data['name'],
             category=category,
             seller=seller
@@ -75,7 +89,12 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
 
 
         if existing_product:
-            existing_product.stock_quantity = F('stock_quantity') + stock_quantity
+            # A deleted product listed again comes back with whatever history the purge has not reached yet
+            existing_product.is_deleted, existing_product.deleted_at = False, None
+            if existing_product.stock_shards:
+                add_stock(existing_product, stock_quantity)
+            else:
+                existing_product.stock_quantity = F('stock_quantity') + stock_quantity
             existing_product.description = validated_data.get('description', existing_product.description)
             existing_product.price = validated_data.get('price', existing_product.price)
             existing_product.save()
@@ -113,29 +132,38 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
         instance.name = validated_data.get('name', instance.name)
         instance.description = validated_data.get('description', instance.description)
         instance.price = validated_data.get('price', instance.price)
-        stock_quantity = validated_data.get('stock_quantity', instance.stock_quantity)
+        current_stock = instance.available_stock
+        stock_quantity = validated_data.get('stock_quantity', current_stock)
         
-        if stock_quantity != instance.stock_quantity:
-            quantity_change = stock_quantity - instance.stock_quantity
+        if stock_quantity != current_stock:
+            quantity_change = stock_quantity - current_stock
             InventoryLog.objects.create(
                 product=instance,
                 quantity_change=quantity_change,
                 reason='manual'
             )
-            instance.stock_quantity = stock_quantity
+            if instance.stock_shards:
+                set_stock(instance, stock_quantity)
+            else:
+                instance.stock_quantity = stock_quantity
         
         instance.save()
         return instance
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['stock_quantity'] = instance.available_stock
+        return data
+
 
-class OrderItemDetailSerializer(serializers.ModelSerializer):
+class OrderItemDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
 
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity', 'price']
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     customer = serializers.CharField(source='customer.username', read_only=True)
     items = OrderItemDetailSerializer(many=True, read_only=True)
 
@@ -143,7 +171,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'customer', 'total_amount', 'status', 'is_paid', 'items', 'order_date', 'updated_at']
 
-class SellerOrderItemDetailSerializer(serializers.ModelSerializer):
+class SellerOrderItemDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
 
     class Meta:
@@ -151,7 +179,7 @@ class SellerOrderItemDetailSerializer(serializers.ModelSerializer):
         fields = ['product', 'quantity', 'price']
 
 
-class SellerOrderDetailSerializer(serializers.ModelSerializer):
+class SellerOrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     customer = serializers.CharField(source='customer.username', read_only=True)
     items = serializers.SerializerMethodField()
     seller_total_amount = serializers.SerializerMethodField()
@@ -159,31 +187,50 @@ class SellerOrderDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'customer', 'seller_total_amount', 'status', 'is_paid', 'items', 'order_date', 'updated_at']
+        sparse_columns = {'items': [], 'seller_total_amount': ['total_amount']}
 
-    def get_items(self, obj):
+    def _seller(self):
         seller = self.context.get('seller')
-        if seller and seller.role == 'seller':
-            items = obj.items.filter(product__seller=seller)
-        else:
-            items = obj.items.all()
-        return SellerOrderItemDetailSerializer(items, many=True, context=self.context).data
+        return seller if seller and seller.role == 'seller' else None
+
+    def get_items(self, obj):
+        # Views prefetch the visible items into seller_items; fall back to querying for other callers
+        items = getattr(obj, 'seller_items', None)
+        if items is None:
+            seller = self._seller()
+            items = obj.items.filter(product__seller=seller) if seller else obj.items.all()
+        return self.get_item_serializer(items).data
+
+    def get_item_serializer(self, items=None):
+        return SellerOrderItemDetailSerializer(
+            items, many=True, context=self.context, fieldset=self.child_fieldset('items')
+        )
 
     def get_seller_total_amount(self, obj):
-        seller = self.context.get('seller')
-        if seller and seller.role == 'seller':
-            items = obj.items.filter(product__seller=seller)
-            return str(sum(item.quantity * item.price for item in items))
+        seller = self._seller()
+        if seller:
+            if hasattr(obj, 'seller_total'):
+                total = obj.seller_total
+            else:
+                total = obj.items.filter(product__seller=seller).aggregate(
+                    total=Sum(F('quantity') * F('price'))
+                )['total']
+            return str(Decimal(total).quantize(Decimal('0.01')) if total is not None else 0)
         return str(obj.total_amount)
 
 
 
 class OrderStatusUpdateSerializer(serializers.ModelSerializer):
+    FINAL_STATUSES = ['delivered', 'cancelled']
+
     class Meta:
         model = OrderItem
         fields = ['status']
 
     def validate_status(self, value):
-        valid_statuses = [choice[0] for choice in OrderItem.STATUS_CHOICES]
+        # Also validates whole orders, which have a 'processing' status as well
+        model = type(self.instance) if self.instance is not None else OrderItem
+        valid_statuses = [choice[0] for choice in model.STATUS_CHOICES]
         if value not in valid_statuses:
             raise serializers.ValidationError(f"Invalid status. Choose from: {valid_statuses}")
         return value
@@ -192,13 +239,93 @@ class OrderStatusUpdateSerializer(serializers.ModelSerializer):
         current_status = self.instance.status
         new_status = attrs.get('status', current_status)
 
-        if current_status in ['delivered', 'cancelled'] and new_status != current_status:
+        if current_status in self.FINAL_STATUSES and new_status != current_status:
             raise serializers.ValidationError(f"Cannot change status from '{current_status}'.")
         return attrs
 
 
+def roll_up_order_status(order_ids):
+    """
+    Set each order of ``order_ids`` to the status its items add up to:
+    cancelled once all are, delivered or shipped once every other item is,
+    processing while only some have shipped. Orders none of whose items
+    have moved keep their status. One aggregate query and one UPDATE.
+    """
+    counts = OrderItem.objects.filter(order_id__in=order_ids).values('order_id').annotate(
+        total=Count('pk'),
+        cancelled=Count('pk', filter=Q(status='cancelled')),
+        shipped=Count('pk', filter=Q(status='shipped')),
+        delivered=Count('pk', filter=Q(status='delivered')),
+    )
+    orders = defaultdict(list)
+    for row in counts:
+        live, moved = row['total'] - row['cancelled'], row['shipped'] + row['delivered']
+        if not live:
+            orders['cancelled'].append(row['order_id'])
+        elif row['delivered'] == live:
+            orders['delivered'].append(row['order_id'])
+        elif moved == live:
+            orders['shipped'].append(row['order_id'])
+        elif moved:
+            orders['processing'].append(row['order_id'])
+    if orders:
+        Order.objects.filter(pk__in=[pk for ids in orders.values() for pk in ids]).update(
+            status=Case(*(When(pk__in=ids, then=Value(status)) for status, ids in orders.items())),
+            updated_at=timezone.now(),
+        )
+
+
+class OrderItemBulkStatusSerializer(serializers.Serializer):
+    # Items only move forward (or to cancelled), and never in a delivered or cancelled order, so
+    # roll_up_order_status never has to walk an order back
+    PROGRESSION = ['pending', 'shipped', 'delivered']
+
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=BULK_STATUS_LIMIT)
+    status = serializers.ChoiceField(choices=OrderItem.STATUS_CHOICES)
+
+    def validate(self, attrs):
+        # The rules of OrderStatusUpdateSerializer plus no moves backward, checked for every item in one query.
+        # Locked, so the view must run validation and save in one transaction
+        user = self.context['request'].user
+        items = OrderItem.objects.select_for_update().select_related('order', 'product').filter(pk__in=set(attrs['ids']))
+        if user.role == 'seller':
+            items = items.filter(product__seller=user)
+        items = list(items.order_by('pk'))
+
+        missing = set(attrs['ids']) - {item.pk for item in items}
+        if missing:
+            raise serializers.ValidationError({'ids': [f"Order items not found: {', '.join(map(str, sorted(missing)))}."]})
+        stuck = defaultdict(list)
+        for item in items:
+            if item.status == attrs['status']:
+                continue
+            if item.status in OrderStatusUpdateSerializer.FINAL_STATUSES:
+                stuck[f"Cannot change status from '{item.status}'"].append(item.pk)
+            elif item.order.status in OrderStatusUpdateSerializer.FINAL_STATUSES:
+                stuck[f"Cannot change items of a {item.order.status} order"].append(item.pk)
+            elif (attrs['status'] in self.PROGRESSION
+                  and self.PROGRESSION.index(attrs['status']) < self.PROGRESSION.index(item.status)):
+                stuck[f"Cannot move status back from '{item.status}'"].append(item.pk)
+        if stuck:
+            raise serializers.ValidationError({'ids': [
+                f"{message}: {', '.join(map(str, ids))}." for message, ids in stuck.items()
+            ]})
+        attrs['items'] = [item for item in items if item.status != attrs['status']]
+        return attrs
+
+    def create(self, validated_data):
+        items, status = validated_data['items'], validated_data['status']
+        if not items:
+            return 0
+        OrderItem.objects.filter(pk__in=[item.pk for item in items]).update(status=status)
+        if status == 'cancelled':
+            items_cancelled(items)
+        roll_up_order_status({item.order_id for item in items})
+        return len(items)
+
+
 
-class SalesHistorySerializer(serializers.ModelSerializer):
+class SalesHistorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     order_id = serializers.IntegerField(source='order.id')
     product_name = serializers.CharField(source='product.name')
     quantity = serializers.IntegerField()
@@ -210,3 +337,11 @@ class SalesHistorySerializer(serializers.ModelSerializer):
         fields = ['order_id', 'product_name', 'quantity', 'price', 'status']
 
 
+class SalesAnalyticsSerializer(TimedRepresentationMixin, serializers.Serializer):
+    # One row of Core.analytics.sales_summary
+    period = serializers.DateField(allow_null=True)
+    id = serializers.IntegerField(allow_null=True)
+    name = serializers.CharField(allow_null=True)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units = serializers.IntegerField()
+    orders = serializers.IntegerField()
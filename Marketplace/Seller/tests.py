@@ -1,3 +1,312 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from Core.analytics import sales_summary
+from Core.models import Order, OrderItem, Product
+from Core.search import search_products
+from Core.testing import QueryBudgetTestCase
+
+
+class SellerEndpointBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.seller = self.data['sellers'][0]
+        self.admin = self.data['admin']
+        self.product = self.seller.products.order_by('pk').first()
+
+    def orders_by_size(self, seller=None, **filters):
+        # The seller's smallest and largest orders, counting only the items they can see
+        visible = Q(items__product__seller=seller) if seller else Q()
+        orders = Order.objects.filter(**filters).annotate(size=Count('items', filter=visible)).filter(size__gt=0).order_by('size', 'pk')
+        return orders.first(), orders.last()
+
+    def test_product_list(self):
+        self.assertQueryBudget(1, '/api/seller/products/?page_size=5', '/api/seller/products/?page_size=100')
+
+    def test_product_detail(self):
+        self.assertQueryBudget(1, f'/api/seller/products/{self.product.pk}/')
+
+    def test_product_create(self):
+        payloads = [
+            {'name': 'Budget lamp', 'description': 'Desk lamp', 'price': '12.00', 'stock_quantity': 5,
+             'category_id': self.product.category_id},
+            # Same name, category and seller: restocks the existing product instead
+            {'name': self.product.name, 'description': self.product.description, 'price': '15.00',
+             'stock_quantity': 5, 'category_id': self.product.category_id},
+        ]
+        for payload in payloads:
+            self.assertRequestBudget(12, 'post', [('/api/seller/products/', payload)], user=self.seller, status=201)
+
+    def test_product_update(self):
+        url = f'/api/seller/products/{self.product.pk}/update/'
+        self.assertRequestBudget(8, 'patch', [(url, {'price': '19.99'})], user=self.seller)
+        # A stock change also writes an inventory log entry
+        self.assertRequestBudget(9, 'patch', [(url, {'stock_quantity': self.product.stock_quantity + 7})],
+                                 user=self.seller)
+
+    def test_product_delete(self):
+        # Deleting only flags the product; its order items, logs and index rows wait for purge_deleted_products
+        self.assertRequestBudget(3, 'delete', [(f'/api/seller/products/{self.product.pk}/delete/', None)],
+                                 user=self.seller)
+
+    def test_inventory(self):
+        self.assertQueryBudget(
+            1, '/api/seller/inventory/?page_size=5', '/api/seller/inventory/?page_size=100&sort_by=-stock_quantity',
+            user=self.seller,
+        )
+
+    def test_order_list(self):
+        for user in (self.seller, self.admin):
+            self.assertQueryBudget(3, '/api/seller/orders/?page_size=5', '/api/seller/orders/?page_size=100', user=user)
+
+    def test_order_detail_whatever_the_order_size(self):
+        for user, seller in ((self.seller, self.seller), (self.admin, None)):
+            smallest, largest = self.orders_by_size(seller)
+            self.assertQueryBudget(4, f'/api/seller/orders/{smallest.pk}/', f'/api/seller/orders/{largest.pk}/', user=user)
+
+    def test_sales_history(self):
+        self.assertQueryBudget(1, '/api/seller/sales-history/?page_size=5', '/api/seller/sales-history/?page_size=100',
+                               user=self.seller)
+
+    def test_order_status_update(self):
+        # Delivered and cancelled orders cannot change
+        smallest, largest = self.orders_by_size(status__in=['pending', 'processing', 'shipped'])
+        # The locking read and the update, inside a savepoint
+        self.assertRequestBudget(4, 'patch', [
+            (f'/api/seller/orders/{smallest.pk}/status/', {'status': 'shipped'}),
+            (f'/api/seller/orders/{largest.pk}/status/', {'status': 'shipped'}),
+        ], user=self.admin)
+
+    def test_sales_analytics(self):
+        for by in ('total', 'category', 'product'):
+            budget = 1 if by == 'total' else 2
+            urls = [f'/api/seller/analytics/?by={by}&interval={interval}' for interval in ('', 'day', 'week', 'month')]
+            self.assertQueryBudget(budget, *urls, user=self.seller)
+            self.assertQueryBudget(budget, *urls, user=self.admin)
+
+
+class SellerExportTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.seller = self.data['sellers'][0]
+        self.admin = self.data['admin']
+
+    def export(self, url, user):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('get', url, user)
+            body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200, body[:300])
+        return body, len(queries)
+
+    def test_sales_history_csv_has_every_matching_item(self):
+        items = OrderItem.objects.filter(product__seller=self.seller)
+        body, _ = self.export('/api/seller/sales-history/export/', self.seller)
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), items.count())
+        self.assertEqual(list(rows[0]), ['order_id', 'product_name', 'quantity', 'price', 'status'])
+
+        product = items.first().product
+        body, _ = self.export(f'/api/seller/sales-history/export/?product_id={product.pk}', self.seller)
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), items.filter(product=product).count())
+        self.assertEqual({row['product_name'] for row in rows}, {product.name})
+
+    def test_orders_ndjson_matches_the_order_list(self):
+        body, _ = self.export('/api/seller/orders/export/?output=ndjson&status=delivered', self.admin)
+        rows = [json.loads(line) for line in body.splitlines()]
+        expected = list(Order.objects.filter(status='delivered').order_by('-order_date', '-pk').values_list('pk', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertTrue(all(row['items'] for row in rows))
+
+    def test_queries_grow_with_batches_not_rows(self):
+        counts = {}
+        for batch_size in (5, 1000):
+            with mock.patch('Core.exports.EXPORT_BATCH_SIZE', batch_size):
+                body, counts[batch_size] = self.export('/api/seller/orders/export/', self.admin)
+        orders = Order.objects.count()
+        batches = -(-orders // 5)
+        # Orders, their items and the items' products: three queries a batch
+        self.assertLessEqual(counts[5], counts[1000] + 3 * (batches - 1))
+        self.assertEqual(len(body.splitlines()), orders + 1)
+
+    def test_unknown_output_is_rejected(self):
+        response = self.request('get', '/api/seller/orders/export/?output=xml', self.admin)
+        self.assertEqual(response.status_code, 400)
+
+
+class SellerImportTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.seller = self.data['sellers'][0]
+        self.product = self.seller.products.order_by('pk').first()
+
+    def post(self, body, content_type='text/csv'):
+        api = APIClient()
+        api.force_authenticate(self.seller)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = api.post('/api/seller/products/import/', body, content_type=content_type)
+        self.assertEqual(response.status_code, 200, response.content[:300])
+        return response.json(), len(queries)
+
+    def csv(self, rows):
+        output = io.StringIO()
+        writer = csv.DictWriter(output, ['name', 'description', 'price', 'stock_quantity', 'category_id', 'category'])
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def test_rows_are_created_updated_or_reported(self):
+        category = self.product.category
+        stock = self.product.available_stock
+        report, _ = self.post(self.csv([
+            {'name': 'Imported lamp', 'description': 'Desk lamp', 'price': '12.50', 'stock_quantity': 4,
+             'category': category.name.upper()},
+            {'name': self.product.name.lower(), 'description': 'Relisted', 'price': '9.00',
+             'stock_quantity': stock + 3, 'category_id': category.pk},
+            {'name': 'Free money', 'price': '-1', 'stock_quantity': 1, 'category_id': category.pk},
+            {'name': 'Nowhere', 'price': '1', 'stock_quantity': 1, 'category': 'No such category'},
+        ]))
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 1, 2))
+        created, updated, negative, unknown = report['rows']
+        self.assertEqual(updated, {'row': 2, 'status': 'updated', 'id': self.product.pk})
+        self.assertEqual(list(negative['errors']), ['price'])
+        self.assertEqual(unknown['errors'], {'category': ["Category does not exist."]})
+
+        lamp = Product.objects.get(pk=created['id'])
+        self.assertEqual((lamp.seller, lamp.category, lamp.stock_quantity), (self.seller, category, 4))
+        self.assertEqual(list(lamp.inventory_logs.values_list('quantity_change', 'reason')), [(4, 'restock')])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.description, self.product.available_stock), ('Relisted', stock + 3))
+        self.assertEqual(self.product.inventory_logs.filter(reason='manual').get().quantity_change, 3)
+        self.assertIn(lamp, search_products('lamp'))
+
+    def test_ndjson_restores_deleted_products_and_reports_bad_lines(self):
+        self.product.soft_delete()
+        body = '\n'.join([
+            json.dumps({'name': self.product.name, 'price': '5.00', 'stock_quantity': 2,
+                        'category_id': self.product.category_id}),
+            '{not json',
+            '',
+        ])
+        report, _ = self.post(body, 'application/x-ndjson')
+        self.assertEqual([row['status'] for row in report['rows']], ['updated', 'error'])
+        self.assertEqual(report['rows'][1]['row'], 2)
+        self.assertTrue(Product.objects.filter(pk=self.product.pk, stock_quantity=2).exists())
+
+    def test_queries_grow_with_batches_not_rows(self):
+        category = self.product.category_id
+        counts = {}
+        for size in (5, 50):
+            rows = [{'name': f'Bulk {size} {i}', 'price': '3.00', 'stock_quantity': i, 'category_id': category}
+                    for i in range(size)]
+            # Half the rows update what the first half created
+            report, counts[size] = self.post(self.csv(rows + rows[::2]))
+            self.assertEqual((report['created'], report['updated']), (size, len(rows[::2])))
+        self.assertEqual(counts[5], counts[50])
+        self.assertLessEqual(counts[50], 17)
+        with mock.patch('Core.imports.IMPORT_BATCH_SIZE', 10):
+            _, batched = self.post(self.csv(rows))
+        self.assertGreater(batched, counts[50])
+
+    def test_other_formats_are_rejected(self):
+        api = APIClient()
+        api.force_authenticate(self.seller)
+        response = api.post('/api/seller/products/import/', [{'name': 'x'}], format='json')
+        self.assertEqual(response.status_code, 415)
+
+
+class OrderItemStatusBulkUpdateTests(QueryBudgetTestCase):
+    url = '/api/seller/order-items/status/'
+
+    def setUp(self):
+        self.seller = self.data['sellers'][0]
+        self.admin = self.data['admin']
+
+    def open_items(self, seller=None):
+        items = OrderItem.objects.filter(status='pending').exclude(order__status='cancelled').order_by('pk')
+        return items.filter(product__seller=seller) if seller else items
+
+    def move(self, ids, status, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api.patch(self.url, {'ids': ids, 'status': status}, format='json')
+
+    def rollups(self):
+        return {by: sales_summary(dimension=by) for by in ('total', 'category', 'product')}
+
+    def test_queries_do_not_grow_with_the_items(self):
+        ids = list(self.open_items(self.seller).values_list('pk', flat=True))
+        self.assertGreater(len(ids), 5)
+        # Cancelling also takes the items out of the sales rollups
+        for status, budget in (('shipped', 6), ('cancelled', 9)):
+            self.assertRequestBudget(budget, 'patch', [(self.url, {'ids': ids[:1], 'status': status}),
+                                                       (self.url, {'ids': ids, 'status': status})], user=self.seller)
+
+    def test_orders_follow_their_items(self):
+        order = Order.objects.annotate(size=Count('items')).filter(size__gte=3, status='pending').first()
+        first, second, *rest = order.items.order_by('pk').values_list('pk', flat=True)
+        self.assertEqual(self.move([first], 'shipped', self.admin).json(), {'updated': 1})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'processing')
+        self.move([first, second, *rest], 'shipped', self.admin)
+        self.move([second], 'cancelled', self.admin)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'shipped')
+        self.move([first, *rest], 'delivered', self.admin)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'delivered')
+
+    def test_cancelled_items_leave_the_rollups_as_a_rebuild_would(self):
+        ids = list(self.open_items().values_list('pk', flat=True)[::3])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.move(ids, 'cancelled', self.admin)
+        self.assertEqual(response.json(), {'updated': len(ids)})
+        # Whole orders cancelled as a result count once, not twice
+        self.assertTrue(Order.objects.filter(status='cancelled', items__pk__in=ids).exists())
+        moved = self.rollups()
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(moved, self.rollups())
+
+    def test_nothing_moves_unless_every_item_can(self):
+        delivered = OrderItem.objects.filter(status='delivered', product__seller=self.seller).first()
+        pending = self.open_items(self.seller).first()
+        response = self.move([pending.pk, delivered.pk], 'shipped', self.seller)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['ids'], [f"Cannot change status from 'delivered': {delivered.pk}."])
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'pending')
+
+        other = self.open_items().exclude(product__seller=self.seller).first()
+        response = self.move([pending.pk, other.pk], 'shipped', self.seller)
+        self.assertEqual(response.json()['ids'], [f"Order items not found: {other.pk}."])
+        self.assertEqual(self.move([pending.pk], 'lost', self.seller).status_code, 400)
+
+    def test_items_of_a_delivered_order_stay_put(self):
+        order = Order.objects.filter(status='pending', items__status='pending').first()
+        api = APIClient()
+        api.force_authenticate(self.admin)
+        self.assertEqual(api.patch(f'/api/seller/orders/{order.pk}/status/', {'status': 'delivered'},
+                                   format='json').status_code, 200)
+        item = order.items.filter(status='pending').first()
+        response = self.move([item.pk], 'shipped', self.admin)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['ids'], [f"Cannot change items of a delivered order: {item.pk}."])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'delivered')
+
+    def test_items_do_not_move_back(self):
+        order = Order.objects.annotate(size=Count('items')).filter(size__gte=2, status='pending').first()
+        ids = list(order.items.values_list('pk', flat=True))
+        self.move(ids, 'shipped', self.admin)
+        response = self.move(ids, 'pending', self.admin)
+        self.assertEqual(response.status_code, 400)
+        moved = ', '.join(map(str, sorted(ids)))
+        self.assertEqual(response.json()['ids'], [f"Cannot move status back from 'shipped': {moved}."])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'shipped')
+        self.assertFalse(order.items.filter(status='pending').exists())
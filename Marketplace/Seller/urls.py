@@ -1,11 +1,14 @@
 from django.urls import path
 from .views import ProductListCreateView, ProductDetailView, ProductUpdateView, ProductDeleteView, SellerInventoryView
-from .views import  SellerOrderListView, SellerOrderDetailView, SalesHistoryView, OrderStatusUpdateView
+from .views import ProductImportView
+from .views import  SellerOrderListView, SellerOrderDetailView, SalesHistoryView, OrderStatusUpdateView, SalesAnalyticsView
+from .views import SalesHistoryExportView, SellerOrderExportView, OrderItemStatusBulkUpdateView
 
 app_name = 'Seller'
 
 urlpatterns = [
     path('products/', ProductListCreateView.as_view(), name='product_list_create'),
+    path('products/import/', ProductImportView.as_view(), name='product_import'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
     path('products/<int:pk>/update/', ProductUpdateView.as_view(), name='product_update'),
     path('products/<int:pk>/delete/', ProductDeleteView.as_view(), name='product_delete'),
@@ -13,10 +16,14 @@ urlpatterns = [
 
     
     path('orders/', SellerOrderListView.as_view(), name='seller-order-list'),
+    path('orders/export/', SellerOrderExportView.as_view(), name='seller-order-export'),
 
     path('orders/<int:pk>/', SellerOrderDetailView.as_view(), name='seller-order-detail'),
     path('sales-history/', SalesHistoryView.as_view(), name='sales-history'),
+    path('sales-history/export/', SalesHistoryExportView.as_view(), name='sales-history-export'),
+    path('analytics/', SalesAnalyticsView.as_view(), name='sales-analytics'),
     path('orders/<int:pk>/status/', OrderStatusUpdateView.as_view(), name='order-status-update'),
+    path('order-items/status/', OrderItemStatusBulkUpdateView.as_view(), name='order-item-status-bulk-update'),
 
 
 ]
\ No newline at end of file
@@ -1,25 +1,32 @@
+from collections import Counter
+from datetime import date
+
 from rest_framework import generics, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from Core.permissions import IsAdminOrSeller
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from Core.permissions import IsAdmin, IsSeller, IsProductOwnerOrAdmin, IsAdminOrSeller, IsAdminCustomerOrSellerForOrder, IsAdminOrSellerForOrderStatus
-from Core.models import Product, Order, OrderItem
-from .serializers import ProductListSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer, OrderDetailSerializer, SellerOrderDetailSerializer, SalesHistorySerializer, OrderStatusUpdateSerializer
-from rest_framework.pagination import PageNumberPagination
+from Core.models import Product, Order, OrderItem, SellerProfile
+from .serializers import ProductListSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer, OrderDetailSerializer, SellerOrderDetailSerializer, SalesHistorySerializer, OrderStatusUpdateSerializer, SalesAnalyticsSerializer
+from .serializers import OrderItemBulkStatusSerializer
+from Core.pagination import KeysetPagination
+from Core.analytics import DIMENSIONS, INTERVALS, order_status_changed, sales_summary
+from Core.catalog_cache import CatalogCacheMixin
+from Core.exports import StreamingExportMixin
+from Core.fieldsets import SparseFieldsetViewMixin, sparse_queryset
+from Core.imports import CSVRowsParser, NDJSONRowsParser, import_products
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
+from django.db import transaction
+from django.db.models import DecimalField, Exists, F, OuterRef, Prefetch, Subquery, Sum
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-class ProductListCreateView(generics.ListCreateAPIView):
-    queryset = Product.objects.select_related('seller', 'category').order_by('id')
+class ProductListCreateView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListCreateAPIView):
+    queryset = Product.objects.select_related('seller', 'category').with_stock().order_by('id')
     serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['category']
 
@@ -28,16 +35,29 @@ class ProductListCreateView(generics.ListCreateAPIView):
             return [IsAuthenticated(), IsAdminOrSeller()]
         return [AllowAny()]
 
+    @property
+    def throttle_scope(self):
+        # Listing shares the catalog's browse budget; creating products keeps the anon and user budgets
+        return None if self.request.method == 'POST' else 'browse'
+
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return ProductCreateUpdateSerializer
         return ProductListSerializer
 
+    def get_cache_scopes(self):
+        category = self.request.query_params.get('category')
+        return [f'category:{category}'] if category else ['all']
 
-class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.select_related('seller', 'category')
+
+class ProductDetailView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.RetrieveAPIView):
+    queryset = Product.objects.select_related('seller', 'category').with_stock()
     serializer_class = ProductDetailSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'browse'
+
+    def get_cache_scopes(self):
+        return [f"product:{self.kwargs['pk']}"]
 
 class ProductUpdateView(generics.UpdateAPIView):
     queryset = Product.objects.select_related('seller', 'category')
@@ -55,36 +75,36 @@ class ProductDeleteView(generics.DestroyAPIView):
         self.perform_destroy(instance)
         return Response({"message": "Product is deleted"}, status=status.HTTP_200_OK)
 
-class SellerInventoryView(generics.ListAPIView):
-    serializer_class = ProductListSerializer
+    def perform_destroy(self, instance):
+        # Dependent rows are deleted later in small batches by purge_deleted_products
+        instance.soft_delete()
+
+class ProductImportView(APIView):
+    """
+    Create or update many of the user's products at once from a CSV (text/csv,
+    with a header row) or NDJSON (application/x-ndjson) body. Each row has
+    name, description, price, stock_quantity and category_id or a category
+    name; the response reports each row's outcome.
+    """
     permission_classes = [IsAuthenticated, IsAdminOrSeller]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['category']
-
-    def get_queryset(self):
-        user = self.request.user
-        if user.role not in ['admin', 'seller']:
-            return Product.objects.none()
-        queryset = Product.objects.select_related('seller', 'category').filter(seller=user)
-        
-        # Optional sorting
-        sort_by = self.request.query_params.get('sort_by', 'name')
-        if sort_by in ['name', 'price', 'stock_quantity', '-name', '-price', '-stock_quantity']:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('name')
-        
-        return queryset
-
-
-
-
-
-class SellerInventoryView(generics.ListAPIView):
+    parser_classes = [CSVRowsParser, NDJSONRowsParser]
+
+    def post(self, request):
+        if request.user.role == 'seller' and not SellerProfile.objects.filter(user=request.user).exists():
+            raise ValidationError("Seller profile is required to create/update products.")
+        results = list(import_products(request.data, request.user))
+        counts = Counter(result['status'] for result in results)
+        return Response({
+            'created': counts['created'],
+            'updated': counts['updated'],
+            'failed': counts['error'],
+            'rows': results,
+        })
+
+class SellerInventoryView(CatalogCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [IsAuthenticated, IsAdminOrSeller]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['category']
 
@@ -93,54 +113,88 @@ class SellerInventoryView(generics.ListAPIView):
         if user.role not in ['admin', 'seller']:
             return Product.objects.none()
 
-        queryset = Product.objects.select_related('seller', 'category').filter(seller=user)
+        # total_stock sums the counters of products with sharded stock
+        queryset = Product.objects.select_related('seller', 'category').filter(seller=user).with_stock()
 
         sort_by = self.request.query_params.get('sort_by', 'name')
         valid_sort_fields = ['name', 'price', 'stock_quantity', '-name', '-price', '-stock_quantity']
         if sort_by in valid_sort_fields:
-            queryset = queryset.order_by(sort_by)
+            queryset = queryset.order_by(sort_by.replace('stock_quantity', 'total_stock'))
         else:
             queryset = queryset.order_by('name')
 
         return queryset
 
+    def get_cache_scopes(self):
+        return [f'seller:{self.request.user.pk}']
+
+
+def with_seller_items(queryset, seller, serializer=None):
+    """
+    Prefetch the order items a seller may see into ``seller_items`` and, for
+    sellers, annotate their share of each order as ``seller_total`` in SQL, so
+    SellerOrderDetailSerializer needs no per-order queries. Items and products
+    a sparse ``serializer`` will not render are not fetched.
+    """
+    items = OrderItem.objects.all()
+    if seller is not None:
+        items = items.filter(product__seller=seller)
+        seller_total = OrderItem.objects.filter(order=OuterRef('pk'), product__seller=seller).values('order').annotate(
+            total=Sum(F('quantity') * F('price'))
+        ).values('total')
+        queryset = queryset.annotate(
+            seller_total=Subquery(seller_total, output_field=DecimalField(max_digits=12, decimal_places=2))
+        )
+    queryset = queryset.select_related('customer')
+    if serializer is not None and 'items' not in serializer.fields:
+        return queryset
+    queryset = queryset.prefetch_related(Prefetch('items', queryset=items, to_attr='seller_items'))
+    products = Product.all_objects.select_related('seller', 'category').with_stock()
+    if serializer is not None:
+        item_serializer = serializer.get_item_serializer().child
+        if not item_serializer.expands('product'):
+            return queryset
+        products = sparse_queryset(products, item_serializer.fields['product'])
+    return queryset.prefetch_related(Prefetch('seller_items__product', queryset=products))
 
-class SellerOrderListView(generics.ListAPIView):
+
+class SellerOrderListView(SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = SellerOrderDetailSerializer
     permission_classes = [IsAuthenticated, IsAdminOrSeller]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'is_paid']
 
     def get_queryset(self):
         user = self.request.user
-
-        if user.role == 'admin':
-            queryset = Order.objects.all()
-        elif user.role == 'seller':
-            # Sellers should only see orders containing their products
-            queryset = Order.objects.filter(items__product__seller=user).distinct()
-        else:
+        if user.role not in ['admin', 'seller']:
             return Order.objects.none()
 
-        queryset = queryset.select_related('customer').prefetch_related('items__product__category')
-
-        # Optional filters
+        # Optional filters, matched against a single item so no join fans the orders out
+        item_filters = {}
+        if user.role == 'seller':
+            # Sellers should only see orders containing their products
+            item_filters['product__seller'] = user
         category_id = self.request.query_params.get('category_id')
         product_id = self.request.query_params.get('product_id')
         start_date = self.request.query_params.get('start_date')
         end_date = self.request.query_params.get('end_date')
 
         if category_id:
-            queryset = queryset.filter(items__product__category_id=category_id)
+            item_filters['product__category_id'] = category_id
         if product_id:
-            queryset = queryset.filter(items__product_id=product_id)
+            item_filters['product_id'] = product_id
+
+        queryset = Order.objects.all()
+        if item_filters:
+            queryset = queryset.filter(Exists(OrderItem.objects.filter(order=OuterRef('pk'), **item_filters)))
         if start_date:
             queryset = queryset.filter(order_date__gte=start_date)
         if end_date:
             queryset = queryset.filter(order_date__lte=end_date)
 
-        return queryset.order_by('-order_date')
+        seller = user if user.role == 'seller' else None
+        return with_seller_items(queryset, seller, self.get_serializer()).order_by('-order_date')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -148,7 +202,7 @@ class SellerOrderListView(generics.ListAPIView):
         return context
 
 
-class SellerOrderDetailView(generics.RetrieveAPIView):
+class SellerOrderDetailView(SparseFieldsetViewMixin, generics.RetrieveAPIView):
     serializer_class = SellerOrderDetailSerializer
     permission_classes = [IsAuthenticated, IsAdminCustomerOrSellerForOrder]
     lookup_url_kwarg = 'pk'
@@ -156,9 +210,12 @@ class SellerOrderDetailView(generics.RetrieveAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.role == 'admin':
-            return Order.objects.select_related('customer').prefetch_related('items__product__category')
+            return with_seller_items(Order.objects.all(), None, self.get_serializer())
         elif user.role == 'seller':
-            return Order.objects.filter(items__product__seller=user).select_related('customer').prefetch_related('items__product__category')
+            queryset = Order.objects.filter(
+                Exists(OrderItem.objects.filter(order=OuterRef('pk'), product__seller=user))
+            )
+            return with_seller_items(queryset, user, self.get_serializer())
         return Order.objects.none()
 
     def get_serializer_context(self):
@@ -169,25 +226,50 @@ class SellerOrderDetailView(generics.RetrieveAPIView):
 
 
 class OrderStatusUpdateView(APIView):
-    permission_classes = [IsAdminOrSellerForOrderStatus]
+    permission_classes = [IsAuthenticated, IsAdminOrSellerForOrderStatus]
 
     def patch(self, request, pk):
-        try:
-            order = Order.objects.get(pk=pk)
-        except Order.DoesNotExist:
-            return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Assuming 'status' is the field you want to update
-        order.status = request.data.get("status", order.status)
-        order.save()
+        # Locked from the status check to the rollup update, so two changes of one order cannot both count
+        with transaction.atomic():
+            try:
+                order = Order.objects.select_for_update().get(pk=pk)
+            except Order.DoesNotExist:
+                return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+            self.check_object_permissions(request, order)
+
+            serializer = OrderStatusUpdateSerializer(order, data=request.data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            previous_status = order.status
+            serializer.save()
+            order_status_changed(order, previous_status)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class OrderItemStatusBulkUpdateView(generics.GenericAPIView):
+    """
+    Move up to BULK_STATUS_LIMIT order items to one status at once, e.g.
+    {"ids": [...], "status": "shipped"}, then update their orders' status to
+    match. Items move forward (pending, shipped, delivered) or to cancelled.
+    Sellers may only move their own products' items. All or nothing: if one
+    item cannot move, none do.
+    """
+    serializer_class = OrderItemBulkStatusSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrSeller]
 
-        return Response(OrderStatusUpdateSerializer(order).data, status=status.HTTP_200_OK)
+    def patch(self, request):
+        serializer = self.get_serializer(data=request.data)
+        # The items stay locked from validation until their new status is written
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            updated = serializer.save()
+        return Response({'updated': updated})
 
 
-class SalesHistoryView(generics.ListAPIView):
+class SalesHistoryView(SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = SalesHistorySerializer
     permission_classes = [IsAuthenticated, IsAdminOrSeller]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
 
     def get_queryset(self):
@@ -216,4 +298,46 @@ class SalesHistoryView(generics.ListAPIView):
         return queryset.order_by('-order__order_date')
 
 
+class SalesHistoryExportView(StreamingExportMixin, SalesHistoryView):
+    export_filename = 'sales-history'
+
+
+class SellerOrderExportView(StreamingExportMixin, SellerOrderListView):
+    export_filename = 'orders'
+
+
+class SalesAnalyticsView(APIView):
+    """
+    Revenue, units and order counts from the sales rollups, grouped with
+    ?by=total|category|product and ?interval=day|week|month, optionally
+    between ?start_date and ?end_date. Admins see every seller, or one with
+    ?seller_id.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrSeller]
 
+    def get(self, request):
+        params = request.query_params
+        dimension = params.get('by', 'total')
+        interval = params.get('interval') or None
+        if dimension not in DIMENSIONS:
+            raise ValidationError({'by': [f"Choose from: {', '.join(DIMENSIONS)}."]})
+        if interval is not None and interval not in INTERVALS:
+            raise ValidationError({'interval': [f"Choose from: {', '.join(INTERVALS)}."]})
+        dates = {}
+        for name in ('start_date', 'end_date'):
+            try:
+                dates[name] = date.fromisoformat(params[name]) if params.get(name) else None
+            except ValueError:
+                raise ValidationError({name: ["Enter a date as YYYY-MM-DD."]})
+
+        seller = request.user
+        if request.user.role == 'admin':
+            seller = params.get('seller_id') or None
+            if seller is not None and not seller.isdigit():
+                raise ValidationError({'seller_id': ["Enter a seller id."]})
+        rows = sales_summary(seller, dimension, interval, dates['start_date'], dates['end_date'])
+        return Response({
+            'by': dimension,
+            'interval': interval,
+            'results': SalesAnalyticsSerializer(rows, many=True).data,
+        })